@@ -16,6 +16,7 @@ To read well the Dll of the Alazar9870, Visual C++ Studio is needed.
 """
 import os
 import time
+import logging
 import math
 import numpy as np
 import ctypes
@@ -24,66 +25,11 @@ from inspect import cleandoc
 from pyclibrary import CLibrary
 
 from ..dll_tools import DllInstrument
+from .alazar_tools import (DMABufferPool, DemodTableCache, DemodAccumulator,
+                           TraceAccumulator, BufferPipeline)
 
-class DMABuffer:
-    '''Buffer suitable for DMA transfers.
-
-    AlazarTech digitizers use direct memory access (DMA) to transfer
-    data from digitizers to the computer's main memory. This class
-    abstracts a memory buffer on the host, and ensures that all the
-    requirements for DMA transfers are met.
-
-    DMABuffers export a 'buffer' member, which is a NumPy array view
-    of the underlying memory buffer
-
-    Args:
-
-      bytes_per_sample (int): The number of bytes per samples of the
-      data. This varies with digitizer models and configurations.
-
-      size_bytes (int): The size of the buffer to allocate, in bytes.
-
-    '''
-    def __init__(self, bytes_per_sample, size_bytes):
-        self.size_bytes = size_bytes
-        ctypes.cSampleType = ctypes.c_uint8
-        npSampleType = np.uint8
-        if bytes_per_sample > 1:
-            ctypes.cSampleType = ctypes.c_uint16
-            npSampleType = np.uint16
-
-        self.addr = None
-        if os.name == 'nt':
-            MEM_COMMIT = 0x1000
-            PAGE_READWRITE = 0x4
-            ctypes.windll.kernel32.VirtualAlloc.argtypes = [ctypes.c_void_p, ctypes.c_long,
-                                                     ctypes.c_long, ctypes.c_long]
-            ctypes.windll.kernel32.VirtualAlloc.restype = ctypes.c_void_p
-            self.addr = ctypes.windll.kernel32.VirtualAlloc(
-                0, ctypes.c_long(size_bytes), MEM_COMMIT, PAGE_READWRITE)
-        elif os.name == 'posix':
-            ctypes.libc.valloc.argtypes = [ctypes.c_long]
-            ctypes.libc.valloc.restype = ctypes.c_void_p
-            self.addr = ctypes.libc.valloc(size_bytes)
-        else:
-            raise Exception("Unsupported OS")
-
-        ctypes.ctypes_array = (ctypes.cSampleType *
-                        (size_bytes // bytes_per_sample)
-                        ).from_address(self.addr)
-        self.buffer = np.frombuffer(ctypes.ctypes_array, dtype=npSampleType)
-        pointer, read_only_flag = self.buffer.__array_interface__['data']
-
-    def __exit__(self):
-        if os.name == 'nt':
-            MEM_RELEASE = 0x8000
-            ctypes.windll.kernel32.VirtualFree.argtypes = [ctypes.c_void_p, ctypes.c_long, ctypes.c_long]
-            ctypes.windll.kernel32.VirtualFree.restype = ctypes.c_int
-            ctypes.windll.kernel32.VirtualFree(ctypes.c_void_p(self.addr), 0, MEM_RELEASE)
-        elif os.name == 'posix':
-            ctypes.libc.free(self.addr)
-        else:
-            raise Exception("Unsupported OS")
+#: Number of threads processing the buffers during a demodulation.
+PROCESSING_WORKERS = 2
 
 
 class Alazar987x(DllInstrument):
@@ -96,12 +42,26 @@ class Alazar987x(DllInstrument):
         super(Alazar987x, self).__init__(connection_info, caching_allowed,
                                          caching_permissions, auto_open)
 
+        self._dll = self._load_library()
+        # DMA buffers kept from one acquisition to the next. They are released
+        # by close_connection, trim_buffers or once the default memory budget
+        # of the pool is exceeded.
+        self._buffer_pool = DMABufferPool()
+        # Demodulation tables reused from one acquisition to the next.
+        self._demod_tables = DemodTableCache()
+        # Number of buffers processed too late during the last demodulation.
+        self.late_buffers = 0
+
+    def _load_library(self):
+        """Load the ATS library used to control the board.
+
+        """
         cache_path = unicode(os.path.join(os.path.dirname(__file__),
                                           'cache/Alazar.pycctypes.libc'))
-        self._dll = CLibrary('ATSApi.dll',
-                             ['AlazarError.h', 'AlazarCmd.h', 'AlazarApi.h'],
-                             cache=cache_path, prefix=['Alazar'],
-                             convention='windll')
+        return CLibrary('ATSApi.dll',
+                        ['AlazarError.h', 'AlazarCmd.h', 'AlazarApi.h'],
+                        cache=cache_path, prefix=['Alazar'],
+                        convention='windll')
 
     def open_connection(self):
         """Do not need to open a connection
@@ -110,10 +70,31 @@ class Alazar987x(DllInstrument):
         pass
 
     def close_connection(self):
-        """Do not need to close a connection
+        """Release the DMA buffers, no connection needs to be closed.
 
         """
-        pass
+        self._buffer_pool.trim()
+
+    def trim_buffers(self, max_bytes=0):
+        """Release the DMA buffers kept between acquisitions.
+
+        Parameters
+        ----------
+        max_bytes : int, optional
+            Number of bytes the pool of buffers can keep.
+
+        """
+        self._buffer_pool.trim(max_bytes)
+
+    def _record_buffer_stats(self, pipeline):
+        """Keep the counters of the processing pipeline of an acquisition.
+
+        """
+        self.late_buffers = pipeline.late
+        if pipeline.late:
+            logger = logging.getLogger(__name__)
+            mess = '{} buffers were processed too late'
+            logger.warn(mess.format(pipeline.late))
 
     def configure_board(self,trigRange,trigLevel):
         board = self._dll.GetBoardBySystemID(1,1)()
@@ -253,7 +234,8 @@ class Alazar987x(DllInstrument):
                                  0)
 
     def get_demod(self, startaftertrig, duration, recordsPerCapture,
-                  recordsPerBuffer, timestep, freq, average, NdemodA, NdemodB, NtraceA, NtraceB):
+                  recordsPerBuffer, timestep, freq, average, NdemodA, NdemodB, NtraceA, NtraceB,
+                  dtype='float64'):
 
         board = self._dll.GetBoardBySystemID(1, 1)()
 
@@ -285,9 +267,8 @@ class Alazar987x(DllInstrument):
 
 #        bufferCount = int(round(recordsPerCapture / recordsPerBuffer))
         bufferCount = 4
-        buffers = []
-        for i in range(bufferCount):
-            buffers.append(DMABuffer(bytesPerSample, bytesPerBuffer))
+        buffers = self._buffer_pool.get(bytesPerSample, bytesPerBuffer,
+                                        bufferCount)
 
         # Set the record size
         self._dll.SetRecordSize(board, 0, samplesPerRecord)
@@ -316,106 +297,77 @@ class Alazar987x(DllInstrument):
         start = time.clock()  # Keep track of when acquisition started
         self._dll.StartCapture(board)  # Start the acquisition
 
-        # Preparation of the tables for the demodulation
+        # Prepare the streaming demodulation of the windows
 
         startSample = []
         samplesPerDemod = []
-        samplesPerBlock = []
-        NumberOfBlocks = []
-        samplesMissing = []
-        data = []
-        dataExtended = []
+        lengthDemod = []
+        accumulators = []
 
         for i in range(NdemodA + NdemodB):
             startSample.append( int(samplesPerSec * startaftertrig[i]) )
             samplesPerDemod.append( int(samplesPerSec * duration[i]) )
 
             if timestep[i]:
-                samplesPerBlock.append( samplesPerDemod[i] )
+                samplesPerBlock = samplesPerDemod[i]
+                lengthDemod.append( samplesPerDemod[i]/int(samplesPerSec*timestep[i]) )
             else:
-                # Check wheter it is possible to cut each record in blocks of size equal
-                # to an integer number of periods
-                periodsPerBlock = 1
-                while (periodsPerBlock * samplesPerSec < freq[i] * samplesPerDemod[i]
-                       and periodsPerBlock * samplesPerSec % freq[i]):
-                    periodsPerBlock += 1
-                samplesPerBlock.append( int(np.minimum(periodsPerBlock * samplesPerSec / freq[i],
-                                                      samplesPerDemod[i])) )
-
-            NumberOfBlocks.append( np.divide(samplesPerDemod[i], samplesPerBlock[i]) )
-            samplesMissing.append( (-samplesPerDemod[i]) % samplesPerBlock[i] )
-            # Makes the table that will contain the data
-            data.append( np.empty((recordsPerCapture, samplesPerBlock[i])) )
-            dataExtended.append( np.zeros((recordsPerBuffer, samplesPerDemod[i] + samplesMissing[i]),
-                                          dtype='uint16') )
+                # Cut each record in blocks of size equal to an integer number
+                # of periods if possible
+                samplesPerBlock = self._demod_tables.block_size(samplesPerDemod[i], freq[i],
+                                                                samplesPerSec)
+                lengthDemod.append(1)
+
+            tables = self._demod_tables.tables(freq[i], samplesPerBlock, samplesPerSec,
+                                               startSample[i], dtype)
+            accumulators.append(DemodAccumulator(startSample[i], samplesPerDemod[i],
+                                                 samplesPerBlock, lengthDemod[i], tables,
+                                                 code, channelRange,
+                                                 recordsPerCapture, average, dtype))
 
         for i in (np.arange(NtraceA + NtraceB) + NdemodA + NdemodB):
             startSample.append( int(samplesPerSec * startaftertrig[i]) )
             samplesPerDemod.append( int(samplesPerSec * duration[i]) )
-            data.append( np.empty((recordsPerCapture, samplesPerDemod[i])) )
+            accumulators.append(TraceAccumulator(startSample[i], samplesPerDemod[i],
+                                                 code, channelRange,
+                                                 recordsPerCapture, average, dtype))
 
-        start = time.clock()
-
-        buffersCompleted = 0
-        while buffersCompleted < buffersPerAcquisition:
+        # Channel (0 for A, 1 for B) on which each window is acquired
+        channels = ([0]*NdemodA + [1]*NdemodB + [0]*NtraceA + [1]*NtraceB)
 
-            # Wait for the buffer at the head of the list of available
-            # buffers to be filled by the board.
-            buffer = buffers[buffersCompleted % len(buffers)]
-            self._dll.WaitAsyncBufferComplete(board, buffer.addr, 10000)
-
-
-            # Process data
+        start = time.clock()
 
+        # The buffers are processed in worker threads while the board fills
+        # the next ones.
+        def process(buffer, index):
             dataRaw = np.reshape(buffer.buffer, (recordsPerBuffer*channel_number, -1))
-
-            for i in np.arange(NdemodA):
-                dataExtended[i][:,:samplesPerDemod[i]] = dataRaw[:recordsPerBuffer,startSample[i]:startSample[i]+samplesPerDemod[i]]
-                dataBlock = np.reshape(dataExtended[i],(recordsPerBuffer,-1,samplesPerBlock[i]))
-                data[i][buffersCompleted*recordsPerBuffer:(buffersCompleted+1)*recordsPerBuffer] = np.sum(dataBlock, axis=1)
-
-            for i in (np.arange(NdemodB) + NdemodA):
-                dataExtended[i][:,:samplesPerDemod[i]] = dataRaw[(channel_number-1)*recordsPerBuffer:channel_number*recordsPerBuffer,startSample[i]:startSample[i]+samplesPerDemod[i]]
-                dataBlock = np.reshape(dataExtended[i],(recordsPerBuffer,-1,samplesPerBlock[i]))
-                data[i][buffersCompleted*recordsPerBuffer:(buffersCompleted+1)*recordsPerBuffer] = np.sum(dataBlock, axis=1)
-
-            for i in (np.arange(NtraceA) + NdemodB + NdemodA):
-                data[i][buffersCompleted*recordsPerBuffer:(buffersCompleted+1)*recordsPerBuffer] = dataRaw[:recordsPerBuffer,startSample[i]:startSample[i]+samplesPerDemod[i]]
-
-            for i in (np.arange(NtraceB) + NtraceA + NdemodB + NdemodA):
-                data[i][buffersCompleted*recordsPerBuffer:(buffersCompleted+1)*recordsPerBuffer] = dataRaw[(channel_number-1)*recordsPerBuffer:channel_number*recordsPerBuffer,startSample[i]:startSample[i]+samplesPerDemod[i]]
-
-            buffersCompleted += 1
-
+            dataChannels = (dataRaw[:recordsPerBuffer],
+                            dataRaw[(channel_number-1)*recordsPerBuffer:channel_number*recordsPerBuffer])
+            for channel, accumulator in zip(channels, accumulators):
+                accumulator.add(dataChannels[channel], index*recordsPerBuffer)
+
+        def wait(buffer):
+            # A buffer the board failed to fill aborts the acquisition.
+            retCode = self._dll.WaitAsyncBufferComplete(board, buffer.addr, 10000)()
+            if retCode != self._dll.ApiSuccess:
+                raise ValueError(cleandoc(self._dll.AlazarErrorToText(retCode)))
+
+        def post(buffer):
             self._dll.PostAsyncBuffer(board, buffer.addr, buffer.size_bytes)
 
-        self._dll.AbortAsyncRead(board)
-
-        for i in range(bufferCount):
-            buffer = buffers[i]
-            buffer.__exit__()
+        pipeline = BufferPipeline(process, PROCESSING_WORKERS)
+        try:
+            pipeline.run(buffers, buffersPerAcquisition, wait, post)
+        finally:
+            self._dll.AbortAsyncRead(board)
+        self._record_buffer_stats(pipeline)
 
 #        print time.clock() - start
 #        if time.clock() - start > acquisition_timeout_sec:
 #            raise Exception("Error: Capture timeout. Verify trigger")
 #            time.sleep(10e-3)
 
-        # Normalize the np.sum and convert data into Volts
-        for i in range(NdemodA + NdemodB):
-            normalisation = 1 if samplesMissing[i] else 0
-            data[i][:,:samplesPerBlock[i]-samplesMissing[i]] /= NumberOfBlocks[i] + normalisation
-            data[i][:,samplesPerBlock[i]-samplesMissing[i]:] /= NumberOfBlocks[i]
-            data[i] = (data[i] / code - 1) * channelRange
-        for i in (np.arange(NtraceA + NtraceB) + NdemodA + NdemodB):
-            data[i] = (data[i] / code - 1) * channelRange
-
-        # calculate demodulation tables
-        coses=[]
-        sines=[]
-        for i in range(NdemodA+NdemodB):
-            dem = np.arange(samplesPerBlock[i])
-            coses.append(np.cos(2. * math.pi * dem * freq[i] / samplesPerSec))
-            sines.append(np.sin(2. * math.pi * dem * freq[i] / samplesPerSec))
+        results = [accumulator.result() for accumulator in accumulators]
 
         # prepare the structure of the answered array
 
@@ -424,12 +376,11 @@ class Alazar987x(DllInstrument):
             zerosDemodA = 1 + int(np.floor(np.log10(NdemodA))) if NdemodA else 0
             zerosDemodB = 1 + int(np.floor(np.log10(NdemodB))) if NdemodB else 0
             for i in range(NdemodA):
-                answerTypeDemod += [('AI' + str(i).zfill(zerosDemodA), str(data[0].dtype)),
-                                    ('AQ' + str(i).zfill(zerosDemodA), str(data[0].dtype))]
+                answerTypeDemod += [('AI' + str(i).zfill(zerosDemodA), dtype),
+                                    ('AQ' + str(i).zfill(zerosDemodA), dtype)]
             for i in range(NdemodB):
-                answerTypeDemod += [('BI' + str(i).zfill(zerosDemodB), str(data[0].dtype)),
-                                    ('BQ' + str(i).zfill(zerosDemodB), str(data[0].dtype))]
-            lengthDemod = [(samplesPerDemod[i]/int(samplesPerSec*timestep[i]) if timestep[i] else 1) for i in range(NdemodA+NdemodB)]
+                answerTypeDemod += [('BI' + str(i).zfill(zerosDemodB), dtype),
+                                    ('BQ' + str(i).zfill(zerosDemodB), dtype)]
             biggerDemod = max(lengthDemod)
         else:
             answerTypeDemod = 'f'
@@ -438,8 +389,8 @@ class Alazar987x(DllInstrument):
         if (NtraceA or NtraceB):
             zerosTraceA = 1 + int(np.floor(np.log10(NtraceA))) if NtraceA else 0
             zerosTraceB = 1 + int(np.floor(np.log10(NtraceB))) if NtraceB else 0
-            answerTypeTrace = ( [('A' + str(i).zfill(zerosTraceA), str(data[0].dtype)) for i in range(NtraceA)]
-                              + [('B' + str(i).zfill(zerosTraceB), str(data[0].dtype)) for i in range(NtraceB)] )
+            answerTypeTrace = ( [('A' + str(i).zfill(zerosTraceA), dtype) for i in range(NtraceA)]
+                              + [('B' + str(i).zfill(zerosTraceB), dtype) for i in range(NtraceB)] )
             biggerTrace = np.max(samplesPerDemod[NdemodA+NdemodB:])
         else:
             answerTypeTrace = 'f'
@@ -452,7 +403,7 @@ class Alazar987x(DllInstrument):
             answerDemod = np.zeros((recordsPerCapture, biggerDemod), dtype=answerTypeDemod)
             answerTrace = np.zeros((recordsPerCapture, biggerTrace), dtype=answerTypeTrace)
 
-        # Demodulate the data, average them if asked and return the result
+        # Fill the answer with the demodulated data
 
         for i in np.arange(NdemodA+NdemodB):
             if i<NdemodA:
@@ -461,18 +412,9 @@ class Alazar987x(DllInstrument):
             else:
                 Istring = 'BI' + str(i-NdemodA).zfill(zerosDemodB)
                 Qstring = 'BQ' + str(i-NdemodA).zfill(zerosDemodB)
-            angle = 2 * np.pi * freq[i] * startSample[i] / samplesPerSec
-            if average:
-                data[i] = np.mean(data[i], axis=0)
-                ansI = 2 * np.mean((data[i]*coses[i]).reshape(lengthDemod[i], -1), axis=1)
-                ansQ = 2 * np.mean((data[i]*sines[i]).reshape(lengthDemod[i], -1), axis=1)
-                answerDemod[Istring][:lengthDemod[i]] = ansI * np.cos(angle) - ansQ * np.sin(angle)
-                answerDemod[Qstring][:lengthDemod[i]] = ansI * np.sin(angle) + ansQ * np.cos(angle)
-            else:
-                ansI = 2 * np.mean((data[i]*coses[i]).reshape(recordsPerCapture, lengthDemod[i], -1), axis=2)
-                ansQ = 2 * np.mean((data[i]*sines[i]).reshape(recordsPerCapture, lengthDemod[i], -1), axis=2)
-                answerDemod[Istring][:,:lengthDemod[i]] = ansI * np.cos(angle) - ansQ * np.sin(angle)
-                answerDemod[Qstring][:,:lengthDemod[i]] = ansI * np.sin(angle) + ansQ * np.cos(angle)
+            ansI, ansQ = results[i]
+            answerDemod[Istring][..., :lengthDemod[i]] = ansI
+            answerDemod[Qstring][..., :lengthDemod[i]] = ansQ
 
         for i in (np.arange(NtraceA+NtraceB) + NdemodB+NdemodA):
             if i<NdemodA+NdemodB+NtraceA:
@@ -480,9 +422,9 @@ class Alazar987x(DllInstrument):
             else:
                 Tracestring = 'B' + str(i-NdemodA-NdemodB-NtraceA).zfill(zerosTraceB)
             if average:
-                answerTrace[Tracestring][:samplesPerDemod[i]] = np.mean(data[i], axis=0)
+                answerTrace[Tracestring][:samplesPerDemod[i]] = results[i]
             else:
-                answerTrace[Tracestring][:,:samplesPerDemod[i]] = data[i]
+                answerTrace[Tracestring][:,:samplesPerDemod[i]] = results[i]
 
         return answerDemod, answerTrace
 
@@ -515,9 +457,8 @@ class Alazar987x(DllInstrument):
 
         bufferCount = 4
         print(bytesPerBuffer*4)
-        buffers = []
-        for i in range(bufferCount):
-            buffers.append(DMABuffer(bytesPerSample, bytesPerBuffer))
+        buffers = self._buffer_pool.get(bytesPerSample, bytesPerBuffer,
+                                        bufferCount)
         # Set the record size
         self._dll.SetRecordSize(board, 0, samplesPerRecord)
 
@@ -570,12 +511,9 @@ class Alazar987x(DllInstrument):
  
         self._dll.AbortAsyncRead(board)
 
-        for buffer in buffers:
-            buffer.__exit__()
-
         # Re-shaping of the data for demodulation and demodulation
-        dataA = dataA[:,1:samplesPerTrace + 1]
-        dataB = dataB[:,1:samplesPerTrace + 1]
+        dataA = dataA[:,1:int(samplesPerTrace) + 1]
+        dataB = dataB[:,1:int(samplesPerTrace) + 1]
 
         # Averaging if needed and converting binary numbers into Volts
         if average:
@@ -621,9 +559,8 @@ class Alazar987x(DllInstrument):
 
 #        bufferCount = int(round(recordsPerCapture / recordsPerBuffer))
         bufferCount = 4
-        buffers = []
-        for i in range(bufferCount):
-            buffers.append(DMABuffer(bytesPerSample, bytesPerBuffer))
+        buffers = self._buffer_pool.get(bytesPerSample, bytesPerBuffer,
+                                        bufferCount)
 
         # Set the record size
         self._dll.SetRecordSize(board, 0, samplesPerRecord)
@@ -713,10 +650,6 @@ class Alazar987x(DllInstrument):
 
         self._dll.AbortAsyncRead(board)
 
-        for i in range(bufferCount):
-            buffer = buffers[i]
-            buffer.__exit__()
-
 #        print time.clock() - start
 #        if time.clock() - start > acquisition_timeout_sec:
 #            raise Exception("Error: Capture timeout. Verify trigger")
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+# =============================================================================
+# module : alazar_simulator.py
+# author : Benjamin Huard & Nathanael Cottet & Sébastien Jezouin
+# license : MIT license
+# =============================================================================
+"""
+
+This module defines a simulated Alazar board which can be used in place of
+the ATS library to exercise the drivers without hardware.
+
+The simulated library implements the subset of the ATS API used by the
+drivers. The records are synthetic: a sum of tones plus gaussian noise on each
+channel, digitized as the boards do. The board fills the posted buffers at
+the configured trigger rate (or as fast as possible) and reports an overflow
+when it needs a buffer which has not been posted in time.
+
+:Contains:
+    SimulatedBuffer
+    SimulatedATSApi
+    SimulatedAlazar935x
+    SimulatedAlazar987x
+
+"""
+import time
+import ctypes
+from collections import deque
+
+import numpy as np
+
+from .alazar_tools import DMABufferPool
+from .alazar935x import Alazar935x
+from .alazar987x import Alazar987x
+
+
+class SimulatedBuffer(object):
+    """Buffer allocated by numpy, used in place of the DMA buffers.
+
+    Parameters
+    ----------
+    bytes_per_sample : int
+        The number of bytes per samples of the data.
+
+    size_bytes : int
+        The size of the buffer to allocate, in bytes.
+
+    """
+
+    def __init__(self, bytes_per_sample, size_bytes):
+        self.size_bytes = size_bytes
+        dtype = np.uint16 if bytes_per_sample > 1 else np.uint8
+        self.buffer = np.zeros(size_bytes // bytes_per_sample, dtype)
+        self.addr = self.buffer.ctypes.data
+
+    def release(self):
+        pass
+
+
+class SimulatedCall(object):
+    """Result of a call to the simulated library.
+
+    Mimics the results of the calls to a CLibrary: calling it returns the
+    return value, indexing it returns the arguments (including the values
+    of the output parameters) and unpacking it gives both.
+
+    """
+
+    def __init__(self, rval, args=()):
+        self.rval = rval
+        self.args = tuple(args)
+
+    def __call__(self):
+        return self.rval
+
+    def __getitem__(self, index):
+        return self.args[index]
+
+    def __iter__(self):
+        return iter((self.rval, self.args))
+
+
+class SimulatedATSApi(object):
+    """Simulated ATS library.
+
+    Parameters
+    ----------
+    samples_per_sec : float
+        Sampling rate of the board (before decimation).
+
+    bits_per_sample : int
+        Resolution of the board. The samples are left justified in 16 bits
+        words when this is more than 8.
+
+    tones : list, optional
+        Tones present in the signal as (channel, frequency (Hz),
+        amplitude (V), phase (rad)) tuples, channel being 'A' or 'B'.
+
+    noise : float, optional
+        Standard deviation of the gaussian noise added to the signal (V).
+
+    trigger_rate : float, optional
+        Number of records acquired per second. 0 means that the buffers are
+        filled as soon as they are waited for.
+
+    channel_range : float, optional
+        Range of the channels (V).
+
+    noise_records : int, optional
+        Number of noisy records generated per channel for an acquisition. The
+        records of the buffers are drawn among them, which is much faster
+        than generating new noise for every record.
+
+    seed : int, optional
+        Seed of the random generator.
+
+    """
+
+    ApiSuccess = 512
+    ApiBufferNotReady = 573
+    ApiWaitTimeout = 579
+    ApiBufferOverflow = 582
+
+    ADMA_EXTERNAL_STARTCAPTURE = 0x00000001
+    ADMA_NPT = 0x00000200
+    AUX_OUT_TRIGGER = 0
+    CHANNEL_A = 0x00000001
+    CHANNEL_B = 0x00000002
+    CLOCK_EDGE_RISING = 0
+    DC_COUPLING = 0x00000002
+    ETR_2V5 = 0x00000003
+    ETR_5V = 0
+    EXTERNAL_CLOCK_10MHz_REF = 0x00000007
+    IMPEDANCE_50_OHM = 0x00000002
+    INPUT_RANGE_PM_400_MV = 0x00000007
+    TRIGGER_SLOPE_POSITIVE = 0x00000001
+    TRIG_DISABLE = 0x00000003
+    TRIG_ENGINE_J = 0
+    TRIG_ENGINE_K = 0x00000001
+    TRIG_ENGINE_OP_J = 0
+    TRIG_EXTERNAL = 0x00000002
+
+    def __init__(self, samples_per_sec, bits_per_sample,
+                 tones=(('A', 40e6, 0.1, 0.), ('B', 40e6, 0.1, 0.)),
+                 noise=0.01, trigger_rate=0., channel_range=0.4,
+                 noise_records=32, seed=None):
+        self.samples_per_sec = samples_per_sec
+        self.bits_per_sample = bits_per_sample
+        self.tones = list(tones)
+        self.noise = noise
+        self.trigger_rate = trigger_rate
+        self.channel_range = channel_range
+        self.noise_records = noise_records
+        self._random = np.random.RandomState(seed)
+
+        self.decimation = 0
+        self.records_per_capture = 0
+        self._acquisition = None
+        self._posted = deque()
+
+    # --- Configuration -------------------------------------------------------
+
+    def GetBoardBySystemID(self, system_id, board_id):
+        return SimulatedCall(1)
+
+    def GetChannelInfo(self, board):
+        memory_size = 1 << 30
+        return SimulatedCall(self.ApiSuccess,
+                             (board, memory_size, self.bits_per_sample))
+
+    def AlazarErrorToText(self, code):
+        return 'Simulated board error {}'.format(code)
+
+    def SetCaptureClock(self, board, source, rate, edge, decimation):
+        self.decimation = decimation
+        return SimulatedCall(self.ApiSuccess)
+
+    def SetRecordCount(self, board, count):
+        self.records_per_capture = count
+        return SimulatedCall(self.ApiSuccess)
+
+    def _accept(self, *args):
+        return SimulatedCall(self.ApiSuccess)
+
+    InputControl = SetBWLimit = SetTriggerOperation = _accept
+    SetExternalTrigger = SetTriggerDelay = SetTriggerTimeOut = _accept
+    ConfigureAuxIO = SetRecordSize = AbortCapture = _accept
+
+    # --- Acquisition ---------------------------------------------------------
+
+    def BeforeAsyncRead(self, board, channels, pretrigger, samples_per_record,
+                        records_per_buffer, records_per_acquisition, flags):
+        names = [name for name, mask in (('A', self.CHANNEL_A),
+                                         ('B', self.CHANNEL_B))
+                 if channels & mask]
+        self._acquisition = {
+            'records_per_buffer': records_per_buffer,
+            'records': records_per_acquisition,
+            'records_done': 0,
+            'start': None,
+            'channels': [self._noisy_records(name, samples_per_record)
+                         for name in names],
+            }
+        self._posted.clear()
+        return SimulatedCall(self.ApiSuccess)
+
+    def PostAsyncBuffer(self, board, addr, size_bytes):
+        self._posted.append((addr, size_bytes, time.time()))
+        return SimulatedCall(self.ApiSuccess)
+
+    def StartCapture(self, board):
+        self._acquisition['start'] = time.time()
+        return SimulatedCall(self.ApiSuccess)
+
+    def WaitAsyncBufferComplete(self, board, addr, timeout_ms):
+        acq = self._acquisition
+        if not self._posted or self._posted[0][0] != addr:
+            return SimulatedCall(self.ApiBufferNotReady)
+        if acq['records_done'] >= acq['records']:
+            return SimulatedCall(self.ApiWaitTimeout)
+
+        index = acq['records_done'] // acq['records_per_buffer']
+        acq['records_done'] += acq['records_per_buffer']
+        if self.trigger_rate:
+            period = acq['records_per_buffer'] / float(self.trigger_rate)
+            ready = acq['start'] + (index + 1) * period
+            delay = ready - time.time()
+            if delay > timeout_ms / 1000.:
+                acq['records_done'] -= acq['records_per_buffer']
+                time.sleep(timeout_ms / 1000.)
+                return SimulatedCall(self.ApiWaitTimeout)
+            if delay > 0:
+                time.sleep(delay)
+            # The board needed the buffer before it was posted: the records
+            # are lost and the buffer goes back at the end of the queue.
+            if self._posted[0][2] > ready - period:
+                self._posted.append(self._posted.popleft()[:2] +
+                                    (time.time(),))
+                return SimulatedCall(self.ApiBufferOverflow)
+
+        _, size_bytes, _ = self._posted.popleft()
+        self._fill(addr, size_bytes)
+        return SimulatedCall(self.ApiSuccess)
+
+    def AbortAsyncRead(self, board):
+        self._posted.clear()
+        return SimulatedCall(self.ApiSuccess)
+
+    # --- Signal generation ---------------------------------------------------
+
+    def _noisy_records(self, channel, samples_per_record):
+        """Generate the digitized records among which the records of an
+        acquisition are drawn.
+
+        """
+        rate = self.samples_per_sec / max(self.decimation, 1)
+        t = np.arange(samples_per_record) / rate
+        signal = np.zeros(samples_per_record)
+        for name, freq, amplitude, phase in self.tones:
+            if name == channel:
+                signal += amplitude * np.cos(2 * np.pi * freq * t + phase)
+        signal = signal + self._random.normal(0, self.noise,
+                                              (self.noise_records,
+                                               samples_per_record))
+
+        code = (1 << (self.bits_per_sample - 1)) - 0.5
+        samples = np.round((signal / self.channel_range + 1) * code)
+        samples = np.clip(samples, 0, (1 << self.bits_per_sample) - 1)
+        if self.bits_per_sample > 8:
+            return samples.astype(np.uint16) << (16 - self.bits_per_sample)
+        return samples.astype(np.uint8)
+
+    def _fill(self, addr, size_bytes):
+        """Write the records of a buffer at the given address.
+
+        """
+        acq = self._acquisition
+        dtype = acq['channels'][0].dtype
+        memory = (ctypes.c_uint8 * size_bytes).from_address(addr)
+        data = np.frombuffer(memory, dtype)
+        data = data.reshape(len(acq['channels']), acq['records_per_buffer'],
+                            -1)
+        for channel, records in zip(data, acq['channels']):
+            choice = self._random.randint(len(records), size=len(channel))
+            channel[:] = records[choice]
+
+
+class SimulatedAlazar935x(Alazar935x):
+    """Alazar935x driver controlling a simulated board.
+
+    The connection infos are the parameters of the simulated board (see
+    SimulatedATSApi).
+
+    """
+
+    def __init__(self, connection_info, caching_allowed=True,
+                 caching_permissions={}, auto_open=True):
+        self._settings = dict(connection_info or {})
+        super(SimulatedAlazar935x, self).__init__(connection_info,
+                                                  caching_allowed,
+                                                  caching_permissions,
+                                                  auto_open)
+        self._buffer_pool = DMABufferPool(buffer_class=SimulatedBuffer)
+
+    def _load_library(self):
+        return SimulatedATSApi(500000000.0, 12, **self._settings)
+
+
+class SimulatedAlazar987x(Alazar987x):
+    """Alazar987x driver controlling a simulated board.
+
+    The connection infos are the parameters of the simulated board (see
+    SimulatedATSApi).
+
+    """
+
+    def __init__(self, connection_info, caching_allowed=True,
+                 caching_permissions={}, auto_open=True):
+        self._settings = dict(connection_info or {})
+        super(SimulatedAlazar987x, self).__init__(connection_info,
+                                                  caching_allowed,
+                                                  caching_permissions,
+                                                  auto_open)
+        self._buffer_pool = DMABufferPool(buffer_class=SimulatedBuffer)
+
+    def _load_library(self):
+        return SimulatedATSApi(1000000000.0, 8, **self._settings)
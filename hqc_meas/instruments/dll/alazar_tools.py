@@ -0,0 +1,619 @@
+# -*- coding: utf-8 -*-
+# =============================================================================
+# module : alazar_tools.py
+# author : Benjamin Huard & Nathanael Cottet & Sébastien Jezouin
+# license : MIT license
+# =============================================================================
+"""
+
+This module defines the tools shared by the drivers of the Alazar boards.
+
+:Contains:
+    DMABuffer
+    DMABufferPool
+    DemodTableCache
+    DemodAccumulator
+    TraceAccumulator
+    BufferPipeline
+
+"""
+import os
+import sys
+import numpy as np
+import ctypes
+from collections import OrderedDict, deque
+from threading import Thread, Lock
+from Queue import Queue, Empty
+
+
+#: Default memory budget in bytes of the pools of DMA buffers. It is large
+#: enough to keep the buffers of several acquisitions (each can use hundreds
+#: of MB) so that alternating between them does not re-allocate the buffers.
+#: The buffers of the current acquisition are always kept, the least recently
+#: used groups are released once the budget is exceeded (for example when
+#: sweeping the length of the records).
+DMA_POOL_BYTES = 2**30
+
+
+class DMABuffer:
+    '''Buffer suitable for DMA transfers.
+
+    AlazarTech digitizers use direct memory access (DMA) to transfer
+    data from digitizers to the computer's main memory. This class
+    abstracts a memory buffer on the host, and ensures that all the
+    requirements for DMA transfers are met.
+
+    DMABuffers export a 'buffer' member, which is a NumPy array view
+    of the underlying memory buffer
+
+    Args:
+
+      bytes_per_sample (int): The number of bytes per samples of the
+      data. This varies with digitizer models and configurations.
+
+      size_bytes (int): The size of the buffer to allocate, in bytes.
+
+    '''
+    def __init__(self, bytes_per_sample, size_bytes):
+        self.size_bytes = size_bytes
+        ctypes.cSampleType = ctypes.c_uint8
+        npSampleType = np.uint8
+        if bytes_per_sample > 1:
+            ctypes.cSampleType = ctypes.c_uint16
+            npSampleType = np.uint16
+
+        self.addr = None
+        if os.name == 'nt':
+            MEM_COMMIT = 0x1000
+            PAGE_READWRITE = 0x4
+            ctypes.windll.kernel32.VirtualAlloc.argtypes = [ctypes.c_void_p, ctypes.c_long,
+                                                     ctypes.c_long, ctypes.c_long]
+            ctypes.windll.kernel32.VirtualAlloc.restype = ctypes.c_void_p
+            self.addr = ctypes.windll.kernel32.VirtualAlloc(
+                0, ctypes.c_long(size_bytes), MEM_COMMIT, PAGE_READWRITE)
+        elif os.name == 'posix':
+            ctypes.libc.valloc.argtypes = [ctypes.c_long]
+            ctypes.libc.valloc.restype = ctypes.c_void_p
+            self.addr = ctypes.libc.valloc(size_bytes)
+        else:
+            raise Exception("Unsupported OS")
+
+        ctypes.ctypes_array = (ctypes.cSampleType *
+                        (size_bytes // bytes_per_sample)
+                        ).from_address(self.addr)
+        self.buffer = np.frombuffer(ctypes.ctypes_array, dtype=npSampleType)
+        pointer, read_only_flag = self.buffer.__array_interface__['data']
+
+    def __exit__(self):
+        if os.name == 'nt':
+            MEM_RELEASE = 0x8000
+            ctypes.windll.kernel32.VirtualFree.argtypes = [ctypes.c_void_p, ctypes.c_long, ctypes.c_long]
+            ctypes.windll.kernel32.VirtualFree.restype = ctypes.c_int
+            ctypes.windll.kernel32.VirtualFree(ctypes.c_void_p(self.addr), 0, MEM_RELEASE)
+        elif os.name == 'posix':
+            ctypes.libc.free(self.addr)
+        else:
+            raise Exception("Unsupported OS")
+
+    release = __exit__
+
+
+class DMABufferPool(object):
+    """Pool of DMA buffers reused from one acquisition to the next.
+
+    Allocating and pinning the DMA buffers is costly, so the buffers are kept
+    between acquisitions, grouped by (bytes per sample, bytes per buffer).
+    A group grows when more buffers are requested and is only released by
+    trim (when the pool is closed, explicitly trimmed or exceeds its memory
+    budget).
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        Memory budget of the pool. When exceeded the least recently used
+        groups of buffers are released. None means no limit.
+
+    buffer_class : type, optional
+        Class used to allocate the buffers.
+
+    """
+
+    def __init__(self, max_bytes=DMA_POOL_BYTES, buffer_class=DMABuffer):
+        self.max_bytes = max_bytes
+        self.buffer_class = buffer_class
+        self._buffers = OrderedDict()
+
+    @property
+    def nbytes(self):
+        """Number of bytes held by the pool.
+
+        """
+        return sum(buffers[0].size_bytes*len(buffers)
+                   for buffers in self._buffers.itervalues())
+
+    def get(self, bytes_per_sample, size_bytes, count):
+        """Get buffers for an acquisition.
+
+        Parameters
+        ----------
+        bytes_per_sample : int
+            Number of bytes per sample of the data.
+
+        size_bytes : int
+            Size of each buffer in bytes.
+
+        count : int
+            Number of buffers needed.
+
+        Returns
+        -------
+        buffers : list
+            List of count buffers. The same buffers are returned by later
+            calls with the same sizes.
+
+        """
+        key = (bytes_per_sample, size_bytes)
+        buffers = self._buffers.pop(key, [])
+        self._buffers[key] = buffers
+        while len(buffers) < count:
+            buffers.append(self.buffer_class(bytes_per_sample, size_bytes))
+
+        if self.max_bytes is not None:
+            self.trim(self.max_bytes)
+
+        return buffers[:count]
+
+    def trim(self, max_bytes=0):
+        """Release buffers until the pool holds at most max_bytes.
+
+        The least recently used groups of buffers are released first.
+
+        """
+        while self._buffers and self.nbytes > max_bytes:
+            key = next(iter(self._buffers))
+            if max_bytes and len(self._buffers) == 1:
+                # Never release the buffers of the current acquisition.
+                break
+            for buffer in self._buffers.pop(key):
+                buffer.release()
+
+
+class DemodTableCache(object):
+    """Cache of the reference tables used for the demodulation.
+
+    The tables only depend on the parameters of the demodulation windows
+    which usually do not change from one acquisition to the next so they are
+    kept between calls.
+
+    Parameters
+    ----------
+    max_tables : int, optional
+        Number of pairs of tables kept in the cache. When exceeded the least
+        recently used ones are discarded.
+
+    """
+
+    def __init__(self, max_tables=64):
+        self.max_tables = max_tables
+        self._tables = OrderedDict()
+        self._blocks = {}
+
+    def block_size(self, length, freq, samples_per_sec):
+        """Number of samples per block for a window.
+
+        The block is the smallest number of periods spanning an integer
+        number of samples, or the whole window if it is longer.
+
+        """
+        key = (length, freq, samples_per_sec)
+        if key not in self._blocks:
+            periods = 1
+            while (periods * samples_per_sec < freq * length
+                   and periods * samples_per_sec % freq):
+                periods += 1
+            self._blocks[key] = int(min(periods * samples_per_sec / freq,
+                                        length))
+        return self._blocks[key]
+
+    def tables(self, freq, block, samples_per_sec, start, dtype=np.float64):
+        """Cosine and sine tables used to demodulate a block.
+
+        The phase accumulated since the trigger (start sample) is included in
+        the tables so that the quadratures do not need to be rotated.
+
+        """
+        key = (freq, block, samples_per_sec, start, np.dtype(dtype).str)
+        tables = self._tables.pop(key, None)
+        if tables is None:
+            phase = (2 * np.pi * freq / samples_per_sec *
+                     (np.arange(block) + start))
+            tables = (np.cos(phase).astype(dtype),
+                      np.sin(phase).astype(dtype))
+        self._tables[key] = tables
+        while len(self._tables) > self.max_tables:
+            self._tables.popitem(last=False)
+        return tables
+
+    def clear(self):
+        """Empty the cache.
+
+        """
+        self._tables.clear()
+        self._blocks.clear()
+
+
+class DemodAccumulator(object):
+    """Demodulate the records of a window as the buffers are completed.
+
+    Each record is folded into blocks of an integer number of periods which
+    are summed. When averaging only the running sum over the records is kept
+    (the demodulation being linear), otherwise each record is demodulated as
+    soon as its buffer is available. The memory used hence does not depend
+    on the number of records of the capture when averaging. Buffers can be
+    added concurrently from several threads.
+
+    Parameters
+    ----------
+    start : int
+        Index of the first sample of the window in a record.
+
+    length : int
+        Number of samples in the window.
+
+    block : int
+        Number of samples per block.
+
+    steps : int
+        Number of demodulated points in the window (the block is split into
+        steps equal parts).
+
+    tables : tuple
+        Cosine and sine tables of the block (see DemodTableCache.tables).
+
+    code : float
+        Value of the samples corresponding to 0 V.
+
+    channel_range : float
+        Range of the channel in volts.
+
+    records : int
+        Total number of records of the acquisition.
+
+    average : bool
+        Whether to average the records.
+
+    dtype : numpy.dtype, optional
+        Floating point type used for the demodulation and the results. The
+        folding of the records is always exact.
+
+    """
+
+    def __init__(self, start, length, block, steps, tables, code,
+                 channel_range, records, average, dtype=np.float64):
+        self.start = start
+        self.length = length
+        self.block = block
+        self.steps = steps
+        self.average = average
+        self.dtype = np.dtype(dtype)
+        self.records = 0
+        self._lock = Lock()
+
+        self._full, self._rest = divmod(length, block)
+        # Number of samples summed in each column of the folded record.
+        counts = self._full + (np.arange(block) < self._rest)
+
+        # The conversion into volts, (folded/counts/code - 1)*channel_range,
+        # and the mean over each step are included in the weights.
+        points = block // steps
+        scale = 2 * channel_range / (counts * code * points)
+        cos, sin = tables
+        self._weights = [(scale * table).astype(dtype).reshape(steps, -1)
+                         for table in (cos, sin)]
+        self._offsets = [(2 * channel_range / points *
+                          np.sum(np.reshape(table, (steps, -1)), axis=1,
+                                 dtype=np.float64)).astype(dtype)
+                         for table in (cos, sin)]
+
+        if average:
+            self._sum = np.zeros(block)
+        else:
+            self._i = np.empty((records, steps), dtype)
+            self._q = np.empty((records, steps), dtype)
+
+    def add(self, data, offset=None):
+        """Process the records of a completed buffer.
+
+        Parameters
+        ----------
+        data : np.ndarray
+            Raw samples, one record per row.
+
+        offset : int, optional
+            Index of the first record of the buffer in the acquisition. By
+            default the records are appended after the ones already added.
+
+        """
+        window = data[:, self.start:self.start + self.length]
+        split = self._full * self.block
+        folded = np.sum(window[:, :split].reshape(len(window), self._full,
+                                                  self.block),
+                        axis=1, dtype=np.int64)
+        folded[:, :self._rest] += window[:, split:]
+
+        if self.average:
+            folded = np.sum(folded, axis=0)
+            with self._lock:
+                self._sum += folded
+                self.records += len(window)
+        else:
+            i, q = self._demodulate(folded)
+            with self._lock:
+                if offset is None:
+                    offset = self.records
+                self.records += len(window)
+            self._i[offset:offset + len(window)] = i
+            self._q[offset:offset + len(window)] = q
+
+    def result(self):
+        """Get the demodulated quadratures.
+
+        Returns
+        -------
+        i, q : np.ndarray
+            Quadratures of shape (steps,) when averaging, (records, steps)
+            otherwise.
+
+        """
+        if self.average:
+            return self._demodulate(self._sum / self.records)
+        return self._i, self._q
+
+    def _demodulate(self, folded):
+        """Convert folded records into volts and demodulate them.
+
+        """
+        folded = folded.astype(self.dtype, copy=False)
+        folded = folded.reshape(folded.shape[:-1] + (self.steps, -1))
+        return [np.einsum('...ij,ij->...i', folded, weights) - offsets
+                for weights, offsets in zip(self._weights, self._offsets)]
+
+
+class TraceAccumulator(object):
+    """Collect the traces of a window as the buffers are completed.
+
+    When averaging only the running sum over the records is kept. Buffers
+    can be added concurrently from several threads.
+
+    Parameters
+    ----------
+    start : int
+        Index of the first sample of the window in a record.
+
+    length : int
+        Number of samples in the window.
+
+    code : float
+        Value of the samples corresponding to 0 V.
+
+    channel_range : float
+        Range of the channel in volts.
+
+    records : int
+        Total number of records of the acquisition.
+
+    average : bool
+        Whether to average the records.
+
+    dtype : numpy.dtype, optional
+        Floating point type of the traces.
+
+    """
+
+    def __init__(self, start, length, code, channel_range, records, average,
+                 dtype=np.float64):
+        self.start = start
+        self.length = length
+        self.code = code
+        self.channel_range = channel_range
+        self.average = average
+        self.dtype = np.dtype(dtype)
+        self.records = 0
+        self._lock = Lock()
+
+        if average:
+            self._sum = np.zeros(length)
+        else:
+            self._data = np.empty((records, length), dtype)
+
+    def add(self, data, offset=None):
+        """Process the records of a completed buffer.
+
+        Parameters
+        ----------
+        data : np.ndarray
+            Raw samples, one record per row.
+
+        offset : int, optional
+            Index of the first record of the buffer in the acquisition. By
+            default the records are appended after the ones already added.
+
+        """
+        window = data[:, self.start:self.start + self.length]
+        if self.average:
+            window = np.sum(window, axis=0, dtype=np.float64)
+            with self._lock:
+                self._sum += window
+                self.records += len(data)
+        else:
+            with self._lock:
+                if offset is None:
+                    offset = self.records
+                self.records += len(data)
+            self._data[offset:offset + len(data)] = self._to_volts(window)
+
+    def result(self):
+        """Get the traces in volts.
+
+        Returns
+        -------
+        traces : np.ndarray
+            Traces of shape (length,) when averaging, (records, length)
+            otherwise.
+
+        """
+        if self.average:
+            return self._to_volts(self._sum / self.records)
+        return self._data
+
+    def _to_volts(self, data):
+        data = data.astype(self.dtype, copy=False)
+        return (data / self.code - 1) * self.channel_range
+
+
+class BufferPipeline(object):
+    """Process the DMA buffers in worker threads while the board fills the
+    next ones.
+
+    The thread running the acquisition only waits for the buffers to be
+    filled, hands them to the workers and posts them back to the board once
+    they have been processed, in the order in which they were filled. As a
+    buffer is reposted only after being processed, the board can run out of
+    posted buffers if the processing does not keep up; in that case the
+    acquisition thread waits for the workers (the buffer is counted as late).
+
+    If the board fails to fill a buffer the acquisition is aborted: the data
+    acquired afterwards would be shifted with respect to the triggers.
+
+    Parameters
+    ----------
+    process : callable
+        Function processing a buffer, called as process(buffer, index) where
+        index is the number of buffers filled before this one. When using
+        several workers it must be thread-safe.
+
+    workers : int, optional
+        Number of processing threads.
+
+    Attributes
+    ----------
+    late : int
+        Number of buffers which were still being processed when the board
+        needed them again.
+
+    """
+
+    def __init__(self, process, workers=1):
+        self.process = process
+        self.workers = workers
+        self.late = 0
+
+    def run(self, buffers, count, wait, post):
+        """Acquire and process a number of buffers.
+
+        Parameters
+        ----------
+        buffers : list
+            Buffers, all already posted to the board in this order.
+
+        count : int
+            Number of buffers to acquire.
+
+        wait : callable
+            Function waiting for a buffer to be filled. It must raise if the
+            board failed to fill the buffer, the error is then propagated once
+            the workers are stopped.
+
+        post : callable
+            Function posting a buffer back to the board.
+
+        Returns
+        -------
+        filled : int
+            Number of buffers filled and processed.
+
+        """
+        self.late = 0
+        tasks = Queue()
+        done = Queue()
+        threads = [Thread(target=self._work, args=(tasks, done),
+                          name='Alazar buffers processing')
+                   for _ in range(self.workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        # Positions of the buffers handed to the workers, in filling order.
+        pending = deque()
+        finished = set()
+        filled = 0
+        try:
+            for n in xrange(int(count)):
+                position = n % len(buffers)
+                self._collect(done, finished, block=False)
+                self._repost(buffers, pending, finished, post)
+                if position in pending:
+                    self.late += 1
+                    while position in pending:
+                        self._collect(done, finished, block=True)
+                        self._repost(buffers, pending, finished, post)
+
+                wait(buffers[position])
+                pending.append(position)
+                tasks.put((position, buffers[position], filled))
+                filled += 1
+
+            while pending:
+                self._collect(done, finished, block=True)
+                while pending and pending[0] in finished:
+                    finished.discard(pending.popleft())
+
+        finally:
+            for thread in threads:
+                tasks.put(None)
+            for thread in threads:
+                thread.join()
+
+        return filled
+
+    def _work(self, tasks, done):
+        """Process the buffers handed by the acquisition thread.
+
+        """
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            position, buffer, index = task
+            try:
+                self.process(buffer, index)
+            except Exception:
+                done.put((position, sys.exc_info()))
+            else:
+                done.put((position, None))
+
+    def _collect(self, done, finished, block):
+        """Collect the buffers whose processing is over.
+
+        An error occuring in a worker is raised in the acquisition thread.
+
+        """
+        while True:
+            try:
+                position, error = done.get(block)
+            except Empty:
+                return
+            if error is not None:
+                raise error[0], error[1], error[2]
+            finished.add(position)
+            if block:
+                return
+
+    def _repost(self, buffers, pending, finished, post):
+        """Post the processed buffers back to the board in filling order.
+
+        """
+        while pending and pending[0] in finished:
+            position = pending.popleft()
+            finished.discard(position)
+            post(buffers[position])
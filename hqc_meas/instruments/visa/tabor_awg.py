@@ -16,6 +16,7 @@
 
 from threading import Lock
 from contextlib import contextmanager
+from hashlib import md5
 from ..driver_tools import (BaseInstrument, InstrIOError, secure_communication,
                             instrument_property)
 from ..visa_tools import VisaInstrument
@@ -113,13 +114,27 @@ class TaborAWG(VisaInstrument):
     """
     caching_permissions = {'defined_channels': True}
 
+    #: Traces uploaded by the drivers of the process for each instrument
+    #: (identified by its connection string) as {channel: (digest, length)}.
+    #: The inventory outlives the driver instances and is checked against the
+    #: instrument trace catalog before being used after a connection.
+    inventories = {}
+
     def __init__(self, connection_info, caching_allowed=True,
                  caching_permissions={}, auto_open=True):
+        self._inventory_checked = False
         super(TaborAWG, self).__init__(connection_info, caching_allowed,
                                   caching_permissions, auto_open)
         self.channels = {}
         self.lock = Lock()
 
+    def open_connection(self, **para):
+        """Open the connection and mark the inventory as needing a check.
+
+        """
+        super(TaborAWG, self).open_connection(**para)
+        self._inventory_checked = False
+
     def get_channel(self, num):
         """
         """
@@ -133,17 +148,64 @@ class TaborAWG(VisaInstrument):
             self.channels[num] = channel
             return channel
 
+    @property
+    def inventory(self):
+        """Traces known to be stored on the instrument.
+
+        """
+        return self.inventories.setdefault(self.connection_str, {})
+
+    @secure_communication()
+    def check_inventory(self):
+        """Remove from the inventory the traces no longer on the instrument.
+
+        The length of the trace of each channel is read from the instrument
+        catalog and compared with the one recorded when uploading it.
+
+        """
+        inventory = self.inventory
+        for ch_id in list(inventory):
+            self.write('INST {}'.format(ch_id))
+            catalog = self.ask('TRAC:CAT?').strip('"\n ')
+            try:
+                lengths = [int(l) for l in catalog.split(',')[1::2]]
+            except ValueError:
+                lengths = []
+            if inventory[ch_id][1] not in lengths:
+                del inventory[ch_id]
+
+        self._inventory_checked = True
+
+    def forget_waveforms(self):
+        """Empty the inventory so that all traces are uploaded again.
+
+        """
+        self.inventory.clear()
+
     @secure_communication()
     def to_send(self, waveform, ch_id):
         """Command to send to the instrument. waveform = string of a bytearray
 
+        The transfer is skipped if the inventory indicates that the channel
+        already holds a trace with the same content.
+
         """
         numbyte = len(waveform)
+        if not self._inventory_checked:
+            self.check_inventory()
+
+        inventory = self.inventory
+        digest = md5(waveform).hexdigest()
+        if inventory.get(ch_id) == (digest, numbyte//2):
+            return
+
+        inventory.pop(ch_id, None)
         self.write('INST {}'.format(ch_id))
         self.write('TRAC:MODE SING')
         numApresDiese = len('{}'.format(numbyte))
         header = "TRAC#{}{}".format(numApresDiese, numbyte)
         self.write('{}{}'.format(header, waveform))
+        inventory[ch_id] = (digest, numbyte//2)
 
     @instrument_property
     @secure_communication()
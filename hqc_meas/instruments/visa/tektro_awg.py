@@ -16,6 +16,7 @@
 
 from threading import Lock
 from contextlib import contextmanager
+from hashlib import md5
 from ..driver_tools import (BaseInstrument, InstrIOError, secure_communication,
                             instrument_property)
 from ..visa_tools import VisaInstrument, VisaIOError
@@ -398,13 +399,27 @@ class AWG(VisaInstrument):
     """
     caching_permissions = {'defined_channels': True}
 
+    #: Waveforms uploaded by the drivers of the process for each instrument
+    #: (identified by its connection string) as {name: (digest, length)}.
+    #: The inventory outlives the driver instances and is checked against the
+    #: instrument waveform list before being used after a connection.
+    inventories = {}
+
     def __init__(self, connection_info, caching_allowed=True,
                  caching_permissions={}, auto_open=True):
+        self._inventory_checked = False
         super(AWG, self).__init__(connection_info, caching_allowed,
                                   caching_permissions, auto_open)
         self.channels = {}
         self.lock = Lock()
 
+    def open_connection(self, **para):
+        """Open the connection and mark the inventory as needing a check.
+
+        """
+        super(AWG, self).open_connection(**para)
+        self._inventory_checked = False
+
     def reopen_connection(self):
         """Clear buffer on connection reseting.
 
@@ -430,13 +445,66 @@ class AWG(VisaInstrument):
             self.channels[num] = channel
             return channel
 
+    @property
+    def inventory(self):
+        """Waveforms known to be stored on the instrument.
+
+        """
+        return self.inventories.setdefault(self.connection_str, {})
+
     @secure_communication()
-    def to_send(self, name, waveform, initialized):
+    def check_inventory(self):
+        """Remove from the inventory the waveforms no longer on the instrument.
+
+        The waveforms are looked up in the instrument waveform list and their
+        length is compared with the one recorded when uploading them.
+
+        """
+        inventory = self.inventory
+        if inventory:
+            size = int(self.ask('WLISt:SIZE?'))
+            names = set()
+            for i in range(size):
+                names.add(self.ask('WLISt:NAME? {}'.format(i)).strip('"\n '))
+            for name in list(inventory):
+                if name not in names:
+                    del inventory[name]
+                    continue
+                length = int(self.ask('WLISt:WAVeform:LENGth? "{}"'.format(
+                    name)))
+                if length != inventory[name][1]:
+                    del inventory[name]
+
+        self._inventory_checked = True
+
+    def forget_waveforms(self):
+        """Empty the inventory so that all waveforms are uploaded again.
+
+        """
+        self.inventory.clear()
+
+    @secure_communication()
+    def to_send(self, name, waveform, initialized, wait=True):
         """Command to send to the instrument. waveform = string of a bytearray
 
+        The transfer is skipped if the inventory indicates that a waveform
+        with the same name and content is already stored on the instrument.
+        If wait is False the instrument is not asked to complete the transfer
+        before processing the next commands, wait_for_transfers should then
+        be called once all the waveforms have been sent.
+
         """
         numbyte = len(waveform)
         looplength = numbyte//2
+        if not self._inventory_checked:
+            self.check_inventory()
+
+        inventory = self.inventory
+        digest = md5(waveform).hexdigest()
+        if inventory.get(name) == (digest, looplength):
+            return True
+
+        inventory.pop(name, None)
         if not initialized:
             self.write("WLIST:WAVEFORM:DELETE '{}'".format(name))
             self.write("WLIST:WAVEFORM:NEW '{}' , {}, INTeger" .format(name,
@@ -448,10 +516,20 @@ class AWG(VisaInstrument):
                                                         numApresDiese,
                                                         numbyte)
         self.write('{}{}'.format(header, waveform))
-        self.write('*WAI')
+        if wait:
+            self.write('*WAI')
+        inventory[name] = (digest, looplength)
 
         return initialized
 
+    @secure_communication()
+    def wait_for_transfers(self):
+        """Wait for the instrument to have processed all the transfers.
+
+        """
+        self.write('*WAI')
+        self.ask('*OPC?')
+
     @secure_communication()
     def clear_sequence(self):
         self.write("SEQuence:LENGth 0")
@@ -4,7 +4,7 @@
 # author : Matthieu Dartiailh
 # license : MIT license
 # =============================================================================
-from atom.api import Typed, Value, Tuple, Bool
+from atom.api import Typed, Value, Tuple, Bool, Float, Int
 from enaml.workbench.api import Workbench
 from enaml.application import deferred_call
 from multiprocessing import Pipe
@@ -18,6 +18,7 @@ from hqc_meas.utils.log.tools import QueueLoggerThread
 
 from ..base_engine import BaseEngine
 from ..tools import ThreadMeasureMonitor
+from ..shared_buffer import SharedArrayBuffer
 from .subprocess import TaskProcess
 
 
@@ -28,6 +29,16 @@ class ProcessEngine(BaseEngine):
 
     # --- Public API ----------------------------------------------------------
 
+    #: Time in seconds between two batched updates of the monitored entries.
+    #: If zero every update is sent to the monitors as soon as it occurs.
+    #: The default keeps the monitors responsive while sparing the main
+    #: process the cost of notifying every update of fast loops.
+    monitor_period = Float(0.1)
+
+    #: Size in bytes of the shared memory used to transfer the big arrays
+    #: to the monitors. If zero all values are sent through the queue.
+    shared_buffer_size = Int(2**24)
+
     #: Reference to the workbench got at __init__
     workbench = Typed(Workbench)
 
@@ -41,7 +52,7 @@ class ProcessEngine(BaseEngine):
 
         # Make infos tuple to send to the subprocess.
         self._temp = (name, config, build_deps, runtime_deps,
-                      monitored_entries)
+                      monitored_entries, self.monitor_period)
 
         # Clear all the flags.
         self._meas_pause.clear()
@@ -53,6 +64,17 @@ class ProcessEngine(BaseEngine):
 
         # If the process does not exist or is dead create a new one.
         if not self._process or not self._process.is_alive():
+            self._close_shared_buffer()
+            if self.shared_buffer_size:
+                try:
+                    self._shared_buffer = \
+                        SharedArrayBuffer(self.shared_buffer_size)
+                except (IOError, OSError, ValueError):
+                    logger = logging.getLogger(__name__)
+                    mes = ('Failed to create the shared buffer, all values '
+                           'will be sent through the queue.')
+                    logger.warning(mes, exc_info=True)
+
             self._pipe, process_pipe = Pipe()
             self._process = TaskProcess(process_pipe,
                                         self._log_queue,
@@ -60,14 +82,16 @@ class ProcessEngine(BaseEngine):
                                         self._meas_pause,
                                         self._meas_paused,
                                         self._meas_stop,
-                                        self._stop)
+                                        self._stop,
+                                        self._shared_buffer)
             self._process.daemon = True
 
             self._log_thread = QueueLoggerThread(self._log_queue)
             self._log_thread.daemon = True
 
             self._monitor_thread = ThreadMeasureMonitor(self,
-                                                        self._monitor_queue)
+                                                        self._monitor_queue,
+                                                        self._shared_buffer)
             self._monitor_thread.daemon = True
 
             self._pause_thread = None
@@ -130,6 +154,7 @@ class ProcessEngine(BaseEngine):
         self._log_thread.join()
         self._monitor_thread.join()
         self._com_thread.join()
+        self._close_shared_buffer()
         self.active = False
         if self._processing.is_set():
             self.done = ('INTERRUPTED', 'The user forced the system to stop')
@@ -202,6 +227,17 @@ class ProcessEngine(BaseEngine):
     #: being asked to do so.
     _pause_thread = Typed(Thread)
 
+    #: Shared memory used to transfer big arrays from the subprocess.
+    _shared_buffer = Typed(SharedArrayBuffer)
+
+    def _close_shared_buffer(self):
+        """ Release the shared memory if any.
+
+        """
+        if self._shared_buffer:
+            self._shared_buffer.close()
+            self._shared_buffer = None
+
     def _process_listener(self):
         """ Handle the communications with the worker process.
 
@@ -294,6 +330,7 @@ class ProcessEngine(BaseEngine):
         logger.debug('Log thread joined')
         self._monitor_thread.join()
         logger.debug('Monitor thread joined')
+        self._close_shared_buffer()
         if self._pause_thread:
             self._pause_thread.join()
             logger.debug('Pause thread joined')
@@ -51,6 +51,8 @@ class TaskProcess(Process):
         Event set when the user asked the running measurement to stop.
     process_stop : multiprocessing event
         Event set when the user asked the process to stop.
+    shared_buffer : SharedArrayBuffer, optional
+        Shared memory used by the spy to transfer big arrays.
 
     Attributes
     ----------
@@ -66,7 +68,7 @@ class TaskProcess(Process):
     """
 
     def __init__(self, pipe, log_queue, monitor_queue, task_pause, task_paused,
-                 task_stop, process_stop):
+                 task_stop, process_stop, shared_buffer=None):
         super(TaskProcess, self).__init__(name='MeasureProcess')
         self.daemon = True
         self.task_pause = task_pause
@@ -76,6 +78,7 @@ class TaskProcess(Process):
         self.pipe = pipe
         self.log_queue = log_queue
         self.monitor_queue = monitor_queue
+        self.shared_buffer = shared_buffer
         self.meas_log_handler = None
 
     def run(self):
@@ -113,7 +116,8 @@ class TaskProcess(Process):
                     break
 
                 # Get the measure.
-                name, config, build, runtime, mon_entries = self.pipe.recv()
+                (name, config, build, runtime, mon_entries,
+                 mon_period) = self.pipe.recv()
 
                 # Build it by using the given build dependencies.
                 root = build_task_from_config(config, build, True)
@@ -128,7 +132,8 @@ class TaskProcess(Process):
                 if mon_entries:
                     spy = MeasureSpy(
                         self.monitor_queue, mon_entries,
-                        root.task_database)
+                        root.task_database, mon_period,
+                        self.shared_buffer)
 
                 # Set up the logger for this specific measurement.
                 if self.meas_log_handler is not None:
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+# =============================================================================
+# module : shared_buffer.py
+# author : Matthieu Dartiailh
+# license : MIT license
+# =============================================================================
+""" Shared memory ring buffer used to transfer large arrays between processes.
+
+Pickling large arrays through a multiprocessing queue is expensive. Instead
+the measure process copies them into a memory mapped file shared with the main
+process and only sends a small descriptor through the queue. The main process
+then copies the array out of the shared memory, which is much cheaper than
+unpickling it.
+
+"""
+import os
+import mmap
+import logging
+import tempfile
+from collections import namedtuple
+from threading import Lock
+
+import numpy as np
+
+
+#: Descriptor of an array stored in a SharedArrayBuffer. position is the
+#: absolute position (ie not wrapped) of the first byte of the array in the
+#: ring.
+SharedArray = namedtuple('SharedArray', ['position', 'dtype', 'shape'])
+
+#: Size in bytes of the header holding the total number of bytes reserved.
+HEADER_SIZE = 64
+
+#: Alignment in bytes of the arrays stored in the buffer.
+ALIGNMENT = 64
+
+
+class SharedArrayBuffer(object):
+    """ Ring buffer backed by a memory mapped file.
+
+    The buffer can be pickled to be sent to another process, in which case it
+    is re-opened in that process. A single process should write into the
+    buffer (writing is thread safe inside that process).
+
+    The data of an array remain in the ring only until the writer wraps
+    around and overwrites them. Readers hence get a copy, which is discarded
+    if the data were overwritten while being copied.
+
+    Parameters
+    ----------
+    capacity : int
+        Size in bytes of the ring.
+
+    path : unicode, optional
+        Path to the backing file. If not provided a new file is created.
+
+    """
+
+    def __init__(self, capacity, path=None):
+        self.capacity = capacity
+        self.owner = path is None
+        if path is None:
+            # Prefer a tmpfs on Linux so that the data never hits the disk.
+            directory = '/dev/shm' if os.path.isdir('/dev/shm') else None
+            fd, path = tempfile.mkstemp(prefix='hqc_meas_', dir=directory)
+            os.close(fd)
+            with open(path, 'r+b') as f:
+                f.truncate(HEADER_SIZE + capacity)
+        self.path = path
+        self._open()
+
+    def write(self, array):
+        """ Copy an array into the ring.
+
+        Parameters
+        ----------
+        array : ndarray
+            Array to store.
+
+        Returns
+        -------
+        descriptor : SharedArray or None
+            Descriptor to send to the reader or None if the array cannot be
+            stored (object dtype or too big).
+
+        """
+        nbytes = array.nbytes
+        if array.dtype.hasobject or nbytes > self.capacity:
+            return None
+
+        array = np.ascontiguousarray(array)
+        reserved = -(-nbytes // ALIGNMENT)*ALIGNMENT
+        capacity = self.capacity
+        with self._lock:
+            position = int(self._header[0])
+            offset = position % capacity
+            # Never split an array, jump to the beginning of the ring.
+            if offset + nbytes > capacity:
+                position += capacity - offset
+                offset = 0
+            # Reserve the space before writing so that readers can detect
+            # the data they hold is being overwritten.
+            self._header[0] = position + reserved
+            dest = np.frombuffer(self._mmap, np.uint8, nbytes,
+                                 HEADER_SIZE + offset)
+            dest[:] = array.reshape(-1).view(np.uint8)
+
+        return SharedArray(position, array.dtype, array.shape)
+
+    def read(self, descriptor):
+        """ Get a copy of an array stored in the ring.
+
+        Returns
+        -------
+        array : ndarray or None
+            Copy of the array, or None if the data have already been (even
+            partially) overwritten.
+
+        """
+        if not self.is_valid(descriptor):
+            return None
+
+        dtype = np.dtype(descriptor.dtype)
+        count = int(np.prod(descriptor.shape))
+        offset = HEADER_SIZE + descriptor.position % self.capacity
+        array = np.frombuffer(self._mmap, dtype, count, offset).copy()
+        # The writer reserves the space before writing so if the data are
+        # still valid after the copy they were not modified during it.
+        if not self.is_valid(descriptor):
+            return None
+        return array.reshape(descriptor.shape)
+
+    def is_valid(self, descriptor):
+        """ Check that the data referenced by a descriptor were not
+        overwritten.
+
+        """
+        return int(self._header[0]) <= descriptor.position + self.capacity
+
+    def close(self):
+        """ Release the mapping and remove the backing file if we created it.
+
+        """
+        if self._mmap is None:
+            return
+        self._header = None
+        self._mmap.close()
+        self._mmap = None
+        if self.owner:
+            try:
+                os.remove(self.path)
+            except OSError:
+                # On Windows the file cannot be removed while another process
+                # still maps it.
+                logger = logging.getLogger(__name__)
+                mes = 'Failed to remove the shared buffer file {}'
+                logger.warning(mes.format(self.path), exc_info=True)
+
+    def __getstate__(self):
+        return {'capacity': self.capacity, 'path': self.path}
+
+    def __setstate__(self, state):
+        self.capacity = state['capacity']
+        self.path = state['path']
+        self.owner = False
+        self._open()
+
+    # --- Private API ---------------------------------------------------------
+
+    def _open(self):
+        """ Map the backing file in memory.
+
+        """
+        with open(self.path, 'r+b') as f:
+            self._mmap = mmap.mmap(f.fileno(), HEADER_SIZE + self.capacity)
+        self._header = np.frombuffer(self._mmap, np.uint64, 1, 0)
+        self._lock = Lock()
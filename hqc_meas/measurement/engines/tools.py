@@ -5,57 +5,161 @@
 # license : MIT license
 #==============================================================================
 import logging
-from threading import Thread
+from threading import Thread, Lock, Event
 from Queue import Empty
 from multiprocessing.queues import Queue
-from atom.api import Atom, Coerced, Typed
+from atom.api import Atom, Coerced, Typed, Float, Dict, Value, Int
+import numpy as np
 from hqc_meas.tasks.tools.task_database import TaskDatabase
+from .shared_buffer import SharedArray
+
+
+#: Name used in place of an entry path for news holding several updates. The
+#: value of such news is a dict mapping entries paths to their new value.
+BATCH_NEWS = '__batch__'
 
 
 class MeasureSpy(Atom):
     """ Spy observing a task database and sending values update into a queue.
 
+    If flush_period is strictly positive the updates are not sent immediately
+    but coalesced (only the latest value of each entry is kept) and sent as a
+    single batched news every flush_period seconds.
+
+    If a shared_buffer is provided, arrays bigger than shared_threshold are
+    copied into it and only their descriptor is sent through the queue.
+
     """
     observed_entries = Coerced(set)
     observed_database = Typed(TaskDatabase)
     queue = Typed(Queue)
 
-    def __init__(self, queue, observed_entries, observed_database):
+    #: Time in seconds between two flushes of the coalesced updates. If zero
+    #: each update is sent as soon as it occurs.
+    flush_period = Float()
+
+    #: SharedArrayBuffer used to transfer large arrays.
+    shared_buffer = Value()
+
+    #: Minimal size in bytes of the arrays sent through the shared buffer.
+    shared_threshold = Int(2**16)
+
+    def __init__(self, queue, observed_entries, observed_database,
+                 flush_period=0.0, shared_buffer=None):
         super(MeasureSpy, self).__init__()
         self.queue = queue
         self.observed_entries = set(observed_entries)
         self.observed_database = observed_database
-        self.observed_database.observe('notifier', self.enqueue_update)
+        self.flush_period = flush_period
+        self.shared_buffer = shared_buffer
+        if flush_period > 0:
+            self._lock = Lock()
+            self._stop = Event()
+            self._flush_thread = Thread(target=self._flush_loop)
+            self._flush_thread.daemon = True
+            self._flush_thread.start()
+            self.observed_database.observe('notifier', self.coalesce_update)
+        else:
+            self.observed_database.observe('notifier', self.enqueue_update)
 
     def enqueue_update(self, change):
         new = change['value']
         if new[0] in self.observed_entries:
-            self.queue.put_nowait(new)
+            self.queue.put_nowait((new[0], self._pack(new[1])))
+
+    def coalesce_update(self, change):
+        """ Store an update until the next flush, overriding older ones.
+
+        """
+        new = change['value']
+        if new[0] in self.observed_entries:
+            with self._lock:
+                self._pending[new[0]] = new[1]
+
+    def flush(self):
+        """ Send all the pending updates as a single batched news.
+
+        """
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+        if pending:
+            news = {k: self._pack(v) for k, v in pending.iteritems()}
+            self.queue.put_nowait((BATCH_NEWS, news))
 
     def close(self):
-        # Simply signal the queue the working thread that the spy won't send
-        # any more informations. But don't request the thread to exit this
-        # is the responsability of the engine.
+        # Send the last updates if necessary and simply signal the queue the
+        # working thread that the spy won't send any more informations. But
+        # don't request the thread to exit this is the responsability of the
+        # engine.
+        if self.flush_period > 0:
+            self.observed_database.unobserve('notifier', self.coalesce_update)
+            self._stop.set()
+            self._flush_thread.join()
+            self.flush()
+        else:
+            self.observed_database.unobserve('notifier', self.enqueue_update)
         self.queue.put(('', ''))
 
+    # --- Private API ---------------------------------------------------------
+
+    #: Updates waiting to be sent, only used when coalescing.
+    _pending = Dict()
+
+    #: Lock protecting the pending updates.
+    _lock = Value()
+
+    #: Event used to stop the flushing thread.
+    _stop = Value()
+
+    #: Thread periodically flushing the pending updates.
+    _flush_thread = Value()
+
+    def _pack(self, value):
+        """ Replace big arrays by a descriptor of their copy in shared memory.
+
+        """
+        buf = self.shared_buffer
+        if (buf is not None and isinstance(value, np.ndarray) and
+                value.nbytes >= self.shared_threshold):
+            descriptor = buf.write(value)
+            if descriptor is not None:
+                return descriptor
+        return value
+
+    def _flush_loop(self):
+        """ Flush the pending updates every flush_period until stopped.
+
+        """
+        while not self._stop.wait(self.flush_period):
+            self.flush()
+
 
 class ThreadMeasureMonitor(Thread):
     """ Thread sending a queue content to the news signal of a engine.
 
+    Batched news (see BATCH_NEWS) are emitted as is so that monitors can apply
+    them in one go. Arrays transferred through a shared buffer are replaced by
+    copies of the shared memory, updates whose data were already overwritten
+    are dropped.
+
     """
 
-    def __init__(self, engine, queue):
+    def __init__(self, engine, queue, shared_buffer=None):
         super(ThreadMeasureMonitor, self).__init__()
         self.queue = queue
         self.engine = engine
+        self.shared_buffer = shared_buffer
 
     def run(self):
         while True:
             try:
                 news = self.queue.get()
                 if news not in [(None, None), ('', '')]:
+                    news = self._unpack(news)
                     # Here news is a Signal not Event hence the syntax.
-                    self.engine.news(news)
+                    if news:
+                        self.engine.news(news)
                 elif news == ('', ''):
                     logger = logging.getLogger(__name__)
                     logger.debug('Spy closed')
@@ -63,3 +167,29 @@ class ThreadMeasureMonitor(Thread):
                     break
             except Empty:
                 continue
+
+    def _unpack(self, news):
+        """ Replace shared arrays descriptors by the actual arrays.
+
+        Returns None if nothing is left to notify.
+
+        """
+        if self.shared_buffer is None:
+            return news
+
+        read = self.shared_buffer.read
+        if news[0] == BATCH_NEWS:
+            values = {}
+            for entry, value in news[1].iteritems():
+                if isinstance(value, SharedArray):
+                    value = read(value)
+                    if value is None:
+                        continue
+                values[entry] = value
+            return (BATCH_NEWS, values) if values else None
+
+        elif isinstance(news[1], SharedArray):
+            value = read(news[1])
+            return (news[0], value) if value is not None else None
+
+        return news
@@ -78,7 +78,9 @@ class BaseMonitor(HasPrefAtom):
 
         This method will be connected to the news signal of the engine when
         the measure is started. The value received will be a tuple containing
-        the name of the updated database entry and its new value.
+        the name of the updated database entry and its new value. If the
+        name is BATCH_NEWS (see engines.tools) the value is a dict mapping
+        several entries to their new values.
 
         """
         mess = cleandoc('''This method should be implemented by subclasses of
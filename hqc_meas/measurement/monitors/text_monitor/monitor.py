@@ -15,6 +15,7 @@ with enaml.imports():
 from inspect import cleandoc
 from textwrap import fill
 
+from ...engines.tools import BATCH_NEWS
 from ..base_monitor import BaseMonitor
 from .entries import MonitoredEntry
 from .rules import AbstractMonitorRule
@@ -71,9 +72,20 @@ class TextMonitor(BaseMonitor):
     def process_news(self, news):
 
         values = self._database_values
-        values[news[0]] = news[1]
-        for updater in self.updaters[news[0]]:
-            updater(values)
+        if news[0] == BATCH_NEWS:
+            # Update all values first so that each updater is called once.
+            values.update(news[1])
+            updaters = []
+            for entry in news[1]:
+                for updater in self.updaters[entry]:
+                    if updater not in updaters:
+                        updaters.append(updater)
+            for updater in updaters:
+                updater(values)
+        else:
+            values[news[0]] = news[1]
+            for updater in self.updaters[news[0]]:
+                updater(values)
 
     def refresh_monitored_entries(self, entries={}):
         if not entries:
@@ -4,7 +4,7 @@
 # author : Matthieu Dartiailh
 # license : MIT license
 # =============================================================================
-from atom.api import (Int, Instance, Str, Dict, Bool, List,
+from atom.api import (Int, Instance, Str, Dict, Bool, Value,
                       ContainerList, set_default)
 from itertools import chain
 from inspect import cleandoc
@@ -12,11 +12,26 @@ from copy import deepcopy
 
 from hqc_meas.utils.atom_util import member_from_str
 from .contexts.base_context import BaseContext
+from .dependency_graph import DependencyGraph, Scope
 from .entry_eval import eval_entry
 from .item import Item
 from .pulse import Pulse
 
 
+def _same_value(old, new):
+    """ Check whether the value of a variable changed between two
+    compilations.
+
+    """
+    if old is new:
+        return True
+    try:
+        return type(old) is type(new) and bool(old == new)
+    except ValueError:
+        # Comparing arrays is ambiguous, simply consider they are different.
+        return False
+
+
 class BaseSequence(Item):
     """ Base class for all sequences.
 
@@ -42,7 +57,6 @@ class BaseSequence(Item):
 
         """
         self._evaluated_vars = {}
-        self._compiled = []
         for i in self.items:
             if isinstance(i, BaseSequence):
                 i.cleanup_cache()
@@ -173,12 +187,13 @@ class BaseSequence(Item):
     #: Dict of all already evaluated vars.
     _evaluated_vars = Dict()
 
-    #: List of already compiled items.
-    _compiled = List()
-
     def _compile_items(self, root_vars, sequence_locals, missings, errors):
         """ Compile the sequence in a flat list of pulses.
 
+        All the entries of the items hierarchy are collected in a dependency
+        graph so that each of them is evaluated exactly once, in an order
+        respecting the references between them.
+
         Parameters
         ----------
         root_vars : dict
@@ -203,65 +218,76 @@ class BaseSequence(Item):
             List of pulses in which all the string entries have been evaluated.
 
         """
+        graph, collectors = self._build_graph(root_vars, sequence_locals,
+                                              errors)
+        graph.run()
 
+        res, pulses = self._collect_pulses(graph, collectors, missings)
+        if res:
+            # Clean the compiled items once the pulse is transfered
+            self.cleanup_cache()
+        return res, pulses
 
-        # Inplace modification of compile will update self._compiled.
-        if not self._compiled:
-            self._compiled = [None for i in self.items if i.enabled]
-        compiled = self._compiled
+    def _build_graph(self, root_vars, sequence_locals, errors):
+        """ Build the dependency graph of the items of the sequence.
 
-        # Compilation of items in multiple passes.
-        while True:
-            miss = set()
+        Returns
+        -------
+        graph : DependencyGraph
+            Graph holding the nodes of all the items.
 
-            index = -1
-            for item in self.items:
-                # Skip disabled items
-                if not item.enabled:
-                    continue
+        collectors : list
+            Callables returning the pulses of each enabled item.
 
-                # Increment index so that we set the right object in compiled.
-                index += 1
+        """
+        graph = DependencyGraph(root_vars, sequence_locals, set(), errors)
+        collectors = [item._add_nodes(graph, graph.scope, None)
+                      for item in self.items if item.enabled]
+        return graph, collectors
 
-                # Skip evaluation if object has already been compiled.
-                if compiled[index] is not None:
-                    continue
+    def _collect_pulses(self, graph, collectors, missings):
+        """ Collect the pulses once the dependency graph has been evaluated.
 
-                # If we get a pulse simply evaluate the entries, to add their
-                # values to the locals and keep track of the missings to now
-                # when to abort compilation.
-                if isinstance(item, Pulse):
-                    success = item.eval_entries(root_vars, sequence_locals,
-                                                miss, errors)
-                    if success:
-                        compiled[index] = [item]
+        """
+        errors = graph.errors
+        if errors or graph.missings:
+            # Update the missings given by caller so that it knows it this
+            # failure is linked to circle references.
+            missings.update(graph.missings)
+            return False, []
 
-                # Here we got a sequence so we must try to compile it.
-                else:
-                    success, items = item.compile_sequence(root_vars,
-                                                           sequence_locals,
-                                                           miss, errors)
-                    if success:
-                        compiled[index] = items
-
-            known_locals = set(sequence_locals.keys())
-            # If none of the variables found missing during last pass is now
-            # known stop compilation as we now reached a dead end. Same if an
-            # error occured.
-            if errors or miss and (not known_locals & miss):
-                # Update the missings given by caller so that it knows it this
-                # failure is linked to circle references.
-                missings.update(miss)
-                return False, []
+        pulses = list(chain.from_iterable(c() for c in collectors))
+        # Sequences check their pulses when collecting them.
+        if errors:
+            return False, []
+
+        return True, pulses
+
+    def _add_nodes(self, graph, scope, guard):
+        """ Add the node compiling the sequence to a dependency graph.
+
+        By default a sequence is compiled as a whole by calling
+        compile_sequence once all the names referenced by its entries are
+        known.
 
-            # If no var was found missing during last pass (and as no error
-            # occured) it means the compilation succeeded.
-            elif not miss:
-                pulses = list(chain.from_iterable(compiled))
-                # Clean the compiled items once the pulse is transfered
-                self.cleanup_cache()
-                return True, pulses
+        """
+        prefix = '{}_'.format(self.index)
+        provides = [prefix + p for p in ('start', 'stop', 'duration')]
+
+        def evaluate(namespace):
+            res, pulses = self.compile_sequence(graph.root_vars, namespace,
+                                                graph.missings, graph.errors)
+            return pulses if res else None
+
+        node = graph.add_node(evaluate, scope, self._get_entries(), provides,
+                              guard=guard, owner=self)
+        return lambda: node.value or []
 
+    def _get_entries(self):
+        """ List the entries evaluated when compiling the sequence.
+
+        """
+        return [self.def_1, self.def_2] + self.local_vars.values()
 
     def _answer(self, members, callables):
         """ Collect answers for the walk method.
@@ -337,28 +363,9 @@ class Sequence(BaseSequence):
                                           missings, errors)
 
         if res:
-            if self.time_constrained:
-                # Check if start, stop and duration of sequence are compatible.
-                start_err = [pulse for pulse in pulses
-                             if pulse.start < self.start]
-                stop_err = [pulse for pulse in pulses
-                            if pulse.stop > self.stop]
-
-                if start_err:
-                    mess = cleandoc('''The start time of the following items {}
-                        is smaller than the start time of the sequence {}''')
-                    mess = mess.replace('\n', ' ')
-                    ind = [p.index for p in start_err]
-                    errors[self.name + '-start'] = mess.format(ind, self.index)
-                if stop_err:
-                    mess = cleandoc('''The stop time of the following items {}
-                        is larger than the stop time of the sequence {}''')
-                    mess = mess.replace('\n', ' ')
-                    ind = [p.index for p in stop_err]
-                    errors[self.name + '-stop'] = mess.format(ind, self.index)
-
-                if errors:
-                    return False, []
+            if self.time_constrained and not self._check_times(pulses,
+                                                               errors):
+                return False, []
 
             return True, pulses
 
@@ -402,6 +409,74 @@ class Sequence(BaseSequence):
     #: Last index used by the sequence.
     _last_index = Int()
 
+    def _add_nodes(self, graph, scope, guard):
+        """ Add the nodes needed to compile the sequence to a dependency graph.
+
+        The items of the sequence are directly added to the graph so that the
+        whole hierarchy is compiled at once.
+
+        """
+        prefix = '{}_'.format(self.index)
+
+        # Definition evaluation.
+        if self.time_constrained:
+            self._add_def_nodes(graph, scope, guard)
+
+        # Local vars are evaluated in the parent scope but are only visible
+        # from the items.
+        local_scope = Scope(scope)
+
+        def eval_local(name, formula):
+            def evaluate(namespace):
+                try:
+                    val = eval_entry(formula, namespace, graph.missings)
+                except Exception as e:
+                    graph.errors[prefix + name] = repr(e)
+                    return None
+                if val is not None:
+                    local_scope.values[name] = val
+                return val
+            return evaluate
+
+        for name, formula in self.local_vars.iteritems():
+            graph.add_node(eval_local(name, formula), scope, (formula,),
+                           (name,), local_scope, guard, owner=self)
+
+        collectors = [item._add_nodes(graph, local_scope, guard)
+                      for item in self.items if item.enabled]
+
+        def collect():
+            pulses = list(chain.from_iterable(c() for c in collectors))
+            if self.time_constrained:
+                self._check_times(pulses, graph.errors)
+            return pulses
+
+        return collect
+
+    def _check_times(self, pulses, errors):
+        """ Check the pulses fit between the start and stop of the sequence.
+
+        """
+        start_err = [pulse for pulse in pulses
+                     if pulse.start < self.start]
+        stop_err = [pulse for pulse in pulses
+                    if pulse.stop > self.stop]
+
+        if start_err:
+            mess = cleandoc('''The start time of the following items {}
+                is smaller than the start time of the sequence {}''')
+            mess = mess.replace('\n', ' ')
+            ind = [p.index for p in start_err]
+            errors[self.name + '-start'] = mess.format(ind, self.index)
+        if stop_err:
+            mess = cleandoc('''The stop time of the following items {}
+                is larger than the stop time of the sequence {}''')
+            mess = mess.replace('\n', ' ')
+            ind = [p.index for p in stop_err]
+            errors[self.name + '-stop'] = mess.format(ind, self.index)
+
+        return not (start_err or stop_err)
+
     def _observe_root(self, change):
         """ Observer passing the root to all children.
 
@@ -594,7 +669,7 @@ class RootSequence(Sequence):
         super(RootSequence, self).__init__(**kwargs)
         self.root = self
 
-    def compile_sequence(self, use_context=True):
+    def compile_sequence(self, use_context=True, incremental=False):
         """ Compile a sequence to useful format.
 
         Parameters
@@ -602,6 +677,14 @@ class RootSequence(Sequence):
         use_context : bool, optional
             Should the context compile the pulse sequence.
 
+        incremental : bool, optional
+            Reuse the result of the previous incremental compilation and only
+            re-evaluate the items depending on the variables whose value
+            changed (the context is then asked to update only the modified
+            pulses). This assumes that the sequence itself was not edited
+            since the last call, a non incremental call discards the state
+            kept between calls.
+
         Returns
         -----------
         result : bool
@@ -619,37 +702,57 @@ class RootSequence(Sequence):
         """
         missings = set()
         errors = {}
-        root_vars = self.external_vars.copy()
-
-        # Local vars computation.
-        for name, formula in self.local_vars.iteritems():
-            if name not in self._evaluated_vars:
-                try:
-                    val = eval_entry(formula, root_vars, missings)
-                    self._evaluated_vars[name] = val
-                except Exception as e:
-                    errors['root_' + name] = repr(e)
-
-        root_vars.update(self._evaluated_vars)
-
-        if self.time_constrained:
-            try:
-                duration = eval_entry(self.sequence_duration, root_vars,
-                                      missings)
-                root_vars['sequence_end'] = duration
-            except Exception as e:
-                errors['root_seq_duration'] = repr(e)
+        root_vars = self._eval_root_vars(missings, errors)
+
+        state = self._incremental_state
+        self._incremental_state = None
+        if incremental and state and not errors and\
+                set(state[2]) == set(root_vars):
+            graph, collectors, values, in_context = state
+            changed = {k: v for k, v in root_vars.iteritems()
+                       if not _same_value(v, values[k])}
+            values = root_vars
+            graph.missings = set()
+            graph.errors = errors
+            nodes = graph.update(changed)
+            res, pulses = self._collect_pulses(graph, collectors, missings)
+
+            # If only pulses were affected the context can update its
+            # previous result.
+            modified = [] if in_context or not use_context else None
+            owners = set()
+            for node in nodes:
+                owner = node.owner
+                if modified is None or owner in owners:
+                    continue
+                if not isinstance(owner, Pulse):
+                    modified = None
+                else:
+                    owners.add(owner)
+                    modified.append(owner)
 
-        res, pulses = self._compile_items(root_vars, root_vars,
-                                          missings, errors)
+        else:
+            values = root_vars.copy()
+            graph, collectors = self._build_graph(root_vars, root_vars,
+                                                  errors)
+            graph.run()
+            res, pulses = self._collect_pulses(graph, collectors, missings)
+            modified = None
 
         if not res:
             return False, (missings, errors)
 
+        self.cleanup_cache()
+        if incremental:
+            self._incremental_state = (graph, collectors, values,
+                                       use_context)
+
         if self.time_constrained:
+            duration = root_vars['sequence_end']
             err = [p for p in pulses if p.stop > duration]
 
             if err:
+                self._incremental_state = None
                 mess = cleandoc('''The stop time of the following pulses {}
                         is larger than the duration of the sequence.''')
                 ind = [p.index for p in err]
@@ -663,9 +766,10 @@ class RootSequence(Sequence):
             kwargs = {}
             if self.time_constrained:
                 kwargs['sequence_duration'] = duration
-            return self.context.compile_sequence(pulses, **kwargs)
-            
-            
+            if modified is None:
+                return self.context.compile_sequence(pulses, **kwargs)
+            return self.context.update_sequence(pulses, modified, **kwargs)
+
     def compile_loop(self, use_context=True):
         """ Compile a sequence to useful format.
 
@@ -691,26 +795,7 @@ class RootSequence(Sequence):
         """
         missings = set()
         errors = {}
-        root_vars = self.external_vars.copy()
-
-        # Local vars computation.
-        for name, formula in self.local_vars.iteritems():
-            if name not in self._evaluated_vars:
-                try:
-                    val = eval_entry(formula, root_vars, missings)
-                    self._evaluated_vars[name] = val
-                except Exception as e:
-                    errors['root_' + name] = repr(e)
-
-        root_vars.update(self._evaluated_vars)
-
-        if self.time_constrained:
-            try:
-                duration = eval_entry(self.sequence_duration, root_vars,
-                                      missings)
-                root_vars['sequence_end'] = duration
-            except Exception as e:
-                errors['root_seq_duration'] = repr(e)
+        root_vars = self._eval_root_vars(missings, errors)
 
         res, pulses = self._compile_items(root_vars, root_vars,
                                           missings, errors)
@@ -719,6 +804,7 @@ class RootSequence(Sequence):
             return False, (missings, errors), None
 
         if self.time_constrained:
+            duration = root_vars['sequence_end']
             err = [p for p in pulses if p.stop > duration]
 
             if err:
@@ -837,6 +923,38 @@ class RootSequence(Sequence):
 
     # --- Private API ---------------------------------------------------------
 
+    #: State kept between incremental compilations: dependency graph, pulses
+    #: collectors, values of the root variables and whether the context
+    #: compiled the last result.
+    _incremental_state = Value()
+
+    def _eval_root_vars(self, missings, errors):
+        """ Evaluate the external and local vars and the sequence duration.
+
+        """
+        root_vars = self.external_vars.copy()
+
+        # Local vars computation (they can depend on the external vars so
+        # they are always evaluated).
+        local_vars = {}
+        for name, formula in self.local_vars.iteritems():
+            try:
+                local_vars[name] = eval_entry(formula, root_vars, missings)
+            except Exception as e:
+                errors['root_' + name] = repr(e)
+
+        root_vars.update(local_vars)
+
+        if self.time_constrained:
+            try:
+                duration = eval_entry(self.sequence_duration, root_vars,
+                                      missings)
+                root_vars['sequence_end'] = duration
+            except Exception as e:
+                errors['root_seq_duration'] = repr(e)
+
+        return root_vars
+
     def _answer(self, members, callables):
         """
 
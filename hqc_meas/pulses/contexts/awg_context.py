@@ -7,9 +7,92 @@
 """
 
 """
-from atom.api import Float, observe, set_default
+from atom.api import Float, Value, observe, set_default
+from hashlib import md5
 import numpy as np
+
 from .base_context import BaseContext, TIME_CONVERSION
+from ..pulse import compute_waveforms
+
+
+def waveform_digest(waveform):
+    """ Compute a digest identifying the content of a waveform.
+
+    Parameters
+    ----------
+    waveform : ndarray or bytearray
+        Samples (or encoded samples) of the waveform.
+
+    Returns
+    -------
+    digest : str
+        Digest of the type and content of the waveform.
+
+    """
+    if isinstance(waveform, np.ndarray):
+        waveform = np.ascontiguousarray(waveform)
+        return waveform.dtype.str + md5(waveform).digest()
+    return md5(waveform).digest()
+
+
+#: Number of points converted at once when packing samples.
+PACKING_CHUNK = 2**16
+
+
+def pack_samples(analog, m1, m2, out, invert_m1=False, invert_m2=False):
+    """ Pack analogical values and markers in the 16 bits format of the AWGs.
+
+    The analogical value occupies the 14 lower bits, the first marker the
+    fifteenth bit and the second marker the last one. The conversion is done
+    by chunks so that no temporary array as large as the inputs is needed.
+
+    Parameters
+    ----------
+    analog : ndarray
+        Analogical values as unsigned 16 bits integers.
+
+    m1, m2 : ndarray
+        Values (0 or 1) of the markers.
+
+    out : ndarray
+        Little-endian unsigned 16 bits array in which to write the result.
+        It is typically a view on the bytearray sent to the instrument.
+
+    invert_m1, invert_m2 : bool, optional
+        Whether or not to invert the markers.
+
+    """
+    length = len(out)
+    tmp = np.empty(min(length, PACKING_CHUNK), dtype=np.uint16)
+    for lo in xrange(0, length, PACKING_CHUNK):
+        hi = min(lo + PACKING_CHUNK, length)
+        chunk = out[lo:hi]
+        aux = tmp[:hi - lo]
+        chunk[:] = analog[lo:hi]
+        for marker, invert, bit in ((m1, invert_m1, 2**14),
+                                    (m2, invert_m2, 2**15)):
+            if invert:
+                np.subtract(1, marker[lo:hi], out=aux, casting='unsafe')
+                aux *= bit
+            else:
+                np.multiply(marker[lo:hi], bit, out=aux, casting='unsafe')
+            chunk += aux
+
+
+def packed_buffer(length):
+    """ Allocate the bytearray holding packed samples.
+
+    Returns
+    -------
+    buffer : bytearray
+        Bytearray of 2*length bytes.
+
+    view : ndarray
+        Little-endian unsigned 16 bits array sharing its memory with buffer.
+
+    """
+    buf = bytearray(2*length)
+    return buf, np.frombuffer(buf, dtype='<u2')
 
 
 class AWGContext(BaseContext):
@@ -49,26 +132,15 @@ class AWGContext(BaseContext):
             or the traceback of the issues in case of failure.
 
         """
-        sequence_duration = max([pulse.stop for pulse in pulses])
-        # Total length of the sequence to send to the AWG
-        if 'sequence_duration' in kwargs:
-            if sequence_duration <= kwargs['sequence_duration']:
-                sequence_duration = kwargs['sequence_duration']
-            else:
-                return False, {'Sequence_duration':
-                               'Not all pulses fit in given duration'}
+        self._last_sequence = None
+        sequence_length = self._sequence_length(pulses, kwargs)
+        if sequence_length is None:
+            return False, {'Sequence_duration':
+                           'Not all pulses fit in given duration'}
 
         # Collect the channels used in the pulses' sequence
         used_channels = set([pulse.channel[:3] for pulse in pulses])
 
-        # Coefficient to convert the start and stop of pulses in second and
-        # then in index integer for array
-        time_to_index = TIME_CONVERSION[self.time_unit]['s'] * \
-            self.sampling_frequency
-
-        # Length of the sequence
-        sequence_length = int(round(sequence_duration * time_to_index))
-
         # create 3 array for each used_channels
         array_analog = {}
         array_M1 = {}
@@ -81,72 +153,104 @@ class AWGContext(BaseContext):
             array_M1[channel] = np.zeros(sequence_length, dtype=np.int8)
             # numpy array for marker2 init False. For AWG M2 = 0 = off
             array_M2[channel] = np.zeros(sequence_length, dtype=np.int8)
+        arrays = {'A': array_analog, 'M1': array_M1, 'M2': array_M2}
 
-        for pulse in pulses:
-
-            waveform = pulse.waveform
-            channel = pulse.channel[:3]
-            channeltype = pulse.channel[4:]
-
-            start_index = int(round(pulse.start*time_to_index))
-            stop_index = start_index + len(waveform)
-
-            if channeltype == 'A' and pulse.kind == 'Analogical':
-#                array_analog[channel][start_index:stop_index] +=\
-#                    np.rint(8191*waveform)
-                array_analog[channel][start_index:stop_index] +=\
-                    (np.rint(8191*waveform)).astype(np.uint16)
-            elif channeltype == 'M1' and pulse.kind == 'Logical':
-                array_M1[channel][start_index:stop_index] += waveform
-            elif channeltype == 'M2' and pulse.kind == 'Logical':
-                array_M2[channel][start_index:stop_index] += waveform
-            else:
+        contributions = {}
+        waveforms = compute_waveforms(pulses, self)
+        for pulse, waveform in zip(pulses, waveforms):
+            contribution = self._pulse_contribution(pulse, waveform)
+            if contribution is None:
                 msg = 'Selected channel does not match kind for pulse {} ({}).'
                 return False, {'Kind issue':
                                msg.format(pulse.index,
                                           (pulse.kind, pulse.channel))}
+            channel, channeltype, start_index, samples = contribution
+            stop_index = start_index + len(samples)
+            arrays[channeltype][channel][start_index:stop_index] += samples
+            contributions[pulse] = contribution
 
         # Check the overflows
         traceback = {}
         for channel in used_channels:
-            analog = array_analog[channel]
-            if analog.max() > 16383 or analog.min() < 0:
-                mes = 'Analogical values out of range.'
-                traceback['{}_A'.format(channel)] = mes
-
-            elif array_M1[channel].max() > 1 or array_M1[channel].min() < 0:
-                mes = 'Overflow in marker 1.'
-                traceback['{}_M1'.format(channel)] = mes
-
-            elif array_M2[channel].max() > 1 or array_M2[channel].min() < 0:
-                mes = 'Overflow in marker 2.'
-                traceback['{}_M2'.format(channel)] = mes
+            self._check_overflow(arrays, channel, 0, sequence_length,
+                                 traceback)
 
         if traceback:
             return False, traceback
 
-        # Invert marked logical channels.
-        for i_ch in self.inverted_log_channels:
-            ch, m = i_ch.split('_')
-            if m == 'M1':
-                np.logical_not(array_M1[ch], array_M1[ch])
-            else:
-                np.logical_not(array_M2[ch], array_M2[ch])
-
         # Byte arrays to send to the AWG
         to_send = {}
         for channel in used_channels:
-            # Convert to sixteen bits integers
-            array = array_analog[channel] +\
-                array_M1[channel]*(2**14) + array_M2[channel]*(2**15)
-            # Creating and filling a byte array for each channel.
-            aux = np.empty(2*sequence_length, dtype=np.uint8)
-            aux[::2] = array % 2**8
-            aux[1::2] = array // 2**8
-            to_send[int(channel[-1])] = bytearray(aux)
-
-        return True, to_send
-        
+            buf, view = packed_buffer(sequence_length)
+            self._pack(arrays, channel, 0, sequence_length, view)
+            to_send[int(channel[-1])] = buf
+
+        self._last_sequence = (sequence_length, arrays, contributions,
+                               to_send)
+        return True, to_send.copy()
+
+    def update_sequence(self, pulses, modified, **kwargs):
+        """ Update the last compiled sequence after some pulses changed.
+
+        The samples of the modified pulses are removed from the channel
+        buffers kept from the last compilation and the new ones are added.
+        Only the affected part of the byte arrays is regenerated, in copies
+        of the bytearrays of the modified channels so that the ones returned
+        by the previous calls are left untouched.
+
+        """
+        cached = self._last_sequence
+        sequence_length = self._sequence_length(pulses, kwargs)
+        if cached is None or sequence_length != cached[0]:
+            return self.compile_sequence(pulses, **kwargs)
+
+        _, arrays, contributions, to_send = cached
+        regions = {}
+        for pulse in modified:
+            if pulse not in contributions or\
+                    pulse.channel[:3] not in arrays['A']:
+                return self.compile_sequence(pulses, **kwargs)
+
+        waveforms = compute_waveforms(modified, self)
+        for pulse, waveform in zip(modified, waveforms):
+            contribution = self._pulse_contribution(pulse, waveform)
+            if contribution is None:
+                self._last_sequence = None
+                msg = 'Selected channel does not match kind for pulse {} ({}).'
+                return False, {'Kind issue':
+                               msg.format(pulse.index,
+                                          (pulse.kind, pulse.channel))}
+
+            for sign, (channel, channeltype, start_index, samples) in\
+                    ((-1, contributions[pulse]), (1, contribution)):
+                stop_index = start_index + len(samples)
+                array = arrays[channeltype][channel]
+                if sign > 0:
+                    array[start_index:stop_index] += samples
+                else:
+                    array[start_index:stop_index] -= samples
+                lo, hi = regions.get(channel, (start_index, stop_index))
+                regions[channel] = (min(lo, start_index),
+                                    max(hi, stop_index))
+
+            contributions[pulse] = contribution
+
+        traceback = {}
+        for channel, (lo, hi) in regions.iteritems():
+            self._check_overflow(arrays, channel, lo, hi, traceback)
+
+        if traceback:
+            self._last_sequence = None
+            return False, traceback
+
+        for channel, (lo, hi) in regions.iteritems():
+            buf = bytearray(to_send[int(channel[-1])])
+            view = np.frombuffer(buf, dtype='<u2')
+            self._pack(arrays, channel, lo, hi, view[lo:hi])
+            to_send[int(channel[-1])] = buf
+
+        return True, to_send.copy()
+
     def merge_intervals(self,intervals, sequence_length):
         if intervals[0][0] <= 256:
             intervals[0] = (1, intervals[0][1])
@@ -210,8 +314,8 @@ class AWGContext(BaseContext):
 
         # intervals are places that have pulses on at least one  channel
         intervals = []     
-        for pulse in pulses:
-            waveform = pulse.waveform
+        waveforms = compute_waveforms(pulses, self)
+        for pulse, waveform in zip(pulses, waveforms):
             start_index = int(round(pulse.start*time_to_index))
             stop_index = start_index + len(waveform)
             intervals.append((start_index, stop_index))
@@ -305,8 +409,7 @@ class AWGContext(BaseContext):
                     array_M1[channel].append(mzrem)                    
                     array_M2[channel].append(mzrem)                 
 
-        for pulse in pulses:
-            waveform = pulse.waveform
+        for pulse, waveform in zip(pulses, waveforms):
             channel = pulse.channel[:3]
             channeltype = pulse.channel[4:]
 
@@ -362,29 +465,115 @@ class AWGContext(BaseContext):
                 for waveform in array_M2[ch]:
                     np.logical_not(waveform, waveform)
 
-        # Byte arrays to send to the AWG
+        # Byte arrays to send to the AWG. Identical segments (on any channel)
+        # are identified by the digest of their content and encoded once.
         bytes = {}
         already_added = {}
+        already_packed = {}
         for channel in used_channels:
             bytes[int(channel[-1])] = []
             for i in range(len(array_analog[channel])):
-                addr = id(array_analog[channel][i])
-                if addr in already_added:
-                    added = already_added[addr]
-                    bytes[int(channel[-1])].append(added)
-                    
+                segment = (array_analog[channel][i], array_M1[channel][i],
+                           array_M2[channel][i])
+                # Blocks shared between segments (zeros) are packed once.
+                addr = tuple(id(a) for a in segment)
+                if addr in already_packed:
+                    bytes[int(channel[-1])].append(already_packed[addr])
+                    continue
+
+                byteadded, view = packed_buffer(len(segment[0]))
+                pack_samples(*segment, out=view)
+                digest = waveform_digest(byteadded)
+                if digest in already_added:
+                    byteadded = already_added[digest]
                 else:
-                    waveform_new = array_analog[channel][i] + array_M1[channel][i]*(2**14) +\
-                    array_M2[channel][i]*(2**15)
-                    aux = np.empty(2*len(waveform_new), dtype=np.uint8)
-                    aux[::2] = waveform_new % 2**8
-                    aux[1::2] = waveform_new // 2**8
-                    byteadded = bytearray(aux)
-                    bytes[int(channel[-1])].append(byteadded)
-                    already_added[addr] = byteadded
+                    already_added[digest] = byteadded
+                bytes[int(channel[-1])].append(byteadded)
+                already_packed[addr] = byteadded
 
         return True, bytes, repeats
 
+    # --- Private API ---------------------------------------------------------
+
+    #: Buffers of the last compiled sequence used to perform incremental
+    #: updates : (length, arrays, contributions of the pulses, bytearrays).
+    _last_sequence = Value()
+
+    def _sequence_length(self, pulses, kwargs):
+        """ Compute the number of points of the sequence.
+
+        Returns None if the pulses do not fit in the specified duration.
+
+        """
+        sequence_duration = max([pulse.stop for pulse in pulses])
+        # Total length of the sequence to send to the AWG
+        if 'sequence_duration' in kwargs:
+            if sequence_duration <= kwargs['sequence_duration']:
+                sequence_duration = kwargs['sequence_duration']
+            else:
+                return None
+
+        # Coefficient to convert the start and stop of pulses in second and
+        # then in index integer for array
+        time_to_index = TIME_CONVERSION[self.time_unit]['s'] * \
+            self.sampling_frequency
+
+        return int(round(sequence_duration * time_to_index))
+
+    def _pulse_contribution(self, pulse, waveform):
+        """ Compute the samples a pulse adds to a channel.
+
+        Returns
+        -------
+        contribution : tuple or None
+            Tuple (channel, channel type, start index, samples) or None if
+            the kind of the pulse does not match the channel.
+
+        """
+        time_to_index = TIME_CONVERSION[self.time_unit]['s'] * \
+            self.sampling_frequency
+
+        channel = pulse.channel[:3]
+        channeltype = pulse.channel[4:]
+        start_index = int(round(pulse.start*time_to_index))
+
+        if channeltype == 'A' and pulse.kind == 'Analogical':
+            samples = (np.rint(8191*waveform)).astype(np.uint16)
+        elif channeltype in ('M1', 'M2') and pulse.kind == 'Logical':
+            samples = waveform
+        else:
+            return None
+
+        return channel, channeltype, start_index, samples
+
+    def _check_overflow(self, arrays, channel, lo, hi, traceback):
+        """ Check the values of a channel in a given range.
+
+        """
+        analog = arrays['A'][channel][lo:hi]
+        m1 = arrays['M1'][channel][lo:hi]
+        m2 = arrays['M2'][channel][lo:hi]
+        if analog.max() > 16383 or analog.min() < 0:
+            mes = 'Analogical values out of range.'
+            traceback['{}_A'.format(channel)] = mes
+
+        elif m1.max() > 1 or m1.min() < 0:
+            mes = 'Overflow in marker 1.'
+            traceback['{}_M1'.format(channel)] = mes
+
+        elif m2.max() > 1 or m2.min() < 0:
+            mes = 'Overflow in marker 2.'
+            traceback['{}_M2'.format(channel)] = mes
+
+    def _pack(self, arrays, channel, lo, hi, out):
+        """ Pack a range of the values of a channel in the AWG format.
+
+        """
+        pack_samples(arrays['A'][channel][lo:hi], arrays['M1'][channel][lo:hi],
+                     arrays['M2'][channel][lo:hi], out,
+                     channel + '_M1' in self.inverted_log_channels,
+                     channel + '_M2' in self.inverted_log_channels)
+
     def _get_sampling_time(self):
         """ Getter for the sampling time prop of BaseContext.
 
@@ -56,6 +56,25 @@ class BaseContext(HasPrefAtom):
                        BaseContext.''')
         raise NotImplementedError(mes)
 
+    def update_sequence(self, pulses, modified, **kwargs):
+        """ Update the result of the last call to compile_sequence after
+        some pulses were modified.
+
+        Subclasses can reuse the previous result and only regenerate the
+        samples of the modified pulses. By default the whole sequence is
+        compiled again.
+
+        Parameters
+        ----------
+        pulses : list(Pulse)
+            Complete list of pulses of the sequence.
+
+        modified : list(Pulse)
+            Pulses whose parameters changed since the last compilation.
+
+        """
+        return self.compile_sequence(pulses, **kwargs)
+
     def len_sample(self, duration):
         """ Compute the number of points used to describe a lapse of time.
 
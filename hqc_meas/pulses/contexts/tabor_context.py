@@ -10,6 +10,8 @@
 from atom.api import Float, observe, set_default
 import numpy as np
 from .base_context import BaseContext, TIME_CONVERSION
+from .awg_context import pack_samples, packed_buffer
+from ..pulse import compute_waveforms
 
 
 class TABORContext(BaseContext):
@@ -85,9 +87,9 @@ class TABORContext(BaseContext):
             # numpy array for marker2 init False. For AWG M2 = 0 = off
             array_M2[channel] = np.zeros(sequence_length, dtype=np.int8)
 
-        for pulse in pulses:
+        waveforms = compute_waveforms(pulses, self)
+        for pulse, waveform in zip(pulses, waveforms):
 
-            waveform = pulse.waveform
             channel = pulse.channel[:3]
             channeltype = pulse.channel[4:]
 
@@ -126,27 +128,16 @@ class TABORContext(BaseContext):
         if traceback:
             return False, traceback
 
-        # Invert marked logical channels.
-        for i_ch in self.inverted_log_channels:
-            ch, m = i_ch.split('_')
-            if m == 'M1':
-                np.logical_not(array_M1[ch], array_M1[ch])
-            else:
-                np.logical_not(array_M2[ch], array_M2[ch])
-
-        # Byte arrays to send to the AWG
+        # Byte arrays to send to the AWG (the marked logical channels are
+        # inverted when packing).
+        inverted = self.inverted_log_channels
         to_send = {}
         for channel in used_channels:
-            # Convert to sixteen bits integers
-            array = array_analog[channel]+\
-                array_M1[channel]*(2**14) + array_M2[channel]*(2**15)
-            # Creating and filling a byte array for each channel.
-            aux = np.empty(2*sequence_length, dtype=np.uint8)
-            aux[::2] = array % 2**8
-            aux[1::2] = array // 2**8
-
-            to_send[int(channel[-1])] = bytearray(aux)
- #           print((array_analog[channel] + 2**13) % 2**14)
+            buf, view = packed_buffer(sequence_length)
+            pack_samples(array_analog[channel], array_M1[channel],
+                         array_M2[channel], view, channel + '_M1' in inverted,
+                         channel + '_M2' in inverted)
+            to_send[int(channel[-1])] = buf
 
         return True, to_send
 
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+# =============================================================================
+# module : pulses/dependency_graph.py
+# author : Matthieu Dartiailh
+# license : MIT license
+# =============================================================================
+""" Dependency graph used to compile a sequence in a single pass.
+
+Each entry which needs to be evaluated during the compilation (a definition,
+a local variable, a condition, ...) is represented by a node knowing the names
+it references and the names it provides. Once all the nodes of a sequence
+hierarchy have been collected the references are resolved into edges, the
+graph is sorted topologically and each node is evaluated exactly once.
+
+Nodes taking part into a circular reference are never evaluated and the
+names forming the cycles are reported as missing. Nodes whose guard is not met
+are not evaluated either and the names they provide are left unknown.
+
+Once evaluated the graph can be kept to re-evaluate only the nodes depending
+on the initially known values which changed (see DependencyGraph.update).
+
+"""
+from collections import deque
+
+from .entry_eval import referenced_names
+
+
+class Scope(object):
+    """ Variables visible from the items of a sequence.
+
+    Parameters
+    ----------
+    parent : Scope, optional
+        Scope of the parent sequence.
+
+    values : dict, optional
+        Already known values. Other values are added as the nodes providing
+        them are evaluated.
+
+    """
+    __slots__ = ('parent', 'values', 'providers')
+
+    def __init__(self, parent=None, values=None):
+        self.parent = parent
+        self.values = values if values is not None else {}
+        self.providers = {}
+
+
+class Node(object):
+    """ Unit of evaluation in the dependency graph.
+
+    """
+    __slots__ = ('func', 'scope', 'names', 'provides', 'target', 'guard',
+                 'after', 'owner', 'value', 'requires', 'dependents',
+                 'pending')
+
+    def __init__(self, func, scope, names, provides, target, guard, after,
+                 owner):
+        self.func = func
+        self.scope = scope
+        self.names = names
+        self.provides = provides
+        self.target = target
+        self.guard = guard
+        self.after = after
+        self.owner = owner
+        self.value = None
+        #: List of (name, provider) pairs, name is None for ordering only
+        #: dependencies.
+        self.requires = []
+        self.dependents = []
+        self.pending = 0
+
+
+class DependencyGraph(object):
+    """ Graph of the evaluations needed to compile a sequence.
+
+    Parameters
+    ----------
+    root_vars : dict
+        Global variables, the i_start/stop/duration provided by the nodes are
+        stored into it.
+
+    sequence_locals : dict
+        Variables known when starting the compilation.
+
+    missings : set
+        Set in which the names which cannot be found are stored.
+
+    errors : dict
+        Dict in which the evaluation errors are stored.
+
+    """
+
+    def __init__(self, root_vars, sequence_locals, missings, errors):
+        self.root_vars = root_vars
+        self.missings = missings
+        self.errors = errors
+        self.scope = Scope(values=sequence_locals)
+        self.nodes = []
+        self._providers = {}
+        self._users = {}
+        self._order = {}
+
+    def add_node(self, func, scope, entries=(), provides=(), target=None,
+                 guard=None, after=(), owner=None):
+        """ Add a node to the graph.
+
+        Parameters
+        ----------
+        func : callable
+            Callable evaluating the node. It is called with a dict holding
+            the known values of the referenced names and its return value is
+            stored as the value of the node.
+
+        scope : Scope
+            Scope in which the entries are evaluated.
+
+        entries : iterable, optional
+            Entries evaluated by the node.
+
+        provides : iterable, optional
+            Names whose value is known once the node has been evaluated.
+
+        target : Scope, optional
+            Scope to which the provided names belong. By default the names are
+            global (ie visible from the whole hierarchy).
+
+        guard : Node, optional
+            Node whose value must be True for this node to be evaluated (used
+            to skip the content of a conditional sequence).
+
+        after : iterable, optional
+            Nodes which must be evaluated before this one.
+
+        owner : Item, optional
+            Item whose attributes are set when evaluating the node.
+
+        Returns
+        -------
+        node : Node
+            Newly created node.
+
+        """
+        after = list(after)
+        if guard is not None:
+            after.append(guard)
+        provides = tuple(provides)
+        node = Node(func, scope, referenced_names(*entries), provides, target,
+                    guard, after, owner)
+        providers = target.providers if target else self._providers
+        for name in provides:
+            providers[name] = node
+        self.nodes.append(node)
+        return node
+
+    def run(self):
+        """ Evaluate all the nodes in dependency order.
+
+        Returns
+        -------
+        cycles : set
+            Names involved in circular references (also added to missings).
+
+        """
+        self._link()
+
+        order = self._order
+        ready = deque(n for n in self.nodes if not n.pending)
+        while ready:
+            node = ready.popleft()
+            order[node] = len(order)
+            self._evaluate(node)
+            for dependent in node.dependents:
+                dependent.pending -= 1
+                if not dependent.pending:
+                    ready.append(dependent)
+
+        cycles = self._find_cycles()
+        self.missings.update(cycles)
+        return cycles
+
+    def update(self, values):
+        """ Re-evaluate the nodes affected by a change of the known values.
+
+        This should only be called on a graph which has already been run
+        without any circular reference.
+
+        Parameters
+        ----------
+        values : dict
+            New values of some of the variables known when starting the
+            compilation.
+
+        Returns
+        -------
+        nodes : list
+            Re-evaluated nodes, in evaluation order.
+
+        """
+        self.scope.values.update(values)
+
+        users = self._users
+        dirty = set()
+        stack = [n for name in values for n in users.get(name, ())]
+        while stack:
+            node = stack.pop()
+            if node not in dirty:
+                dirty.add(node)
+                stack.extend(node.dependents)
+
+        nodes = sorted(dirty, key=self._order.get)
+        for node in nodes:
+            self._evaluate(node)
+        return nodes
+
+    # --- Private API ---------------------------------------------------------
+
+    def _link(self):
+        """ Resolve the names referenced by each node into edges.
+
+        """
+        global_providers = self._providers
+        users = self._users
+        for node in self.nodes:
+            requires = node.requires
+            for name in node.names:
+                scope = node.scope
+                provider = None
+                while scope is not None and provider is None:
+                    provider = scope.providers.get(name)
+                    scope = scope.parent
+                if provider is None:
+                    provider = global_providers.get(name)
+                if provider is not None:
+                    requires.append((name, provider))
+                else:
+                    users.setdefault(name, []).append(node)
+            requires.extend((None, n) for n in node.after)
+
+            for provider in set(p for _, p in requires):
+                provider.dependents.append(node)
+                node.pending += 1
+
+    def _evaluate(self, node):
+        """ Evaluate a node, unless its guard prevents it.
+
+        A node which is not evaluated forgets the values it may have provided
+        during a previous evaluation so that its dependents behave as if it
+        had never been evaluated.
+
+        """
+        guard = node.guard
+        if guard is not None and guard.value is not True:
+            node.value = None
+            values = node.target.values if node.target else self.root_vars
+            for name in node.provides:
+                values.pop(name, None)
+            return
+
+        root_vars = self.root_vars
+        namespace = {}
+        for name in node.names:
+            scope = node.scope
+            while scope is not None:
+                if name in scope.values:
+                    namespace[name] = scope.values[name]
+                    break
+                scope = scope.parent
+            else:
+                if name in root_vars:
+                    namespace[name] = root_vars[name]
+
+        node.value = node.func(namespace)
+
+    def _find_cycles(self):
+        """ Identify the names forming circular references.
+
+        The nodes which could not be evaluated are either part of a cycle or
+        depend on one. The later are pruned (starting from the nodes on which
+        nothing depends) and the names linking the remaining nodes are
+        returned.
+
+        """
+        left = set(n for n in self.nodes if n.pending)
+        if not left:
+            return set()
+
+        counts = dict.fromkeys(left, 0)
+        for node in left:
+            for provider in set(p for _, p in node.requires):
+                if provider in left:
+                    counts[provider] += 1
+
+        sinks = deque(n for n in left if not counts[n])
+        while sinks:
+            node = sinks.popleft()
+            left.discard(node)
+            for provider in set(p for _, p in node.requires):
+                if provider in left:
+                    counts[provider] -= 1
+                    if not counts[provider]:
+                        sinks.append(provider)
+
+        return set(name for node in left for name, provider in node.requires
+                   if name is not None and provider in left)
@@ -12,6 +12,8 @@ from inspect import cleandoc
 from textwrap import fill
 from future.utils import exec_
 
+from ..utils.eval_cache import compile_expr
+
 
 EVALUATER_TOOLTIP = '\n'.join([
     fill(cleandoc("""In this field you can enter a text and
@@ -26,62 +28,104 @@ EVALUATER_TOOLTIP = '\n'.join([
     "- pi is available as Pi"])
 
 
-def eval_entry(string, seq_locals, missing_locals):
-    """
+#: Maximal number of parsed entries kept in memory.
+PARSED_ENTRIES_MAXSIZE = 4096
+
+#: Cache of the parsed entries, {string: (expr, names)}.
+_PARSED_ENTRIES = {}
+
+
+def parse_entry(string):
+    """ Split an entry into an expression and the names it references.
+
+    The references (delimited by '{' and '}') are replaced by tokens '_ai'
+    where i is the position of the reference in names. The result is cached
+    as the same entries are parsed at each compilation.
+
+    Parameters
+    ----------
+    string : str
+        Entry to parse.
+
+    Returns
+    -------
+    expr : str
+        Expression in which the references have been replaced by tokens.
+
+    names : tuple
+        Names referenced by the entry in order of appearance.
 
     """
+    try:
+        return _PARSED_ENTRIES[string]
+    except KeyError:
+        pass
+
     aux_strings = string.split('{')
     if len(aux_strings) > 1:
         elements = [el for aux in aux_strings
                     for el in aux.split('}')]
+        names = tuple(elements[1::2])
 
-        missing = [el for el in elements[1::2] if el not in seq_locals]
-        if missing:
-            missing_locals.update(set(missing))
-            return None
-
-        replacement_token = ['_a{}'.format(i)
-                             for i in xrange(len(elements[1::2]))]
-        replacement_values = {'_a{}'.format(i): seq_locals[key]
-                              for i, key in enumerate(elements[1::2])}
-
+        replacement_token = ['_a{}'.format(i) for i in xrange(len(names))]
         str_to_eval = ''.join(key + '{}' for key in elements[::2])
         str_to_eval = str_to_eval[:-2]
 
         expr = str_to_eval.format(*replacement_token)
     else:
-        replacement_values = {}
+        names = ()
         expr = string
 
-    return eval(expr, globals(), replacement_values)
+    # Crude bound on the memory used, entries are short and this should only
+    # happen when scanning many sequences.
+    if len(_PARSED_ENTRIES) >= PARSED_ENTRIES_MAXSIZE:
+        _PARSED_ENTRIES.clear()
+    _PARSED_ENTRIES[string] = (expr, names)
+    return expr, names
 
 
-def exec_entry(string, seq_locals, missing_locals):
+def referenced_names(*strings):
+    """ Get the set of names referenced by some entries.
+
     """
+    return set(name for string in strings
+               for name in parse_entry(string)[1])
 
+
+def eval_entry(string, seq_locals, missing_locals):
     """
-    aux_strings = string.split('{')
-    if len(aux_strings) > 1:
-        elements = [el for aux in aux_strings
-                    for el in aux.split('}')]
 
-        missing = [el for el in elements[1::2] if el not in seq_locals]
+    """
+    expr, names = parse_entry(string)
+    if names:
+        missing = [el for el in names if el not in seq_locals]
         if missing:
             missing_locals.update(set(missing))
             return None
 
-        replacement_token = ['_a{}'.format(i)
-                             for i in xrange(len(elements[1::2]))]
         replacement_values = {'_a{}'.format(i): seq_locals[key]
-                              for i, key in enumerate(elements[1::2])}
+                              for i, key in enumerate(names)}
+    else:
+        replacement_values = {}
 
-        str_to_eval = ''.join(key + '{}' for key in elements[::2])
-        str_to_eval = str_to_eval[:-2]
+    return eval(compile_expr(expr), globals(), replacement_values)
 
-        expr = str_to_eval.format(*replacement_token)
+
+def exec_entry(string, seq_locals, missing_locals):
+    """
+
+    """
+    expr, names = parse_entry(string)
+    if names:
+        missing = [el for el in names if el not in seq_locals]
+        if missing:
+            missing_locals.update(set(missing))
+            return None
+
+        replacement_values = {'_a{}'.format(i): seq_locals[key]
+                              for i, key in enumerate(names)}
     else:
         replacement_values = {}
-        expr = string
 
     exec_(expr, locs=replacement_values)
     return locals()
@@ -94,89 +94,169 @@ class Item(HasPrefAtom):
             Boolean indicating whether or not the evaluation succeeded.
 
         """
-        # Flag indicating good completion.
-        success = True
+        # Evaluation of the first parameter.
+        par1, par2 = self._def_names()
+        d1 = self._eval_def(1, sequence_locals, missings, errors)
+        if d1 is not None:
+            self._publish(par1, d1, root_vars, sequence_locals)
 
-        # Reference to the sequence context.
-        context = self.root.context
+        # Evaluation of the second parameter.
+        d2 = self._eval_def(2, sequence_locals, missings, errors)
+        if d2 is not None and self._check_defs(d1, d2, errors):
+            self._publish(par2, d2, root_vars, sequence_locals)
+        else:
+            d2 = None
 
-        # Name of the parameter which will be evaluated.
-        par1 = self.def_mode.split('/')[0].lower()
-        par2 = self.def_mode.split('/')[1].lower()
-        prefix = '{}_'.format(self.index)
+        if d1 is None or d2 is None:
+            return False
 
-        # Evaluation of the first parameter.
-        d1 = None
+        # Computation of the third parameter.
+        self._complete_defs(d1, d2, root_vars, sequence_locals)
+        return True
+
+    # --- Private API ---------------------------------------------------------
+
+    def _default_item_class(self):
+        """ Default value for the item_class member.
+
+        """
+        return self.__class__.__name__
+
+    def _def_names(self):
+        """ Names of the parameters set by def_1 and def_2.
+
+        """
+        par1, par2 = self.def_mode.split('/')
+        return par1.lower(), par2.lower()
+
+    def _eval_def(self, i, sequence_locals, missings, errors):
+        """ Evaluate one of the definitions and check its value makes sense.
+
+        Parameters
+        ----------
+        i : {1, 2}
+            Index of the definition to evaluate.
+
+        Returns
+        -------
+        value : float or None
+            Value of the definition or None if the evaluation failed.
+
+        """
+        par = self._def_names()[i - 1]
+        key = '{}_'.format(self.index) + par
         try:
-            d1 = eval_entry(self.def_1, sequence_locals, missings)
-            d1 = context.check_time(d1)
+            value = eval_entry(getattr(self, 'def_{}'.format(i)),
+                               sequence_locals, missings)
+            value = self.root.context.check_time(value)
         except Exception as e:
-            errors[prefix + par1] = repr(e)
-
-        # Check the value makes sense as a start time or duration.
-        if d1 is not None and d1 >= 0 and (par1 == 'start' or d1 != 0):
-            setattr(self, par1, d1)
-            root_vars[prefix + par1] = d1
-            sequence_locals[prefix + par1] = d1
-        elif d1 is None:
-            success = False
+            errors[key] = repr(e)
+            return None
+
+        if value is None:
+            return None
+
+        if par == 'start' and value < 0:
+            errors[key] = 'Got a strictly negative value for start: {}'.format(
+                value)
+        elif par == 'duration' and value <= 0:
+            errors[key] = 'Got a negative value for duration: {}'.format(value)
+        elif par == 'stop' and value <= 0.0:
+            errors[key] = 'Got a negative or null value for stop: {}'.format(
+                value)
         else:
-            success = False
-            if par1 == 'start':
-                m = 'Got a strictly negative value for start: {}'.format(d1)
+            return value
 
-            else:
-                m = 'Got a negative value for duration: {}'.format(d1)
+        return None
 
-            errors[prefix + par1] = m
+    def _check_defs(self, d1, d2, errors):
+        """ Check the stop value is larger than the first parameter.
 
-        # Evaluation of the second parameter.
-        d2 = None
-        try:
-            d2 = eval_entry(self.def_2, sequence_locals, missings)
-            d2 = context.check_time(d2)
-        except Exception as e:
-            errors[prefix + par2] = repr(e)
-
-        # Check the value makes sense as a duration or stop time.
-        if d2 is not None and d2 > 0 and (par2 == 'duration' or d2 > d1):
-            setattr(self, par2, d2)
-            root_vars[prefix + par2] = d2
-            sequence_locals[prefix + par2] = d2
-        elif d2 is None:
-            success = False
+        """
+        if self._def_names()[1] == 'stop' and d1 is not None and d2 <= d1:
+            m = 'Got a stop smaller than start: {} < {}'.format(d1, d2)
+            errors['{}_stop'.format(self.index)] = m
+            return False
+        return True
+
+    def _complete_defs(self, d1, d2, *namespaces):
+        """ Compute the parameter not specified by the definitions.
+
+        """
+        if self.def_mode == 'Start/Duration':
+            self._publish('stop', d1 + d2, *namespaces)
+        elif self.def_mode == 'Start/Stop':
+            self._publish('duration', d2 - d1, *namespaces)
         else:
-            success = False
-            if par2 == 'stop' and d2 <= 0.0:
-                m = 'Got a negative or null value for stop: {}'.format(d2)
-            elif par2 == 'stop':
-                m = 'Got a stop smaller than start: {} < {}'.format(d1, d2)
-            elif d2 <= 0.0:
-                m = 'Got a negative value for duration: {}'.format(d2)
+            self._publish('start', d2 - d1, *namespaces)
 
-            errors[prefix + par2] = m
+    def _publish(self, par, value, *namespaces):
+        """ Set the value of a parameter and make it known in the namespaces.
 
-        # Computation of the third parameter.
-        if success:
-            if self.def_mode == 'Start/Duration':
-                self.stop = d1 + d2
-                root_vars[prefix + 'stop'] = self.stop
-                sequence_locals[prefix + 'stop'] = self.stop
-            elif self.def_mode == 'Start/Stop':
-                self.duration = d2 - d1
-                root_vars[prefix + 'duration'] = self.duration
-                sequence_locals[prefix + 'duration'] = self.duration
-            else:
-                self.start = d2 - d1
-                root_vars[prefix + 'start'] = self.start
-                sequence_locals[prefix + 'start'] = self.start
-
-        return success
+        """
+        setattr(self, par, value)
+        key = '{}_'.format(self.index) + par
+        for namespace in namespaces:
+            namespace[key] = value
 
-    # --- Private API ---------------------------------------------------------
+    def _add_def_nodes(self, graph, scope, guard):
+        """ Add the nodes evaluating def_1 and def_2 to a dependency graph.
 
-    def _default_item_class(self):
-        """ Default value for the item_class member.
+        Returns
+        -------
+        node : Node
+            Node computing the third parameter once both definitions are
+            known, its value is True if all parameters are valid.
 
         """
-        return self.__class__.__name__
+        prefix = '{}_'.format(self.index)
+        par1, par2 = self._def_names()
+        par3 = ({'start', 'stop', 'duration'} - {par1, par2}).pop()
+
+        def eval_def(i, par):
+            def evaluate(namespace):
+                value = self._eval_def(i, namespace, graph.missings,
+                                       graph.errors)
+                if value is not None:
+                    self._publish(par, value, graph.root_vars)
+                return value
+            return evaluate
+
+        first = graph.add_node(eval_def(1, par1), scope, (self.def_1,),
+                               (prefix + par1,), guard=guard, owner=self)
+        second = graph.add_node(eval_def(2, par2), scope, (self.def_2,),
+                                (prefix + par2,), guard=guard, owner=self)
+
+        def complete(namespace):
+            d1, d2 = first.value, second.value
+            if d1 is None or d2 is None or\
+                    not self._check_defs(d1, d2, graph.errors):
+                return False
+            self._complete_defs(d1, d2, graph.root_vars)
+            return True
+
+        return graph.add_node(complete, scope, provides=(prefix + par3,),
+                              guard=guard, after=(first, second), owner=self)
+
+    def _add_nodes(self, graph, scope, guard):
+        """ Add the nodes needed to compile the item to a dependency graph.
+
+        Parameters
+        ----------
+        graph : DependencyGraph
+            Graph to which the nodes should be added.
+
+        scope : Scope
+            Scope of the parent sequence.
+
+        guard : Node or None
+            Node conditioning the evaluation of the item.
+
+        Returns
+        -------
+        collect : callable
+            Callable returning the list of compiled pulses once the graph has
+            been successfully evaluated.
+
+        """
+        raise NotImplementedError()
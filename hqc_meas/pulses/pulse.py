@@ -10,6 +10,7 @@ import numpy as np
 from hqc_meas.utils.atom_util import member_from_str
 from .shapes.base_shapes import AbstractShape
 from .shapes.modulation import Modulation
+from .waveform_cache import WAVEFORM_CACHE
 from item import Item
 
 
@@ -152,16 +153,125 @@ class Pulse(Item):
 
         return answers
 
+    def _add_nodes(self, graph, scope, guard):
+        """ Add the nodes evaluating the pulse entries to a dependency graph.
+
+        The modulation and shape entries are evaluated in a single node
+        depending on all the names they reference.
+
+        """
+        self._add_def_nodes(graph, scope, guard)
+
+        if self.kind == 'Analogical':
+            entries = []
+            for obj in (self.modulation, self.shape):
+                if obj is None or not getattr(obj, 'activated', True):
+                    continue
+                for name, member in obj.members().iteritems():
+                    meta = member.metadata
+                    value = getattr(obj, name)
+                    if meta and 'pref' in meta and\
+                            isinstance(value, basestring):
+                        entries.append(value)
+
+            def evaluate(namespace):
+                missings, errors = graph.missings, graph.errors
+                success = self.modulation.eval_entries(namespace, missings,
+                                                       errors, self.index)
+                success &= self.shape.eval_entries(namespace, missings,
+                                                   errors, self.index)
+                return success
+
+            graph.add_node(evaluate, scope, entries, guard=guard, owner=self)
+
+        return lambda: [self]
+
     def _get_waveform(self):
         """ Getter for the waveform property.
 
         """
-        context = self.root.context
-        n_points = context.len_sample(self.duration)
-        if self.kind == 'Analogical':
-            time = np.linspace(self.start, self.stop, n_points, False)
-            mod = self.modulation.compute(time, context.time_unit)
-            shape = self.shape.compute(time, context.time_unit)
-            return mod*shape
-        else:
-            return np.ones(n_points, dtype=np.int8)
+        return compute_waveforms([self], self.root.context)[0]
+
+
+def compute_waveforms(pulses, context):
+    """ Compute the waveforms of several pulses at once.
+
+    Identical analogical pulses share the same waveform which is looked up in
+    the waveform cache. The missing waveforms are computed with one vectorized
+    call per shape and modulation classes over the concatenated time arrays of
+    the pulses.
+
+    Parameters
+    ----------
+    pulses : list(Pulse)
+        Compiled pulses whose waveforms should be computed.
+
+    context : BaseContext
+        Context used to compile the pulses.
+
+    Returns
+    -------
+    waveforms : list(ndarray)
+        Waveforms of the pulses in the same order as the pulses.
+
+    """
+    unit = context.time_unit
+    sampling_time = context.sampling_time
+    waveforms = [None]*len(pulses)
+
+    # Pulses whose waveform must be computed grouped by shape and modulation
+    # classes. Each entry is (cache key, representative pulse, number of
+    # points, indexes of the pulses sharing the waveform).
+    pending = {}
+    entries = {}
+    for i, pulse in enumerate(pulses):
+        n_points = context.len_sample(pulse.duration)
+        if pulse.kind != 'Analogical':
+            waveforms[i] = np.ones(n_points, dtype=np.int8)
+            continue
+
+        key = None
+        shape_key = pulse.shape.cache_key()
+        if shape_key is not None:
+            key = (shape_key, pulse.modulation.cache_key(pulse.start, unit),
+                   pulse.duration, n_points, sampling_time, unit)
+            if key in entries:
+                entries[key][3].append(i)
+                continue
+            waveform = WAVEFORM_CACHE.lookup(key)
+            if waveform is not None:
+                waveforms[i] = waveform
+                continue
+
+        if n_points == 0:
+            waveforms[i] = np.zeros(0)
+            continue
+
+        entry = (key, pulse, n_points, [i])
+        if key is not None:
+            entries[key] = entry
+        classes = (type(pulse.shape), type(pulse.modulation))
+        pending.setdefault(classes, []).append(entry)
+
+    for (shape_class, mod_class), group in pending.iteritems():
+        _, group_pulses, lengths, _ = zip(*group)
+        lengths = np.array(lengths)
+        starts = np.array([p.start for p in group_pulses])
+        steps = np.array([p.stop - p.start for p in group_pulses])/lengths
+        offsets = np.cumsum(lengths) - lengths
+        points = np.arange(lengths.sum()) - np.repeat(offsets, lengths)
+        time = points*np.repeat(steps, lengths) + np.repeat(starts, lengths)
+
+        shapes = [p.shape for p in group_pulses]
+        modulations = [p.modulation for p in group_pulses]
+        values = (mod_class.compute_batch(modulations, time, lengths, unit) *
+                  shape_class.compute_batch(shapes, time, lengths, unit))
+
+        for (key, _, n_points, indexes), lo in zip(group, offsets):
+            waveform = values[lo:lo + n_points]
+            if key is not None:
+                waveform = WAVEFORM_CACHE.store(key, waveform.copy())
+            for i in indexes:
+                waveforms[i] = waveform
+
+    return waveforms
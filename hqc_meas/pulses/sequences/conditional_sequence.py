@@ -74,4 +74,34 @@ class ConditionalSequence(Sequence):
         else:
             return True, []
 
+    # --- Private API ---------------------------------------------------------
+
+    def _add_nodes(self, graph, scope, guard):
+        """ Add the nodes needed to compile the sequence to a dependency graph.
+
+        The condition is evaluated first and the nodes of the items are only
+        evaluated if it is met.
+
+        """
+        local = '{}_'.format(self.index) + 'condition'
+
+        def evaluate(namespace):
+            try:
+                cond = eval_entry(self.condition, namespace, graph.missings)
+            except Exception as e:
+                graph.errors[local] = repr(e)
+                return None
+
+            if cond is None:
+                return None
+            cond = bool(cond)
+            graph.root_vars[local] = cond
+            return cond
+
+        condition = graph.add_node(evaluate, scope, (self.condition,),
+                                   (local,), guard=guard, owner=self)
+        collect = super(ConditionalSequence, self)._add_nodes(graph, scope,
+                                                              condition)
+        return lambda: collect() if condition.value else []
+
 SEQUENCES = [ConditionalSequence]
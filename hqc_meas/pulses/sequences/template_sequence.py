@@ -197,6 +197,13 @@ class TemplateSequence(BaseSequence):
 
     # --- Private API ---------------------------------------------------------
 
+    def _get_entries(self):
+        """ List the entries evaluated when compiling the sequence.
+
+        """
+        return (super(TemplateSequence, self)._get_entries() +
+                self.template_vars.values())
+
     def _observe_context(self, change):
         """ Make sure the context has a ref to the sequence.
 
@@ -62,6 +62,55 @@ class AbstractShape(HasPrefAtom):
         """
         raise NotImplementedError('')
 
+    @classmethod
+    def compute_batch(cls, shapes, time, lengths, unit):
+        """ Computes the shapes of several pulses at once.
+
+        The default implementation simply calls compute for each shape.
+        Subclasses can override it to perform a single vectorized
+        computation.
+
+        Parameters
+        ----------
+        shapes : list
+            Shapes (instances of this class) of the pulses.
+
+        time : ndarray
+            Concatenation of the times at which to compute each shape.
+
+        lengths : ndarray
+            Number of points of each pulse in the time array (non zero).
+
+        unit : str
+            Unit in which the time is expressed.
+
+        Returns
+        -------
+        shape : ndarray
+            Concatenation of the amplitudes of the pulses.
+
+        """
+        bounds = np.concatenate(([0], np.cumsum(lengths)))
+        return np.concatenate([shape.compute(time[lo:hi], unit)
+                               for shape, lo, hi in zip(shapes, bounds[:-1],
+                                                        bounds[1:])])
+
+    def cache_key(self):
+        """ Hashable description of the evaluated shape.
+
+        The result of compute for a given key must only depend on the time
+        elapsed since the start of the pulse. Shapes not satisfying this
+        condition should return None (the default), their waveforms are then
+        never cached.
+
+        Returns
+        -------
+        key : tuple or None
+            Key identifying the shape or None if it cannot be cached.
+
+        """
+        return None
+
     def _default_shape_class(self):
         return type(self).__name__
 
@@ -139,6 +188,20 @@ class SquareShape(AbstractShape):
         """
         return self._amplitude*np.ones(len(time))
 
+    @classmethod
+    def compute_batch(cls, shapes, time, lengths, unit):
+        """ Computes the shapes of several square pulses at once.
+
+        """
+        amplitudes = np.array([shape._amplitude for shape in shapes])
+        return np.repeat(amplitudes, lengths)
+
+    def cache_key(self):
+        """ Hashable description of the evaluated shape.
+
+        """
+        return (type(self).__name__, self._amplitude)
+
     # --- Private API ---------------------------------------------------------
 
     _amplitude = FloatRange(-1.0, 1.0, 1.0)
@@ -215,6 +278,23 @@ class GaussianShape(AbstractShape):
         """
         return self._amplitude*np.exp(-np.square(time-(time[0]+time[-1])/2)/(2*self._width**2))
 
+    @classmethod
+    def compute_batch(cls, shapes, time, lengths, unit):
+        """ Computes the shapes of several gaussian pulses at once.
+
+        """
+        last = np.cumsum(lengths) - 1
+        centers = np.repeat((time[last - lengths + 1] + time[last])/2, lengths)
+        amplitudes = np.repeat([shape._amplitude for shape in shapes], lengths)
+        widths = np.repeat([shape._width for shape in shapes], lengths)
+        return amplitudes*np.exp(-np.square(time - centers)/(2*widths**2))
+
+    def cache_key(self):
+        """ Hashable description of the evaluated shape.
+
+        """
+        return (type(self).__name__, self._amplitude, self._width)
+
     # --- Private API ---------------------------------------------------------
 
     _amplitude = FloatRange(-1.0, 1.0, 1.0)
@@ -297,6 +377,13 @@ class GaussianEdgeShape(AbstractShape):
         
         return self._amplitude*out
 
+    def cache_key(self):
+        """ Hashable description of the evaluated shape.
+
+        """
+        return (type(self).__name__, self._amplitude,
+                self._edge_width)
+
     # --- Private API ---------------------------------------------------------
 
     _amplitude = FloatRange(-1.0, 1.0, 1.0)
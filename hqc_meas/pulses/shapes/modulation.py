@@ -16,6 +16,10 @@ FREQ_TIME_UNIT_MAP = {'s': {'Hz': 1, 'kHz': 1000, 'MHz': 1e6, 'GHz': 1e9},
                       'mus': {'Hz': 1e-6, 'kHz': 1e-3, 'MHz': 1, 'GHz': 1e3},
                       'ns': {'Hz': 1e-9, 'kHz': 1e-6, 'MHz': 1e-3, 'GHz': 1}}
 
+#: Number of decimals of the start phase (in rad) used to identify a
+#: modulation in the waveform cache.
+KEY_PHASE_DIGITS = 10
+
 
 class Modulation(HasPrefAtom):
     """ Modulation to apply to the pulse.
@@ -128,18 +132,94 @@ class Modulation(HasPrefAtom):
         if not self.activated:
             return 1
 
-        unit_corr = 2*Pi*FREQ_TIME_UNIT_MAP[unit][self.frequency_unit]
-        phase = self._phase
-        if self.phase_unit == 'deg':
-            phase *= Pi/180
+        pulsation, phase = self._pulsation_and_phase(unit)
 
         if self.kind == 'sin':
-            return np.sin(unit_corr*self._frequency*time + phase)
+            return np.sin(pulsation*time + phase)
         else:
-            return np.cos(unit_corr*self._frequency*time + phase)
+            return np.cos(pulsation*time + phase)
+
+    @classmethod
+    def compute_batch(cls, modulations, time, lengths, unit):
+        """ Computes the modulations of several pulses at once.
+
+        Parameters
+        ----------
+        modulations : list
+            Modulations of the pulses.
+
+        time : ndarray
+            Concatenation of the times at which to compute each modulation.
+
+        lengths : ndarray
+            Number of points of each pulse in the time array.
+
+        unit : str
+            Unit in which the time is expressed.
+
+        Returns
+        -------
+        modulation : ndarray
+            Concatenation of the values by which to multiply the shapes.
+
+        """
+        out = np.ones(len(time))
+        params = [mod._pulsation_and_phase(unit) if mod.activated
+                  else (0.0, 0.0) for mod in modulations]
+        pulsations, phases = np.array(params, dtype=float).reshape(-1, 2).T
+        for kind, func in (('sin', np.sin), ('cos', np.cos)):
+            selected = [mod.activated and mod.kind == kind
+                        for mod in modulations]
+            if not any(selected):
+                continue
+            mask = np.repeat(selected, lengths)
+            arg = np.repeat(pulsations, lengths)[mask]*time[mask] +\
+                np.repeat(phases, lengths)[mask]
+            out[mask] = func(arg)
+
+        return out
+
+    def cache_key(self, start, unit):
+        """ Hashable description of the modulation seen from a pulse start.
+
+        Two pulses whose modulations have the same key are modulated in the
+        same way relatively to their start.
+
+        Parameters
+        ----------
+        start : float
+            Start time of the pulse.
+
+        unit : str
+            Unit in which the time is expressed.
+
+        Returns
+        -------
+        key : tuple or None
+            Kind, pulsation and phase at the start of the pulse or None if the
+            modulation is not activated.
+
+        """
+        if not self.activated:
+            return None
+
+        pulsation, phase = self._pulsation_and_phase(unit)
+        start_phase = (pulsation*start + phase) % (2*Pi)
+        return (self.kind, pulsation, round(start_phase, KEY_PHASE_DIGITS))
 
     # --- Private API ---------------------------------------------------------
 
+    def _pulsation_and_phase(self, unit):
+        """ Compute the pulsation (in rad per unit) and the phase in rad.
+
+        """
+        pulsation = 2*Pi*FREQ_TIME_UNIT_MAP[unit][self.frequency_unit] *\
+            self._frequency
+        phase = self._phase
+        if self.phase_unit == 'deg':
+            phase *= Pi/180
+        return pulsation, phase
+
     _frequency = Float()
 
     _phase = Float()
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+# =============================================================================
+# module : pulses/waveform_cache.py
+# author : Matthieu Dartiailh
+# license : MIT license
+# =============================================================================
+""" Process wide cache of the waveforms computed for analogical pulses.
+
+A waveform only depends on the shape and its evaluated parameters, on the
+modulation parameters (the phase being taken at the start of the pulse), on
+the duration of the pulse and on the sampling. Identical pulses (pi pulses,
+readout tones, ...) hence only need to be computed once per session.
+
+"""
+from collections import OrderedDict
+from threading import Lock
+
+
+class _WaveformCache(object):
+    """ Bounded LRU cache of waveform arrays.
+
+    The cache is bounded by the total number of bytes held by the arrays.
+    Cached arrays are made read-only as they are shared between all the
+    pulses of the process.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        Memory budget of the cache in bytes.
+
+    """
+
+    def __init__(self, max_bytes=64*2**20):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._waveforms = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, compute):
+        """ Get the waveform corresponding to a key.
+
+        Parameters
+        ----------
+        key : tuple
+            Hashable description of the waveform.
+
+        compute : callable
+            Function called without arguments to compute the waveform when it
+            is not in the cache.
+
+        Returns
+        -------
+        waveform : ndarray
+            Read-only waveform array.
+
+        """
+        waveform = self.lookup(key)
+        if waveform is None:
+            waveform = self.store(key, compute())
+        return waveform
+
+    def lookup(self, key):
+        """ Get the waveform corresponding to a key if it is in the cache.
+
+        Parameters
+        ----------
+        key : tuple
+            Hashable description of the waveform.
+
+        Returns
+        -------
+        waveform : ndarray or None
+            Read-only waveform array or None if the key is not in the cache.
+
+        """
+        with self._lock:
+            waveform = self._waveforms.pop(key, None)
+            if waveform is not None:
+                self._waveforms[key] = waveform
+                self.hits += 1
+            else:
+                self.misses += 1
+            return waveform
+
+    def store(self, key, waveform):
+        """ Add a computed waveform to the cache.
+
+        Parameters
+        ----------
+        key : tuple
+            Hashable description of the waveform.
+
+        waveform : ndarray
+            Waveform array. It is made read-only.
+
+        Returns
+        -------
+        waveform : ndarray
+            The waveform array.
+
+        """
+        waveform.flags.writeable = False
+        size = waveform.nbytes
+        if size > self.max_bytes:
+            return waveform
+
+        with self._lock:
+            old = self._waveforms.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._waveforms[key] = waveform
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, dropped = self._waveforms.popitem(last=False)
+                self.nbytes -= dropped.nbytes
+
+        return waveform
+
+    def stats(self):
+        """ Get the usage statistics of the cache.
+
+        Returns
+        -------
+        stats : dict
+            Number of hits, misses and entries and number of bytes held.
+
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'entries': len(self._waveforms), 'nbytes': self.nbytes,
+                    'max_bytes': self.max_bytes}
+
+    def clear(self):
+        """ Empty the cache and reset the statistics.
+
+        """
+        with self._lock:
+            self._waveforms.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+
+
+#: Cache shared by all the pulses of the process.
+WAVEFORM_CACHE = _WaveformCache()
@@ -353,6 +353,63 @@ class BaseTask(Atom):
     #: Only used in running mode.
     _eval_cache = Dict()
 
+    #: Dictionary mapping the task entries (short names) to the database slots
+    #: used to write them. Only used in running mode.
+    _write_slots = Dict()
+
+    #: Dictionary mapping full entry names to the database slots used to read
+    #: them. Only used in running mode.
+    _read_slots = Dict()
+
+    def _bind_database_slots(self):
+        """ Resolve once for all the database slots of the task entries.
+
+        This is called when checking the task and does nothing if the database
+        is not yet in running mode.
+
+        """
+        database = self.task_database
+        if not database or not database.running:
+            return
+
+        slots = {}
+        for entry in self.task_database_entries:
+            try:
+                slots[entry] = database.get_slot(self.task_path,
+                                                 self.task_name + '_' + entry)
+            except KeyError:
+                pass
+        self._write_slots = slots
+        self._read_slots = {}
+
+    def _write_in_database(self, name, value):
+        """ Write a task entry in the database using slots when possible.
+
+        """
+        slots = self._write_slots
+        if name in slots:
+            slots[name].set(value)
+            return False
+
+        value_name = self.task_name + '_' + name
+        return self.task_database.set_value(self.task_path, value_name, value)
+
+    def _get_from_database(self, full_name):
+        """ Read a database entry using slots in running mode.
+
+        """
+        slots = self._read_slots
+        if full_name in slots:
+            return slots[full_name].get()
+
+        database = self.task_database
+        if database.running:
+            slot = database.get_slot(self.task_path, full_name)
+            slots[full_name] = slot
+            return slot.get()
+
+        return database.get_value(self.task_path, full_name)
+
     def _default_task_class(self):
         """ Default value for the task_class member.
 
@@ -419,11 +476,13 @@ class SimpleTask(BaseTask):
     loopable = False
 
     def check(self, *args, **kwargs):
-        """ Empty check allowing super to call this method and not raise any
+        """ Check allowing super to call this method and not raise any
         NotImplementedError.
 
-        """
+        In running mode this binds the database slots used by the task.
 
+        """
+        self._bind_database_slots()
         return True, {}
 
     def write_in_database(self, name, value):
@@ -443,8 +502,7 @@ class SimpleTask(BaseTask):
             Value to give to the entry.
 
         """
-        value_name = self.task_name + '_' + name
-        return self.task_database.set_value(self.task_path, value_name, value)
+        return self._write_in_database(name, value)
 
     def get_from_database(self, full_name):
         """ Access to a database value using full name.
@@ -457,7 +515,7 @@ class SimpleTask(BaseTask):
             the database.
 
         """
-        return self.task_database.get_value(self.task_path, full_name)
+        return self._get_from_database(full_name)
 
     def remove_from_database(self, full_name):
         """ Delete a database entry using its full name.
@@ -569,7 +627,10 @@ class ComplexTask(BaseTask):
     def check(self, *args, **kwargs):
         """ Run test of all child tasks.
 
+        In running mode this also binds the database slots used by the task.
+
         """
+        self._bind_database_slots()
         test = True
         traceback = {}
         for name in tagged_members(self, 'child'):
@@ -633,8 +694,7 @@ class ComplexTask(BaseTask):
             Value to give to the entry.
 
         """
-        value_name = self.task_name + '_' + name
-        return self.task_database.set_value(self.task_path, value_name, value)
+        return self._write_in_database(name, value)
 
     def get_from_database(self, full_name):
         """ Access to a database value using full name.
@@ -647,7 +707,7 @@ class ComplexTask(BaseTask):
             the database.
 
         """
-        return self.task_database.get_value(self.task_path, full_name)
+        return self._get_from_database(full_name)
 
     def remove_from_database(self, full_name):
         """ Delete a database entry using its full name.
@@ -1301,6 +1361,11 @@ class RootTask(ComplexTask):
     #: Dict storing data needed at execution time (ex: drivers classes)
     run_time = Dict()
 
+    #: Number of locks protecting the database in running mode (see
+    #: TaskDatabase.lock_stripes). Using more than one lock is useful when
+    #: parallel tasks write often into the database.
+    lock_stripes = Int(1).tag(pref=True)
+
     #: Inter-process event signaling the task it should stop execution.
     should_stop = Instance(Event)
 
@@ -1468,6 +1533,12 @@ class RootTask(ComplexTask):
             self.task_database.set_value('root', 'default_path',
                                          self.default_path)
 
+    def _observe_lock_stripes(self, change):
+        """ Pass the number of locks to the database.
+
+        """
+        self.task_database.lock_stripes = max(1, change['value'])
+
     def _observe_task_name(self, change):
         """ Update the label any time the task name changes.
 
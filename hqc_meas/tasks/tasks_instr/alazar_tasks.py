@@ -53,6 +53,10 @@ class DemodAlazarTask(InstrumentTask):
     trigrange = Enum('2.5V','5V').tag(pref=True)
 
     triglevel = Str('0.3').tag(pref=True)
+
+    # Floating point type used to process the data, float32 is faster and
+    # uses half the memory.
+    precision = Enum('float64', 'float32').tag(pref=True)
     
     parallel = set_default({'activated': False, 'pool': 'acq'})
 
@@ -204,7 +208,8 @@ class DemodAlazarTask(InstrumentTask):
         answerDemod, answerTrace = self.driver.get_demod(startaftertrig, duration,
                                        recordsPerCapture, recordsPerBuffer,
                                        timestep, freq, self.average,
-                                       NdemodA, NdemodB, NtraceA, NtraceB)
+                                       NdemodA, NdemodB, NtraceA, NtraceB,
+                                       self.precision)
 
         self.write_in_database('Demod', answerDemod)
         self.write_in_database('Trace', answerTrace)
@@ -6,13 +6,18 @@
 # =============================================================================
 """
 """
+import sys
 from traceback import format_exc
 from inspect import cleandoc
+from multiprocessing import Pool, cpu_count, current_process
+from threading import Thread, Event
+from Queue import Queue, Full
 from atom.api import (Value, Str, Bool, Unicode, Dict, set_default)
 import numpy as np
 
 from hqc_meas.tasks.api import (InstrumentTask, InterfaceableTaskMixin,
                                 InstrTaskInterface)
+from hqc_meas.pulses.contexts.awg_context import waveform_digest
 
 
 class TransferPulseLoopTask(InterfaceableTaskMixin, InstrumentTask):
@@ -39,6 +44,9 @@ class TransferPulseLoopTask(InterfaceableTaskMixin, InstrumentTask):
     loop_stop = Str('1').tag(pref=True)
 
     loop_points = Str('1').tag(pref=True)
+
+    #: Whether to compile the points of the loop in a pool of processes.
+    parallel_compilation = Bool(False).tag(pref=True)
       
     def intricate_loops(self, var_count, variables):
         loop_points = np.array(self.format_and_eval_string(self.loop_points))
@@ -106,6 +114,15 @@ class TransferPulseLoopTask(InterfaceableTaskMixin, InstrumentTask):
         """Compile the sequence.
 
         """
+        self.sequence.external_vars.update(self.loop_point_vars(loop_names,
+                                                                value))
+        return self.sequence.compile_loop()
+
+    def loop_point_vars(self, loop_names, value):
+        """Evaluate the sequence variables for a point of the loop.
+
+        """
+        point_vars = {}
         for k, v in self.sequence_vars.items():
             if np.size(value) == 1:
                 if loop_names[0] in v:
@@ -113,10 +130,50 @@ class TransferPulseLoopTask(InterfaceableTaskMixin, InstrumentTask):
             else:
                 for p in range(np.size(value)):
                     if loop_names[p] in v:
-                        v = v.replace(loop_names[p], value[p])
+                        v = v.replace(loop_names[p], str(value[p]))
                         
-            self.sequence.external_vars[k] = self.format_and_eval_string(v)
-        return self.sequence.compile_loop()
+            point_vars[k] = self.format_and_eval_string(v)
+        return point_vars
+
+    def compile_loop_points(self, loop_names, variables):
+        """Compile the sequence for all the points of the loop.
+
+        If parallel_compilation is set (and the sequence can be rebuilt from
+        its config) the points are compiled in a pool of processes, each
+        worker rebuilding the sequence once from its config. On a single core
+        machine, or when running in a daemonic process (such as the measure
+        process of the ProcessEngine) which is not allowed to have children,
+        the points are always compiled sequentially.
+
+        Parameters
+        ----------
+        loop_names : list
+            Names of the loop variables.
+
+        variables : ndarray
+            Values of the loop variables for each point of the loop.
+
+        Returns
+        -------
+        results : iterable
+            Results of the compile_loop method of the sequence for each point
+            of the loop, in order. They are produced as soon as available so
+            that they can be transferred while the next ones are compiled.
+
+        """
+        dependencies = None
+        if self.parallel_compilation and len(variables) > 1 and\
+                cpu_count() > 1 and not current_process().daemon:
+            dependencies = _sequence_dependencies(self.sequence)
+
+        if dependencies is None:
+            return (self.compile_loop(loop_names, value)
+                    for value in variables)
+
+        points = [self.loop_point_vars(loop_names, value)
+                  for value in variables]
+        config = self.sequence.preferences_from_members()
+        return _parallel_compilation(config, dependencies, points)
 
     def answer(self, members, callables):
         """Overriden method to take into account the presence of the sequence.
@@ -173,6 +230,129 @@ class TransferPulseLoopTask(InterfaceableTaskMixin, InstrumentTask):
 KNOWN_PY_TASKS = [TransferPulseLoopTask]
 
 
+# --- Parallel compilation ----------------------------------------------------
+
+#: Sequence rebuilt in each worker process of the compilation pool.
+_WORKER_SEQUENCE = None
+
+
+def _sequence_dependencies(sequence):
+    """Collect the classes needed to rebuild a sequence from its config.
+
+    Returns
+    -------
+    dependencies : dict or None
+        Build dependencies or None if the sequence relies on templates which
+        cannot be rebuilt without the pulses manager.
+
+    """
+    pulses = {'shapes': {}, 'contexts': {}}
+    if sequence.context:
+        context = sequence.context
+        pulses['contexts'][type(context).__name__] = type(context)
+
+    items = list(sequence.items)
+    while items:
+        item = items.pop()
+        if item.item_class == 'TemplateSequence':
+            return None
+        pulses[item.item_class] = type(item)
+        items.extend(getattr(item, 'items', ()))
+        shape = getattr(item, 'shape', None)
+        if shape is not None:
+            pulses['shapes'][shape.shape_class] = type(shape)
+
+    pulses['RootSequence'] = type(sequence)
+    return {'pulses': pulses}
+
+
+def _init_worker(config, dependencies):
+    """Rebuild the sequence in a worker process.
+
+    """
+    global _WORKER_SEQUENCE
+    builder = dependencies['pulses']['RootSequence']
+    _WORKER_SEQUENCE = builder.build_from_config(config, dependencies)
+
+
+def _compile_point(point_vars):
+    """Compile the sequence of the worker for a point of the loop.
+
+    """
+    _WORKER_SEQUENCE.external_vars.update(point_vars)
+    return _WORKER_SEQUENCE.compile_loop()
+
+
+def _parallel_compilation(config, dependencies, points):
+    """Compile the points of a loop in a pool of processes.
+
+    """
+    processes = min(cpu_count(), len(points))
+    pool = Pool(processes, _init_worker, (config, dependencies))
+    try:
+        for result in pool.imap(_compile_point, points):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+# --- Transfer pipeline -------------------------------------------------------
+
+#: Maximal number of compiled loop points waiting to be transferred.
+TRANSFER_QUEUE_SIZE = 4
+
+
+def _prefetch(iterable, size=TRANSFER_QUEUE_SIZE):
+    """Iterate over an iterable in a worker thread.
+
+    The items are produced by the worker while the previous ones are consumed
+    and at most size of them are kept waiting in the queue. An error occuring
+    in the worker is raised in the consuming thread. Closing the generator
+    stops the worker.
+
+    """
+    queue = Queue(size)
+    stop = Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((True, item)):
+                    return
+            put((False, None))
+        except Exception:
+            put((None, sys.exc_info()))
+        finally:
+            # The iterable is closed in the thread which was executing it.
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+    worker = Thread(target=produce, name='Loop points compilation')
+    worker.daemon = True
+    worker.start()
+    try:
+        while True:
+            flag, item = queue.get()
+            if flag is None:
+                raise item[0], item[1], item[2]
+            elif not flag:
+                return
+            yield item
+    finally:
+        stop.set()
+        worker.join()
+
+
 class AWGTransferLoopInterface(InstrTaskInterface):
     """Interface for the AWG, handling naming the transfered sequences and
     selecting it.
@@ -186,11 +366,17 @@ class AWGTransferLoopInterface(InstrTaskInterface):
 
     has_view = True
 
-    interface_database_entries = {'sequence_name': ''}
+    interface_database_entries = {'sequence_name': '',
+                                  'transfer_progress': 0.0}
 
     def perform(self):
         """Compile and transfer the sequence into the AWG. Automatically
         turn off the AWG.
+
+        The loop points are compiled in a worker thread while the previous
+        ones are transferred. The fraction of the loop points transferred is
+        written in the database as transfer_progress.
+
         """
         task = self.task
         if not task.driver:
@@ -207,33 +393,52 @@ class AWGTransferLoopInterface(InstrTaskInterface):
          
         task.driver.clear_sequence()
         
+        # Waveforms already transferred identified by the digest of their
+        # content, identical segments of all the loop points and channels
+        # are transferred once.
+        already_added = {}
         current_pos = 0        
-        for i in range(0, Nwaveforms):
-            seq_name = task.format_string(self.sequence_name) if self.sequence_name else 'Sequence'
-            seq_name_iter = seq_name + '_' + str(int(i))
-            res, byteseq, repeat = task.compile_loop(loop_names, variables[i])
-            if not res:
-                mess = 'Failed to compile the pulse sequence: missing {}, errs {}'
-                raise RuntimeError(mess.format(*byteseq))
+        task.write_in_database('transfer_progress', 0.0)
+        results = _prefetch(task.compile_loop_points(loop_names, variables))
+        try:
+            for i, (res, byteseq, repeat) in enumerate(results):
+                seq_name = task.format_string(self.sequence_name) if self.sequence_name else 'Sequence'
+                seq_name_iter = seq_name + '_' + str(int(i))
+                if not res:
+                    mess = 'Failed to compile the pulse sequence: missing {}, errs {}'
+                    raise RuntimeError(mess.format(*byteseq))
     
-            already_added = {}            
-            for ch_id in task.driver.defined_channels:
-                if ch_id in byteseq:
-                    for pos,waveform in enumerate(byteseq[ch_id]):
-                        addr = id(waveform)
-                        if addr not in already_added:
-                            seq_name_transfered = seq_name_iter  + '_Ch{}'.format(ch_id) +\
-                                                '_' + str(pos)
-                            task.driver.to_send(seq_name_transfered, waveform, False)
-                            already_added[addr] = seq_name_transfered
-                        else:
-                            seq_name_transfered =  already_added[addr]
-                        task.driver.set_sequence_pos(seq_name_transfered, ch_id, current_pos + pos + 1)
-                        task.driver.set_repeat(current_pos + pos + 1, repeat[pos])
-                        task.driver.set_goto_pos(current_pos + pos + 1, current_pos + pos + 2)
-        
-            current_pos += len(byteseq[task.driver.defined_channels[0]])
+                digests = {}
+                for ch_id in task.driver.defined_channels:
+                    if ch_id in byteseq:
+                        for pos,waveform in enumerate(byteseq[ch_id]):
+                            # The context returns the same object for identical
+                            # segments so the digest is computed once per object.
+                            addr = id(waveform)
+                            if addr not in digests:
+                                digests[addr] = waveform_digest(waveform)
+                            digest = digests[addr]
+                            if digest not in already_added:
+                                seq_name_transfered = seq_name_iter  + '_Ch{}'.format(ch_id) +\
+                                                    '_' + str(pos)
+                                task.driver.to_send(seq_name_transfered, waveform, False,
+                                                    wait=False)
+                                already_added[digest] = seq_name_transfered
+                            else:
+                                seq_name_transfered =  already_added[digest]
+                            task.driver.set_sequence_pos(seq_name_transfered, ch_id, current_pos + pos + 1)
+                            task.driver.set_repeat(current_pos + pos + 1, repeat[pos])
+                            task.driver.set_goto_pos(current_pos + pos + 1, current_pos + pos + 2)
         
+                current_pos += len(byteseq[task.driver.defined_channels[0]])
+                task.write_in_database('transfer_progress',
+                                       float(i + 1)/Nwaveforms)
+        finally:
+            # Stop the compilation if the transfer failed.
+            results.close()
+
+        # Synchronise once with the instrument rather than after each waveform.
+        task.driver.wait_for_transfers()
         task.driver.set_goto_pos(current_pos, 1)
             
         for ch_id in task.driver.defined_channels:
@@ -248,6 +453,7 @@ class AWGTransferLoopInterface(InstrTaskInterface):
         """
         task = self.task
         task.write_in_database('sequence_name', self.sequence_name)
+        task.write_in_database('transfer_progress', 0.0)
         return True, {}
 
     def validate_context(self, context):
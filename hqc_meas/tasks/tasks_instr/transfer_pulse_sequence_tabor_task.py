@@ -40,7 +40,7 @@ class TaborTransferInterface(InstrTaskInterface):
             task.start_driver()
 
         # seq_name = self.sequence_name if self.sequence_name else 'Sequence'
-        res, seqs = task.compile_sequence()
+        res, seqs = task.compile_sequence(incremental=True)
         if not res:
             mess = 'Failed to compile the pulse sequence: missing {}, errs {}'
             raise RuntimeError(mess.format(*seqs))
@@ -63,13 +63,22 @@ class TransferPulseSequenceTask(InterfaceableTaskMixin, InstrumentTask):
 
         return test, traceback
 
-    def compile_sequence(self):
+    def compile_sequence(self, incremental=False):
         """Compile the sequence.
 
+        Parameters
+        ----------
+        incremental : bool, optional
+            Only recompute the pulses affected by the change of the sequence
+            vars since the last incremental compilation. This should only be
+            used when performing the task as the sequence cannot be edited
+            then. A non incremental compilation (as performed during the
+            checks) discards the state kept between calls.
+
         """
         for k, v in self.sequence_vars.items():
             self.sequence.external_vars[k] = self.format_and_eval_string(v)
-        return self.sequence.compile_sequence()
+        return self.sequence.compile_sequence(incremental=incremental)
 
     def answer(self, members, callables):
         """Overriden method to take into account the presence of the sequence.
@@ -161,7 +170,7 @@ class AWGTransferInterface(InstrTaskInterface):
         task.driver.run_mode = self.mode
 
         seq_name = task.format_string(self.sequence_name) if self.sequence_name else 'Sequence'
-        res, seqs = task.compile_sequence()
+        res, seqs = task.compile_sequence(incremental=True)
         if not res:
             mess = 'Failed to compile the pulse sequence: missing {}, errs {}'
             raise RuntimeError(mess.format(*seqs))
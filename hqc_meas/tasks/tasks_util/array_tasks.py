@@ -7,11 +7,29 @@
 """
 """
 import logging
-from atom.api import (Enum, Str, set_default)
+import re
+from atom.api import (Enum, Str, Bool, Value, set_default)
 import numpy as np
 import scipy.optimize as opt
 
-from ..base_tasks import SimpleTask
+from ...utils.eval_cache import compile_expr
+from ..base_tasks import SimpleTask, PREFIX
+from ..tools import string_evaluation
+
+#: Namespace in which the fit functions are evaluated. It is the one used by
+#: safe_eval in which the math functions are replaced by their numpy
+#: counterpart so that the fit functions can work on whole arrays.
+EVAL_NAMESPACE = dict(vars(string_evaluation))
+EVAL_NAMESPACE.update({'cos': np.cos, 'sin': np.sin, 'tan': np.tan,
+                       'acos': np.arccos, 'asin': np.arcsin,
+                       'atan': np.arctan, 'atan2': np.arctan2,
+                       'sqrt': np.sqrt, 'exp': np.exp, 'log': np.log,
+                       'log10': np.log10, 'cosh': np.cosh, 'sinh': np.sinh,
+                       'tanh': np.tanh})
+
+#: Regex used to find the parameters of a fit function.
+PARAM_REGEX = re.compile(r'param\[(\d+)\]')
+
 
 class ArrayExtremaTask(SimpleTask):
     """ Store the pair(s) of index/value for the extrema(s) of an array.
@@ -193,52 +211,75 @@ class ArrayFindValueTask(SimpleTask):
 
 class ArrayFitTask(SimpleTask):
     """ Fit a data array by a given expression.
-        
-        Wait for any parallel operation before execution.
-        
-        """
+
+    The expression (and the optional jacobian) is compiled once per call to
+    perform into a vectorized function of (x, *param), the database entries
+    it uses being bound before the fit starts.
+
+    Wait for any parallel operation before execution.
+
+    """
     #: Name of the data array in the database.
     data_array = Str().tag(pref=True)
-    
+
     #: Name of the variable array in the database.
     variable_array = Str().tag(pref=True)
-    
-    #: Expression of the fit function: x is the variables and p the list of parameters
+
+    #: Expression of the fit function: x is the variables and param the list
+    #: of parameters.
     expression = Str().tag(pref=True)
-    
+
     #: Guess for fit parameters (optional)
     guess = Str().tag(pref=True)
-    
+
+    #: Expression of the jacobian of the fit function (optional). It should
+    #: evaluate to a list holding the derivative of the function with respect
+    #: to each parameter, ex: '[x, 1]' for 'param[0]*x + param[1]'.
+    jacobian = Str().tag(pref=True)
+
+    #: Whether to use the result of the previous fit as guess (useful when
+    #: fitting inside a loop).
+    reuse_result = Bool().tag(pref=True)
+
     task_database_entries = set_default({'fit': 0})
-    
+
     wait = set_default({'activated': True})  # Wait on all pools by default.
-    
+
     def perform(self):
-        """ Evaluate the expression of the fit function and 
+        """ Evaluate the expression of the fit function and
             try to fit the data
-            
-        """
 
+        """
         y_data = self.get_from_database(self.data_array[1:-1])
         x_data = self.get_from_database(self.variable_array[1:-1])
- 
-        num_parameters = self.expression.count('param')
 
-        def fitting_function(x, *p):
-            expr = self.format_string(self.expression)
-            for i in range(num_parameters):
-                expr = expr.replace('param[%d]'%i, str(p[i]))
-            expr = expr.replace('x','np.array('+str(list(x))+')')
-            return self.format_and_eval_string(expr)
+        num_parameters = self._count_parameters()
+        fitting_function = self._build_function(self.expression)
+
+        kwargs = {}
+        if self.jacobian:
+            derivatives = self._build_function(self.jacobian)
+
+            def jacobian(x, *param):
+                columns = np.broadcast_arrays(x, *derivatives(x, *param))[1:]
+                return np.column_stack(columns)
 
-        if self.guess == '':
+            kwargs['jac'] = jacobian
+
+        last = self._last_result
+        if self.reuse_result and last is not None and\
+                len(last) == num_parameters:
+            guess_list = list(last)
+        elif self.guess == '':
             guess_list = np.ones(num_parameters)
             guess_list = list(guess_list)
         else:
             guess_list = self.format_and_eval_string(self.guess)
 
         try:
-            result , error = opt.curve_fit(fitting_function, x_data, y_data, guess_list)
+            result, error = opt.curve_fit(fitting_function, x_data, y_data,
+                                          guess_list, **kwargs)
+            self._last_result = result
         except RuntimeError:
             result = guess_list
             print 'WARNING: fit failed, guess used instead'
@@ -246,14 +287,15 @@ class ArrayFitTask(SimpleTask):
         self.write_in_database('fit', result)
 
     def check(self, *args, **kwargs):
-        """ Check the number of parameters matches the number of guess
-        
+        """ Check the number of parameters matches the number of guess and
+        that the formulas can be compiled.
+
         """
-        test = True
-        traceback = {}
+        test, traceback = super(ArrayFitTask, self).check(*args, **kwargs)
         err_path = self.task_path + '/' + self.task_name
-        
-        num_parameters = self.expression.count('param')
+        self._last_result = None
+
+        num_parameters = self._count_parameters()
         if self.guess != '':
             guess_list = self.format_and_eval_string(self.guess)
             if np.size(guess_list) != num_parameters:
@@ -261,6 +303,57 @@ class ArrayFitTask(SimpleTask):
                 '''The number of guess is not equal to the number of parameters'''
                 test = False
 
+        for name in ('expression', 'jacobian'):
+            formula = getattr(self, name)
+            if not formula:
+                continue
+            try:
+                self._build_function(formula)
+            except Exception as e:
+                traceback[err_path + '-' + name] = \
+                    'Failed to compile {} : {}'.format(name, e)
+                test = False
+
         return test, traceback
 
+    # --- Private API ---------------------------------------------------------
+
+    #: Result of the last successful fit, used when reuse_result is True.
+    _last_result = Value()
+
+    def _count_parameters(self):
+        """ Number of parameters of the fit function.
+
+        """
+        indexes = [int(i) for i in PARAM_REGEX.findall(self.expression)]
+        return max(indexes) + 1 if indexes else 0
+
+    def _build_function(self, formula):
+        """ Compile a formula into a function of (x, *param).
+
+        The database entries used in the formula are replaced by their current
+        value.
+
+        """
+        elements = [el for aux in formula.split('{') for el in aux.split('}')]
+        local_vars = {}
+        expr = ''
+        for i, element in enumerate(elements):
+            if i % 2:
+                token = PREFIX + str(i//2)
+                local_vars[token] = self.get_from_database(element)
+                expr += token
+            else:
+                expr += element
+
+        code = compile_expr(expr)
+
+        def function(x, *param):
+            local_vars['x'] = x
+            local_vars['param'] = param
+            return eval(code, EVAL_NAMESPACE, local_vars)
+
+        return function
+
+
 KNOWN_PY_TASKS = [ArrayExtremaTask, ArrayFindValueTask, ArrayFitTask]
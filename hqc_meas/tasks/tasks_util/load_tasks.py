@@ -7,12 +7,17 @@
 """
 """
 from atom.api import (Bool, Str, Unicode, List, set_default)
+from collections import OrderedDict
+from threading import Lock
 import numpy as np
+import h5py
 from inspect import cleandoc
 import os
 
 from ..base_tasks import SimpleTask
 from ..task_interface import InterfaceableTaskMixin, TaskInterface
+from ..tools.binary_files import (DESCRIPTION_EXT, read_description,
+                                  load_binary)
 
 
 def _make_array(names, dtypes='f8'):
@@ -23,6 +28,72 @@ def _make_array(names, dtypes='f8'):
     return np.ones((5,), dtype=dtype)
 
 
+class _ArrayCache(object):
+    """ Bounded LRU cache of the arrays loaded from the disc.
+
+    Entries are keyed on the path of the file and the loading parameters and
+    are invalidated when the modification time or the size of the file
+    change. Cached arrays are made read-only as they are shared between all
+    the users of the cache.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        Maximal number of arrays kept in the cache.
+
+    """
+
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self._arrays = OrderedDict()
+        self._lock = Lock()
+
+    def load(self, path, params, loader):
+        """ Get the array stored in a file.
+
+        Parameters
+        ----------
+        path : unicode
+            Path of the file to load.
+
+        params : tuple
+            Hashable parameters affecting the result of the loader.
+
+        loader : callable
+            Function taking the path as argument and returning the array.
+
+        """
+        stat = os.stat(path)
+        stamp = (stat.st_mtime, stat.st_size)
+        key = (path, params)
+        with self._lock:
+            entry = self._arrays.pop(key, None)
+            if entry and entry[0] == stamp:
+                self._arrays[key] = entry
+                return entry[1]
+
+        data = loader(path)
+        if isinstance(data, np.ndarray):
+            data.flags.writeable = False
+        with self._lock:
+            self._arrays[key] = (stamp, data)
+            while len(self._arrays) > self.maxsize:
+                self._arrays.popitem(last=False)
+
+        return data
+
+    def clear(self):
+        """ Empty the cache.
+
+        """
+        with self._lock:
+            self._arrays.clear()
+
+
+#: Cache shared by all the LoadArrayTask of the process.
+ARRAY_CACHE = _ArrayCache()
+
+
 class LoadArrayTask(InterfaceableTaskMixin, SimpleTask):
     """ Load an array from the disc into the database.
 
@@ -36,6 +107,11 @@ class LoadArrayTask(InterfaceableTaskMixin, SimpleTask):
     #: Kind of file to load.
     selected_format = Str().tag(pref=True)
 
+    #: Whether to reuse the array loaded previously if the file has not been
+    #: modified since (useful when loading a file inside a loop). The array
+    #: stored in the database is then read-only.
+    use_cache = Bool(False).tag(pref=True)
+
     task_database_entries = set_default({'array': _make_array(['var1',
                                                                'var2'])})
 
@@ -71,6 +147,29 @@ class LoadArrayTask(InterfaceableTaskMixin, SimpleTask):
 
         return test, traceback
 
+    def load_array(self, loader, *params):
+        """ Load the selected file using the cache if requested.
+
+        Parameters
+        ----------
+        loader : callable
+            Function taking the path of the file as argument and returning
+            the array.
+
+        *params :
+            Hashable parameters affecting the result of the loader, used
+            along with the class of the interface as the cache key.
+
+        """
+        folder = self.format_string(self.folder)
+        filename = self.format_string(self.filename)
+        full_path = os.path.join(folder, filename)
+
+        if self.use_cache:
+            params = (type(self.interface).__name__, ) + params
+            return ARRAY_CACHE.load(full_path, params, loader)
+        return loader(full_path)
+
 
 KNOWN_PY_TASKS = [LoadArrayTask]
 
@@ -99,24 +198,9 @@ class CSVLoadInterface(TaskInterface):
     def perform(self):
         """
         """
-        task = self.task
-        folder = task.format_string(task.folder)
-        filename = task.format_string(task.filename)
-        full_path = os.path.join(folder, filename)
-
-        comment_lines = 0
-        with open(full_path) as f:
-            while True:
-                if f.readline().startswith(self.comments):
-                    comment_lines += 1
-                else:
-                    break
-
-        data = np.genfromtxt(full_path, comments=self.comments,
-                             delimiter=self.delimiter, names=self.names,
-                             skip_header=comment_lines)
-
-        task.write_in_database('array', data)
+        data = self.task.load_array(self._load, self.delimiter,
+                                    self.comments, self.names)
+        self.task.write_in_database('array', data)
 
     def check(self, *args, **kwargs):
         """
@@ -153,4 +237,230 @@ class CSVLoadInterface(TaskInterface):
         if change['value']:
             self.task.write_in_database('array', _make_array(change['value']))
 
-INTERFACES = {'LoadArrayTask': [CSVLoadInterface]}
+    def _load(self, full_path):
+        """ Parse the file using numpy.genfromtxt.
+
+        """
+        comment_lines = 0
+        with open(full_path) as f:
+            while True:
+                if f.readline().startswith(self.comments):
+                    comment_lines += 1
+                else:
+                    break
+
+        return np.genfromtxt(full_path, comments=self.comments,
+                             delimiter=self.delimiter, names=self.names,
+                             skip_header=comment_lines)
+
+
+class FastCSVLoadInterface(CSVLoadInterface):
+    """ Interface loading purely numerical CSV files.
+
+    The header is parsed in Python and the body converted by numpy C parser
+    in a single call. Files which cannot be handled this way (missing values,
+    comments after the header, ...) are parsed using numpy.genfromtxt.
+
+    """
+    #: Class attr used in the UI.
+    file_formats = ['CSV (fast)']
+
+    def _load(self, full_path):
+        """ Parse the file using numpy.fromstring.
+
+        """
+        with open(full_path, 'rb') as f:
+            line = f.readline()
+            while line.startswith(self.comments):
+                line = f.readline()
+            if self.names:
+                names = [str(n.strip()) for n in line.split(self.delimiter)
+                         if n.strip()]
+                body = f.read()
+            else:
+                names = None
+                body = line + f.read()
+
+        # Blank delimiters are all treated as whitespace by numpy parser.
+        if self.delimiter.strip():
+            body = body.replace(self.delimiter, ' ')
+        body = body.strip()
+        first_line = body.split('\n', 1)[0]
+        columns = len(first_line.split())
+        rows = body.count('\n') + 1 if body else 0
+        values = np.fromstring(body, sep=' ')
+        if not rows or values.size != rows*columns or\
+                (names and len(names) != columns):
+            return super(FastCSVLoadInterface, self)._load(full_path)
+
+        values = values.reshape((rows, columns))
+        if names:
+            dtype = [(n, values.dtype) for n in names]
+            return values.view(dtype).reshape((rows,))
+        return np.squeeze(values)
+
+
+class NPYLoadInterface(TaskInterface):
+    """ Interface loading the .npy files written by SaveArrayTask.
+
+    """
+    #: Whether to memory map the file instead of reading it.
+    mmap = Bool(True).tag(pref=True)
+
+    #: Class attr used in the UI.
+    file_formats = ['NPY']
+
+    has_view = True
+
+    def perform(self):
+        """
+        """
+        data = self.task.load_array(self._load, self.mmap)
+        self.task.write_in_database('array', data)
+
+    def check(self, *args, **kwargs):
+        """
+        """
+        task = self.task
+        try:
+            full_folder_path = task.format_string(task.folder)
+            filename = task.format_string(task.filename)
+        except Exception:
+            return True, {}
+
+        full_path = os.path.join(full_folder_path, filename)
+
+        if os.path.isfile(full_path):
+            # Memory mapping only reads the header of the file.
+            dtype = np.load(full_path, mmap_mode='r').dtype
+            names = dtype.names
+            if names:
+                array = _make_array(names, [dtype[n] for n in names])
+            else:
+                array = np.ones((5,), dtype=dtype)
+            task.write_in_database('array', array)
+
+        return True, {}
+
+    def _load(self, full_path):
+        """ Load the file, memory mapping it if requested.
+
+        """
+        return np.load(full_path, mmap_mode='r' if self.mmap else None)
+
+
+class HDF5LoadInterface(TaskInterface):
+    """ Interface loading (a part of) a dataset from a HDF5 file.
+
+    """
+    #: Name of the dataset to load.
+    dataset = Str().tag(pref=True)
+
+    #: Part of the dataset to load using numpy slicing syntax (ex: '0:10, 2').
+    #: If empty the whole dataset is loaded.
+    selection = Str().tag(pref=True)
+
+    #: Class attr used in the UI.
+    file_formats = ['HDF5']
+
+    has_view = True
+
+    def perform(self):
+        """
+        """
+        selection = self._evaluate_selection()
+        data = self.task.load_array(self._load, self.dataset, repr(selection))
+        self.task.write_in_database('array', data)
+
+    def check(self, *args, **kwargs):
+        """
+        """
+        task = self.task
+        err_path = task.task_path + '/' + task.task_name
+        traceback = {}
+        try:
+            self._evaluate_selection()
+        except Exception as e:
+            mess = 'Failed to evaluate the selection: {}'
+            traceback[err_path + '-selection'] = mess.format(e)
+            return False, traceback
+
+        try:
+            full_folder_path = task.format_string(task.folder)
+            filename = task.format_string(task.filename)
+        except Exception:
+            return True, traceback
+
+        full_path = os.path.join(full_folder_path, filename)
+
+        if os.path.isfile(full_path):
+            with h5py.File(full_path, 'r') as f:
+                if self.dataset not in f:
+                    mess = 'No dataset {} in the file.'
+                    traceback[err_path + '-dataset'] = \
+                        mess.format(self.dataset)
+                    return False, traceback
+                dtype = f[self.dataset].dtype
+            names = dtype.names
+            if names:
+                array = _make_array(names, [dtype[n] for n in names])
+            else:
+                array = np.ones((5,), dtype=dtype)
+            task.write_in_database('array', array)
+
+        return True, traceback
+
+    def _evaluate_selection(self):
+        """ Turn the selection string into an index usable by h5py.
+
+        """
+        if not self.selection.strip():
+            return ()
+        return self.task.format_and_eval_string('np.s_[' + self.selection +
+                                                ']')
+
+    def _load(self, full_path):
+        """ Read the selected part of the dataset.
+
+        """
+        with h5py.File(full_path, 'r') as f:
+            return f[self.dataset][self._evaluate_selection()]
+
+
+class BinaryLoadInterface(TaskInterface):
+    """ Interface loading the binary files written by SaveFileTask.
+
+    """
+    #: Class attr used in the UI.
+    file_formats = ['Binary']
+
+    def perform(self):
+        """
+        """
+        data = self.task.load_array(load_binary)
+        self.task.write_in_database('array', data)
+
+    def check(self, *args, **kwargs):
+        """
+        """
+        task = self.task
+        try:
+            full_folder_path = task.format_string(task.folder)
+            filename = task.format_string(task.filename)
+        except Exception:
+            return True, {}
+
+        full_path = os.path.join(full_folder_path, filename)
+
+        if os.path.isfile(full_path + DESCRIPTION_EXT):
+            dtype, _ = read_description(full_path)
+            names = dtype.names
+            task.write_in_database('array',
+                                   _make_array(names,
+                                               [dtype[n] for n in names]))
+
+        return True, {}
+
+INTERFACES = {'LoadArrayTask': [CSVLoadInterface, FastCSVLoadInterface,
+                                BinaryLoadInterface, NPYLoadInterface,
+                                HDF5LoadInterface]}
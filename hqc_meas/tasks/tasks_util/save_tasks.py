@@ -7,15 +7,171 @@
 """
 """
 from atom.api import (Tuple, ContainerList, Str, Enum, Value,
-                      Bool, Int, observe, set_default, Unicode)
+                      Bool, Int, Float, observe, set_default, Unicode)
 import os
 import errno
+import time
 import numpy
 import h5py
 import logging
 from inspect import cleandoc
+from threading import Thread
+from Queue import Queue, Empty
 
 from ..base_tasks import SimpleTask
+from ..tools.binary_files import binary_dtype, write_description
+
+
+class _BackgroundFileWriter(object):
+    """ Write-behind wrapper around a file object.
+
+    Data are put in a bounded queue and written by a dedicated thread, so that
+    the measure does not wait for the filesystem. Rows are formatted before
+    being queued and arrays are copied (and formatted by the thread) so that
+    later in place modifications of the values do not alter the written data.
+    The file is flushed when flush_period seconds have elapsed or flush_rows
+    writes have been made since the last flush.
+
+    The wrapper exposes the write, flush and close methods of a file object.
+    An error occuring in the writer thread is raised on the next call to one
+    of these methods.
+
+    Parameters
+    ----------
+    file_object : file
+        Opened file in which to write.
+
+    flush_period : float, optional
+        Maximal time in seconds during which data can stay unflushed.
+
+    flush_rows : int, optional
+        Maximal number of writes between two flushes.
+
+    queue_size : int, optional
+        Maximal number of pending writes. When the queue is full the measure
+        waits for the writer to catch up.
+
+    """
+
+    def __init__(self, file_object, flush_period=1.0, flush_rows=1000,
+                 queue_size=10000):
+        self.file_object = file_object
+        self.flush_period = flush_period
+        self.flush_rows = flush_rows
+        self.closed = False
+        self._error = None
+        self._pending = 0
+        self._last_flush = time.time()
+        self._queue = Queue(queue_size)
+        # Use the repr of the path as non-ascii names cannot be formatted
+        # into a byte string.
+        self._thread = Thread(target=self._run,
+                              name='Writer: {!r}'.format(file_object.name))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def write(self, data):
+        """ Write a string to the file.
+
+        """
+        self._put((self.file_object.write, data))
+
+    def write_row(self, values):
+        """ Write a tab separated row of values.
+
+        """
+        self.write('\t'.join([str(val) for val in values]) + '\n')
+
+    def write_array(self, array):
+        """ Write an array as tab separated columns.
+
+        """
+        self._put((self._format_array, numpy.array(array, copy=True)))
+
+    def flush(self):
+        """ Ask the writer thread to flush the file.
+
+        """
+        self._put((self._flush, None))
+
+    def close(self):
+        """ Write all pending data and close the file.
+
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self.file_object.close()
+        self._raise_error()
+
+    # --- Private API ---------------------------------------------------------
+
+    def _put(self, item):
+        """ Enqueue a write operation.
+
+        """
+        self._raise_error()
+        if self.closed:
+            raise ValueError('I/O operation on closed file')
+        self._queue.put(item)
+
+    def _raise_error(self):
+        """ Raise the error which occured in the writer thread if any.
+
+        """
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise IOError('Writing to {!r} failed : {}'.format(
+                          self.file_object.name, error))
+
+    def _format_array(self, array):
+        numpy.savetxt(self.file_object, array, delimiter='\t')
+
+    def _flush(self, _=None):
+        self.file_object.flush()
+        self._pending = 0
+        self._last_flush = time.time()
+
+    def _run(self):
+        """ Main loop of the writer thread.
+
+        """
+        queue = self._queue
+        while True:
+            try:
+                timeout = self.flush_period if self._pending else None
+                item = queue.get(timeout=timeout)
+            except Empty:
+                item = (self._flush, None)
+
+            if item is None:
+                break
+            # After an error keep consuming the queue so that the measure
+            # does not block, the error will be reported to it.
+            if self._error is not None:
+                continue
+
+            try:
+                function, data = item
+                function(data)
+                if function != self._flush:
+                    self._pending += 1
+                    if (self._pending >= self.flush_rows or
+                            time.time() - self._last_flush >=
+                            self.flush_period):
+                        self._flush()
+            except Exception as e:
+                log = logging.getLogger(__name__)
+                log.exception('Background writing failed :')
+                self._error = e
+
+        if self._error is None and self._pending:
+            try:
+                self._flush()
+            except Exception as e:
+                self._error = e
 
 
 class SaveTask(SimpleTask):
@@ -65,6 +221,14 @@ class SaveTask(SimpleTask):
     #: Flag indicating whether or not initialisation has been performed.
     initialized = Bool(False)
 
+    #: Whether to write the file from a background thread so that the measure
+    #: does not wait for the filesystem.
+    background_writing = Bool(False).tag(pref=True)
+
+    #: Maximal time in seconds during which the data can stay unflushed when
+    #: writing in the background.
+    flush_period = Float(1.0).tag(pref=True)
+
     task_database_entries = set_default({'file': None})
 
     wait = set_default({'activated': True})  # Wait on all pools by default.
@@ -101,6 +265,10 @@ class SaveTask(SimpleTask):
                     log.error(mes)
                     self.root_task.should_stop.set()
 
+                if self.background_writing:
+                    self.file_object = \
+                        _BackgroundFileWriter(self.file_object,
+                                              self.flush_period)
                 self.root_task.files[full_path] = self.file_object
                 if self.header:
                     h = self.format_string(self.header)
@@ -124,9 +292,12 @@ class SaveTask(SimpleTask):
         values = [self.format_and_eval_string(s[1])
                   for s in self.saved_values]
         if self.saving_target != 'Array':
-            self.file_object.write('\t'.join([str(val)
-                                              for val in values]) + '\n')
-            self.file_object.flush()
+            if self.background_writing:
+                self.file_object.write_row(values)
+            else:
+                self.file_object.write('\t'.join([str(val)
+                                                  for val in values]) + '\n')
+                self.file_object.flush()
         if self.saving_target != 'File':
             self.array[self.line_index] = tuple(values)
 
@@ -226,7 +397,11 @@ class SaveTask(SimpleTask):
 
 
 class SaveFileTask(SimpleTask):
-    """ Save the specified entries in a CSV file.
+    """ Save the specified entries in a CSV file or in a binary file.
+
+    In binary mode the rows are appended as raw little-endian records and
+    their description (column names and types, header) is saved next to the
+    file in a JSON file (see hqc_meas.tasks.tools.binary_files).
 
     Wait for any parallel operation before execution.
 
@@ -257,6 +432,20 @@ class SaveFileTask(SimpleTask):
     #: Column indices identified as arrays.
     array_values = Value()
 
+    #: Whether to write the file from a background thread so that the measure
+    #: does not wait for the filesystem.
+    background_writing = Bool(False).tag(pref=True)
+
+    #: Maximal time in seconds during which the data can stay unflushed when
+    #: writing in the background.
+    flush_period = Float(1.0).tag(pref=True)
+
+    #: Format of the file : tab separated text or binary records.
+    file_format = Enum('Text', 'Binary').tag(pref=True)
+
+    #: Dtype of the records written in binary mode.
+    records_dtype = Value()
+
     task_database_entries = set_default({'file': None})
 
     wait = set_default({'activated': True})  # Wait on all pools by default.
@@ -280,14 +469,13 @@ class SaveFileTask(SimpleTask):
                 log.error(mes)
                 self.root_task.should_stop.set()
 
+            if self.background_writing:
+                self.file_object = \
+                    _BackgroundFileWriter(self.file_object, self.flush_period)
             self.root_task.files[full_path] = self.file_object
 
-            if self.header:
-                h = self.format_string(self.header)
-                for line in h.split('\n'):
-                    self.file_object.write('# ' + line + '\n')
-
             labels = []
+            formats = []
             self.array_values = set()
             for i, s in enumerate(self.saved_values):
                 value = self.format_and_eval_string(s[1])
@@ -296,12 +484,25 @@ class SaveFileTask(SimpleTask):
                     self.array_values.add(i)
                     if names:
                         labels.extend([s[0] + '_' + m for m in names])
+                        formats.extend([value.dtype[m] for m in names])
                     else:
                         labels.append(s[0])
+                        formats.append(value.dtype)
                 else:
                     labels.append(s[0])
-            self.file_object.write('\t'.join(labels) + '\n')
-            self.file_object.flush()
+                    formats.append(numpy.asarray(value).dtype)
+
+            if self.file_format == 'Binary':
+                self.records_dtype = binary_dtype(zip(labels, formats))
+                write_description(full_path, self.records_dtype,
+                                  self.format_string(self.header))
+            else:
+                if self.header:
+                    h = self.format_string(self.header)
+                    for line in h.split('\n'):
+                        self.file_object.write('# ' + line + '\n')
+                self.file_object.write('\t'.join(labels) + '\n')
+                self.file_object.flush()
 
             self.initialized = True
 
@@ -332,10 +533,15 @@ class SaveFileTask(SimpleTask):
             else:
                 length = lengths.pop()
 
-        if not self.array_values:
-            self.file_object.write('\t'.join([str(val) for val in values]) +
-                                   '\n')
-            self.file_object.flush()
+        if self.file_format == 'Binary':
+            self._write_records(values, length if self.array_values else 1)
+        elif not self.array_values:
+            if self.background_writing:
+                self.file_object.write_row(values)
+            else:
+                self.file_object.write('\t'.join([str(val)
+                                                  for val in values]) + '\n')
+                self.file_object.flush()
         else:
             columns = []
             for i, val in enumerate(values):
@@ -347,8 +553,12 @@ class SaveFileTask(SimpleTask):
                 else:
                     columns.append(numpy.ones(length)*val)
             array_to_save = numpy.rec.fromarrays(columns)
-            numpy.savetxt(self.file_object, array_to_save, delimiter='\t')
-            self.file_object.flush()
+            if self.background_writing:
+                self.file_object.write_array(array_to_save)
+            else:
+                numpy.savetxt(self.file_object, array_to_save,
+                              delimiter='\t')
+                self.file_object.flush()
 
     def check(self, *args, **kwargs):
         """
@@ -405,27 +615,202 @@ class SaveFileTask(SimpleTask):
                 test = False
 
         return test, traceback
-        
-class _HDF5File(h5py.File):
-    """ 
-        Resize the datasets before closing the file
-        Sets the compression with a boolean
+
+    # --- Private API ---------------------------------------------------------
+
+    def _write_records(self, values, length):
+        """ Write the values as binary records.
+
+        Parameters
+        ----------
+        values : list
+            Values to save, arrays being saved as columns.
+
+        length : int
+            Number of rows to write.
+
+        """
+        records = numpy.empty(length, self.records_dtype)
+        names = iter(self.records_dtype.names)
+        for i, val in enumerate(values):
+            if i in self.array_values and val.dtype.names:
+                for m in val.dtype.names:
+                    records[next(names)] = val[m]
+            else:
+                records[next(names)] = val
+
+        self.file_object.write(records.tobytes())
+        if not self.background_writing:
+            self.file_object.flush()
+
+
+#: Target size in bytes of the HDF5 chunks (h5py advises 10 KiB to 1 MiB).
+HDF5_CHUNK_BYTES = 2**19
+
+#: Minimal size in bytes of the HDF5 chunks, used when the estimated number
+#: of rows is small (the chunks are also the size of the in memory buffers).
+HDF5_MIN_CHUNK_BYTES = 2**16
+
+
+class _HDF5DatasetBuffer(object):
+    """ In memory buffer holding the rows of one chunk of a dataset.
+
+    The buffer always maps a chunk aligned block of rows of the dataset so
+    that full blocks are written in a single operation touching one chunk.
+
     """
+    __slots__ = ('dataset', 'buffer', 'start', 'filled', 'flushed')
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        rows = dataset.chunks[0] if dataset.chunks else 1
+        self.buffer = numpy.empty((rows, ) + dataset.shape[1:], dataset.dtype)
+        # Index in the dataset of the first row of the buffer.
+        self.start = 0
+        # Number of rows stored in the buffer.
+        self.filled = 0
+        # Number of rows of the buffer already written to the dataset.
+        self.flushed = 0
+
+    def append(self, value):
+        """ Add a row to the buffer, writing it to the file once full.
+
+        """
+        self.buffer[self.filled] = value
+        self.filled += 1
+        if self.filled == len(self.buffer):
+            self.flush()
+            self.start += self.filled
+            self.filled = self.flushed = 0
+
+    def flush(self):
+        """ Write the rows which are not yet in the dataset.
+
+        """
+        if self.flushed == self.filled:
+            return
+        dataset = self.dataset
+        end = self.start + self.filled
+        if end > dataset.shape[0]:
+            # Grow geometrically to keep the number of resizes logarithmic.
+            dataset.resize((max(end, 2*dataset.shape[0]), ) +
+                           dataset.shape[1:])
+        dataset[self.start + self.flushed:end] = \
+            self.buffer[self.flushed:self.filled]
+        self.flushed = self.filled
+
+    def trim(self):
+        """ Resize the dataset to the number of rows actually written.
+
+        """
+        self.dataset.resize((self.start + self.filled, ) +
+                            self.dataset.shape[1:])
+
+
+class _HDF5Writer(object):
+    """ Buffered writer appending rows to the datasets of a HDF5 file.
+
+    Rows are accumulated in memory and written by chunk aligned blocks. The
+    pending rows are also written (and the file flushed) when flush_period
+    seconds have elapsed since the last flush. Datasets are resized to their
+    actual length when closing the file.
+
+    Parameters
+    ----------
+    path : unicode
+        Path of the file to create.
+
+    flush_period : float, optional
+        Maximal time in seconds during which data can stay in memory. If
+        zero, every row is immediately written to the file.
+
+    """
+
+    def __init__(self, path, flush_period=1.0):
+        self.file = h5py.File(path, 'w')
+        self.flush_period = flush_period
+        self.count = 0
+        self._buffers = {}
+        self._last_flush = time.time()
+
+    def create_dataset(self, name, shape, dtype, estimation, compress):
+        """ Create a dataset whose rows will be appended.
+
+        Parameters
+        ----------
+        name : unicode
+            Name of the dataset.
+
+        shape : tuple
+            Shape of a single row.
+
+        dtype : numpy.dtype
+            Type of the data.
+
+        estimation : int
+            Expected number of rows used to pick the initial size and the
+            chunking of the dataset. The chunks are never smaller than
+            HDF5_MIN_CHUNK_BYTES (unless a single row is bigger) so that the
+            rows are buffered even when the estimation is too low.
+
+        compress : bool
+            Whether to compress the data using gzip.
+
+        """
+        dtype = numpy.dtype(dtype)
+        estimation = max(int(estimation), 1)
+        row_bytes = max(dtype.itemsize*int(numpy.prod(shape)), 1)
+        min_rows = HDF5_MIN_CHUNK_BYTES // row_bytes
+        max_rows = HDF5_CHUNK_BYTES // row_bytes
+        chunk_rows = max(1, min(max(estimation, min_rows), max_rows))
+        kwargs = {'compression': 'gzip'} if compress else {}
+        dataset = self.file.create_dataset(name, (estimation, ) + shape,
+                                           maxshape=(None, ) + shape,
+                                           dtype=dtype,
+                                           chunks=(chunk_rows, ) + shape,
+                                           **kwargs)
+        self._buffers[name] = _HDF5DatasetBuffer(dataset)
+
+    def write_row(self, row):
+        """ Append a row to the datasets.
+
+        Parameters
+        ----------
+        row : iterable
+            Pairs (dataset name, value).
+
+        """
+        buffers = self._buffers
+        for name, value in row:
+            buffers[name].append(value)
+        self.count += 1
+
+        if time.time() - self._last_flush >= self.flush_period:
+            self.flush()
+
+    def flush(self):
+        """ Write all pending rows and flush the file.
+
+        """
+        for buf in self._buffers.values():
+            buf.flush()
+        self.file.attrs['countCalls'] = self.count
+        self.file.flush()
+        self._last_flush = time.time()
 
     def close(self):
-        for dataset in self.keys():
-            oldshape = self[dataset].shape
-            newshape = (self.attrs['countCalls'], ) + oldshape[1:]
-            self[dataset].resize(newshape)
-        super(_HDF5File, self).close()
-
-    def create_dataset(self, name, shape, maximumshape, datatype, compress):
-        f = super(_HDF5File, self)
-        if compress:
-            f.create_dataset(name, shape, maxshape=maximumshape, dtype=datatype, compression='gzip')
-        else:
-            f.create_dataset(name, shape, maxshape=maximumshape, dtype=datatype)
-            
+        """ Write all pending rows, trim the datasets and close the file.
+
+        """
+        if not self.file:
+            return
+        for buf in self._buffers.values():
+            buf.flush()
+            buf.trim()
+        self.file.attrs['countCalls'] = self.count
+        self.file.close()
+        self._buffers = {}
+
 
 class SaveFileHDF5Task(SimpleTask):
     """ Save the specified entries in a HDF5 file.
@@ -448,8 +833,12 @@ class SaveFileHDF5Task(SimpleTask):
     #: List of values to be saved store as (label, value).
     saved_values = ContainerList(Tuple()).tag(pref=True)
     
-    #: data type (float16, float32, etc.)
-    datatype = Enum('float16', 'float32', 'float64').tag(pref=True)
+    #: data type (float16, float32, etc.). When 'auto' each dataset is
+    #: complex128 if the first saved value is complex and float64 otherwise
+    #: (so that later float values are not truncated if the first one happens
+    #: to be an integer).
+    datatype = Enum('float16', 'float32', 'float64', 'complex64',
+                    'complex128', 'auto').tag(pref=True)
     
     #: gzip compression of the data in the HDF5 file
     compression = Bool(False).tag(pref=True)
@@ -457,6 +846,10 @@ class SaveFileHDF5Task(SimpleTask):
     #: estimation of the number of calls of this task during the measure. This helps h5py to chunk the file appropriately
     callsEstimation = Str('1').tag(pref=True)
 
+    #: Maximal time in seconds during which the data can be kept in memory
+    #: before being written to the file.
+    flush_period = Float(1.0).tag(pref=True)
+
     #: Flag indicating whether or not initialisation has been performed.
     initialized = Bool(False)
 
@@ -468,17 +861,18 @@ class SaveFileHDF5Task(SimpleTask):
         """ Collect all data and write them to file.
 
         """
+        row = self._collect_values()
 
-        callsEstimation = self.format_and_eval_string(self.callsEstimation)        
-        
         # Initialisation.
         if not self.initialized:
 
+            calls_estimation = \
+                self.format_and_eval_string(self.callsEstimation)
             full_folder_path = self.format_string(self.folder)
             filename = self.format_string(self.filename)
             full_path = os.path.join(full_folder_path, filename)
             try:
-                self.file_object = _HDF5File(full_path, 'w')
+                self.file_object = _HDF5Writer(full_path, self.flush_period)
             except IOError as e:
                 log = logging.getLogger()
                 mes = cleandoc('''In {}, failed to open the specified
@@ -489,54 +883,23 @@ class SaveFileHDF5Task(SimpleTask):
             self.root_task.files[full_path] = self.file_object
 
             f = self.file_object
-            for s in self.saved_values:
-                value = self.format_and_eval_string(s[1])
-                if isinstance(value, numpy.ndarray):
-                    names = value.dtype.names
-                    if names:
-                        for m in names:
-                            f.create_dataset(s[0] + '_' + m, 
-                                             (callsEstimation, ) + value.shape,
-                                             (None, ) + value.shape,
-                                             self.format_string(self.datatype),
-                                             self.compression )
-                    else:
-                        f.create_dataset(s[0], 
-                                         (callsEstimation, ) + value.shape,
-                                         (None, ) + value.shape,
-                                         self.format_string(self.datatype),
-                                         self.compression )
+            for name, value in row:
+                if self.datatype == 'auto':
+                    dtype = numpy.asarray(value).dtype
+                    if dtype.kind in 'biuf':
+                        dtype = numpy.float64
+                    elif dtype.kind == 'c':
+                        dtype = numpy.complex128
                 else:
-                    f.create_dataset(s[0], (callsEstimation, ), (None, ), self.format_string(self.datatype), self.compression)
-            f.attrs['header'] = self.format_string(self.header)
-            f.attrs['countCalls'] = 0
+                    dtype = self.datatype
+                f.create_dataset(name, numpy.shape(value), dtype,
+                                 calls_estimation, self.compression)
+            f.file.attrs['header'] = self.format_string(self.header)
             f.flush()
 
             self.initialized = True
-        
-        f = self.file_object
-        countCalls = f.attrs['countCalls']
-        
-        if not (countCalls % callsEstimation):
-            for dataset in f.keys():
-                oldshape = f[dataset].shape
-                newshape = (oldshape[0] + callsEstimation, ) + oldshape[1:]
-                f[dataset].resize(newshape)
-        
-        for s in self.saved_values:
-            value = self.format_and_eval_string(s[1])
-            if isinstance(value, numpy.ndarray):
-                names = value.dtype.names
-                if names:
-                    for m in names:
-                        f[s[0] + '_' + m][countCalls] = value[m]
-                else:
-                    f[s[0]][countCalls] = value
-            else:
-                f[s[0]][countCalls] = value
-                
-        f.attrs['countCalls'] = countCalls + 1
-        f.flush()
+
+        self.file_object.write_row(row)
 
     def check(self, *args, **kwargs):
         """
@@ -599,6 +962,29 @@ class SaveFileHDF5Task(SimpleTask):
                 test = False            
         return test, traceback
 
+    # --- Private API ---------------------------------------------------------
+
+    def _collect_values(self):
+        """ Evaluate the saved values.
+
+        Returns
+        -------
+        row : list
+            List of pairs (dataset name, value), the fields of record arrays
+            being saved in separate datasets.
+
+        """
+        row = []
+        for s in self.saved_values:
+            value = self.format_and_eval_string(s[1])
+            names = value.dtype.names if isinstance(value, numpy.ndarray)\
+                else None
+            if names:
+                row.extend([(s[0] + '_' + m, value[m]) for m in names])
+            else:
+                row.append((s[0], value))
+        return row
+
 
 class SaveArrayTask(SimpleTask):
     """Save the specified array either in a CSV file or as a .npy binary file.
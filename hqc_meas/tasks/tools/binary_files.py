@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# =============================================================================
+# module : binary_files.py
+# author : Matthieu Dartiailh
+# license : MIT license
+# =============================================================================
+""" Binary format used to save large arrays row after row.
+
+The data file is a raw sequence of little-endian records (one record per
+saved row) which can be appended to with a single write and read back with a
+single call to numpy.fromfile (or memory mapped). The dtype of the records
+and the header of the file are stored in a small JSON sidecar file whose path
+is the data file path with DESCRIPTION_EXT appended.
+
+"""
+import json
+import os
+
+import numpy as np
+
+
+#: Extension added to the path of a data file to get its description.
+DESCRIPTION_EXT = '.json'
+
+#: Version of the format written in the description file.
+FORMAT_VERSION = 1
+
+
+def binary_dtype(fields):
+    """ Build the little-endian dtype used to store records.
+
+    Parameters
+    ----------
+    fields : iterable
+        Pairs (name, dtype) describing the columns.
+
+    """
+    return np.dtype([(str(name), np.dtype(dtype).newbyteorder('<'))
+                     for name, dtype in fields])
+
+
+def write_description(path, dtype, header=''):
+    """ Write the description of a binary data file.
+
+    Parameters
+    ----------
+    path : unicode
+        Path of the data file.
+
+    dtype : numpy.dtype
+        Dtype of the records stored in the file.
+
+    header : str, optional
+        Free text describing the data.
+
+    """
+    description = {'version': FORMAT_VERSION, 'dtype': dtype.descr,
+                   'header': header}
+    with open(path + DESCRIPTION_EXT, 'wb') as f:
+        json.dump(description, f)
+
+
+def read_description(path):
+    """ Read the description of a binary data file.
+
+    Returns
+    -------
+    dtype : numpy.dtype
+        Dtype of the records stored in the file.
+
+    header : unicode
+        Header of the file.
+
+    """
+    with open(path + DESCRIPTION_EXT, 'rb') as f:
+        description = json.load(f)
+
+    # Json converts tuples to lists and str to unicode which numpy dislikes.
+    fields = []
+    for field in description['dtype']:
+        field = [str(f) if isinstance(f, basestring) else tuple(f)
+                 for f in field]
+        fields.append(tuple(field))
+    return np.dtype(fields), description.get('header', '')
+
+
+def load_binary(path, mmap=False):
+    """ Load a binary data file.
+
+    Parameters
+    ----------
+    path : unicode
+        Path of the data file.
+
+    mmap : bool, optional
+        Whether to memory map the file instead of reading it.
+
+    Returns
+    -------
+    data : numpy.ndarray
+        Record array holding the rows written so far. Incomplete trailing
+        records (file being written) are ignored.
+
+    """
+    dtype, _ = read_description(path)
+    count = os.path.getsize(path) // dtype.itemsize
+    if mmap and count:
+        return np.memmap(path, dtype, 'r', shape=(count,))
+    return np.fromfile(path, dtype, count)
@@ -14,6 +14,8 @@ from cmath import pi as Pi
 import numpy as np
 import cmath as cm
 
+from ...utils.eval_cache import compile_expr
+
 FORMATTER_TOOLTIP = fill(cleandoc("""In this field you can enter a text and
                         include fields which will be replaced by database
                         entries by using the delimiters '{' and '}'."""), 80)
@@ -37,7 +39,8 @@ def safe_eval(expr, local_var=None):
     if expr.isalpha():
         return expr
 
+    code = compile_expr(expr)
     if local_var:
-        return eval(expr, globals(), local_var)
+        return eval(code, globals(), local_var)
     else:
-        return eval(expr)
+        return eval(code, globals())
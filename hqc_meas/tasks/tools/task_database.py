@@ -6,7 +6,7 @@
 # =============================================================================
 """
 """
-from atom.api import Atom, Dict, Bool, Value, Event, List, Str, Typed
+from atom.api import Atom, Dict, Bool, Value, Event, List, Str, Typed, Int
 from threading import Lock
 
 
@@ -19,6 +19,44 @@ class DatabaseNode(Atom):
     meta = Dict()
 
 
+class DatabaseSlot(object):
+    """ Pre-resolved access to an entry of the flat database.
+
+    Slots are handed out by the database in running mode and allow to get and
+    set a value without resolving its path again.
+
+    """
+    __slots__ = ('database', 'index', 'path', '_values', '_lock', '_striped')
+
+    def __init__(self, database, index):
+        self.database = database
+        self.index = index
+        self.path = database._entry_paths[index]
+        self._values = database._flat_database
+        self._lock = database._get_lock(index)
+        self._striped = len(database._locks) > 1
+
+    def get(self):
+        """ Get the value currently stored in the entry.
+
+        """
+        return self._values[self.index]
+
+    def set(self, value):
+        """ Set the value of the entry and notify the database observers.
+
+        """
+        if self._striped:
+            with self._lock:
+                self._values[self.index] = value
+            self.database.notifier = (self.path, value)
+        else:
+            self._lock.acquire()
+            self._values[self.index] = value
+            self.database.notifier = (self.path, value)
+            self._lock.release()
+
+
 class TaskDatabase(Atom):
     """ A database for inter tasks communication.
 
@@ -30,6 +68,11 @@ class TaskDatabase(Atom):
         In running mode the database is thread safe but the object it contains
         may not be so (dict, list, etc)
 
+    In running mode the flat database is protected either by a single lock,
+    under which the observers are also notified, or by a set of striped locks
+    (see lock_stripes) in which case the observers are notified outside of
+    the critical section and writers to different entries do not contend.
+
     """
     # --- Public API ----------------------------------------------------------
 
@@ -44,6 +87,14 @@ class TaskDatabase(Atom):
     #: running mode the database is flattened into a list for faster acces.
     running = Bool(False)
 
+    #: Number of locks protecting the flat database in running mode. Entries
+    #: are assigned to a lock based on their index. Using a single lock
+    #: serializes all writes and notifications, using more allows parallel
+    #: pools to write without blocking each other but the notifications of
+    #: concurrent writes to the same entry may then be received out of order.
+    #: This must be set before calling prepare_for_running.
+    lock_stripes = Int(1)
+
     def set_value(self, node_path, value_name, value):
         """Method used to set the value of the entry at the specified path
 
@@ -72,10 +123,15 @@ class TaskDatabase(Atom):
         if self.running:
             full_path = node_path + '/' + value_name
             index = self._entry_index_map[full_path]
-            self._lock.acquire()
-            self._flat_database[index] = value
-            self.notifier = (node_path + '/' + value_name, value)
-            self._lock.release()
+            if len(self._locks) > 1:
+                with self._get_lock(index):
+                    self._flat_database[index] = value
+                self.notifier = (full_path, value)
+            else:
+                self._lock.acquire()
+                self._flat_database[index] = value
+                self.notifier = (full_path, value)
+                self._lock.release()
         else:
             node = self._go_to_path(node_path)
             if value_name not in node.data:
@@ -206,6 +262,31 @@ class TaskDatabase(Atom):
         return {name: self._find_index(assumed_path, name)
                 for name in entries}
 
+    def get_slot(self, assumed_path, value_name):
+        """ Access to a pre-resolved handle on an entry of the flat database.
+
+        Only to be used in running mode. The entry is looked for in the same
+        way as in get_value.
+
+        Parameters
+        ----------
+        assumed_path : str
+            Path where we start looking for the entry.
+
+        value_name : str
+            Name of the value we are looking for.
+
+        Returns
+        -------
+        slot : DatabaseSlot
+            Handle allowing direct get/set operations on the entry.
+
+        """
+        if not self.running:
+            raise RuntimeError('Slots are only available in running mode')
+
+        return DatabaseSlot(self, self._find_index(assumed_path, value_name))
+
     def list_accessible_entries(self, node_path):
         """ Method used to get a list of all entries accessible from a node.
 
@@ -426,7 +507,8 @@ class TaskDatabase(Atom):
         This is used when tasks are executed.
 
         """
-        self._lock = Lock()
+        self._locks = [Lock() for i in range(max(1, self.lock_stripes))]
+        self._lock = self._locks[0]
         self.running = True
 
         # Flattening the database by walking all the nodes.
@@ -434,6 +516,7 @@ class TaskDatabase(Atom):
         nodes = [('root', self._database)]
         mapping = {}
         datas = []
+        paths = []
         for (node_path, node) in nodes:
             for key, val in node.data.iteritems():
                 path = node_path + '/' + key
@@ -443,6 +526,7 @@ class TaskDatabase(Atom):
                     mapping[path] = index
                     index += 1
                     datas.append(val)
+                    paths.append(path)
 
         # Walking a second time to add the exception to the _entry_index_map,
         # in reverse order in case an entry has multiple exceptions.
@@ -455,6 +539,7 @@ class TaskDatabase(Atom):
 
         self._flat_database = datas
         self._entry_index_map = mapping
+        self._entry_paths = paths
 
         self._database = None
 
@@ -470,9 +555,16 @@ class TaskDatabase(Atom):
     #: Dict mapping full paths to flat database indexes.
     _entry_index_map = Dict()
 
+    #: List of the full paths of the entries of the flat database.
+    _entry_paths = List()
+
     #: Lock to make the database thread safe in running mode.
     _lock = Value()
 
+    #: Locks protecting the flat database in running mode, the first one is
+    #: _lock.
+    _locks = List()
+
     def _go_to_path(self, path):
         """Method used to reach a node specified by a path.
 
@@ -502,6 +594,15 @@ class TaskDatabase(Atom):
 
         return node
 
+    def _get_lock(self, index):
+        """ Get the lock protecting the entry at the given index.
+
+        Only to be used in running mode.
+
+        """
+        locks = self._locks
+        return locks[index % len(locks)]
+
     def _find_index(self, assumed_path, entry):
         """ Find the index associated with a path.
 
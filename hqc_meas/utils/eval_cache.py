@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# =============================================================================
+# module : eval_cache.py
+# author : Matthieu Dartiailh
+# license : MIT license
+# =============================================================================
+""" Process wide cache of compiled expressions.
+
+Both the tasks and the pulses evaluate the same strings over and over again
+(once per loop point). Compiling an expression is far more expensive than
+evaluating the resulting code object so the code objects are stored in a
+bounded LRU cache shared by all users in the process.
+
+"""
+from collections import OrderedDict
+from threading import Lock
+
+
+#: Default maximal number of code objects kept in the cache.
+DEFAULT_MAXSIZE = 1024
+
+
+class CompiledExpressionCache(object):
+    """ Bounded LRU cache mapping expressions to their compiled code object.
+
+    This object is thread safe as it can be accessed from tasks running in
+    parallel pools.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        Maximal number of code objects kept in the cache.
+
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._codes = OrderedDict()
+        self._lock = Lock()
+
+    def compile(self, expr):
+        """ Get the code object corresponding to an expression.
+
+        Parameters
+        ----------
+        expr : str
+            Expression to compile in 'eval' mode.
+
+        Returns
+        -------
+        code : code
+            Compiled version of the expression.
+
+        """
+        with self._lock:
+            try:
+                # Pop and re-insert to mark the entry as most recently used.
+                code = self._codes.pop(expr)
+            except KeyError:
+                pass
+            else:
+                self._codes[expr] = code
+                self.hits += 1
+                return code
+
+        # Compile outside of the lock, a syntax error must not be cached.
+        code = compile(expr, '<string>', 'eval')
+        with self._lock:
+            self.misses += 1
+            self._codes[expr] = code
+            while len(self._codes) > self.maxsize:
+                self._codes.popitem(last=False)
+
+        return code
+
+    def stats(self):
+        """ Get the cache usage statistics.
+
+        Returns
+        -------
+        stats : dict
+            Dict holding the number of hits, misses, the hit rate and the
+            current number of cached expressions.
+
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            rate = float(self.hits)/total if total else 0.0
+            return {'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': rate, 'size': len(self._codes),
+                    'maxsize': self.maxsize}
+
+    def clear(self):
+        """ Empty the cache and reset the counters.
+
+        """
+        with self._lock:
+            self._codes.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+#: Cache shared by all the evaluation functions of the process.
+EXPRESSION_CACHE = CompiledExpressionCache()
+
+
+def compile_expr(expr):
+    """ Compile an expression using the process wide cache.
+
+    """
+    return EXPRESSION_CACHE.compile(expr)
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+# =============================================================================
+# module : benchmark_alazar.py
+# author : Matthieu Dartiailh
+# license : MIT license
+# =============================================================================
+""" Throughput benchmark of the acquisition path of the Alazar drivers.
+
+DemodAlazarTask and TracesAlazarTask are performed against simulated boards
+(see hqc_meas.instruments.dll.alazar_simulator) so that the buffer cycling,
+the demodulation and the assembly of the answers are exercised without the
+ATS library. For each case the best time of a perform and the corresponding
+number of records processed per second are reported, along with the buffers
+counted as late by the driver and the acquisitions aborted because the board
+failed to fill a buffer.
+
+The benchmark can be run from the root of the repository using::
+
+    python -m tests.instruments.benchmark_alazar
+    python -m tests.instruments.benchmark_alazar --records 100000 --save a.json
+
+By default the boards fill the buffers as fast as they are waited for, so the
+throughput is limited by the processing. A finite trigger rate makes the
+boards overflow (aborting the acquisition) when the buffers are not posted
+back in time.
+
+"""
+import sys
+import json
+import platform
+from argparse import ArgumentParser
+from multiprocessing import Event
+from timeit import default_timer
+
+from hqc_meas.tasks.api import RootTask
+from hqc_meas.tasks.tasks_instr.alazar_tasks import (DemodAlazarTask,
+                                                     TracesAlazarTask)
+from hqc_meas.instruments.dll.alazar_simulator import (SimulatedAlazar935x,
+                                                       SimulatedAlazar987x)
+
+
+#: Simulated drivers.
+DRIVERS = {'Alazar935x': SimulatedAlazar935x,
+           'Alazar987x': SimulatedAlazar987x}
+
+#: Benchmarked cases as (task class, driver, task settings). Durations are
+#: in ns and frequencies in MHz as in the tasks.
+CASES = {
+    'demod-935x-average': (DemodAlazarTask, 'Alazar935x',
+                           {'duration': '1000'}),
+    'demod-935x-records': (DemodAlazarTask, 'Alazar935x',
+                           {'duration': '1000', 'average': False}),
+    'demod-935x-steps': (DemodAlazarTask, 'Alazar935x',
+                         {'duration': '1000', 'timestep': '100',
+                          'durationB': '1000', 'timestepB': '100',
+                          'average': False}),
+    'demod-935x-float32': (DemodAlazarTask, 'Alazar935x',
+                           {'duration': '1000', 'timestep': '100',
+                            'average': False, 'precision': 'float32'}),
+    'demod-987x-multi': (DemodAlazarTask, 'Alazar987x',
+                         {'timeaftertrig': '0, 500, 1000, 1500',
+                          'duration': '400, 400, 400, 400',
+                          'freq': '40, 40, 25, 25',
+                          'traceduration': '2000'}),
+    'traces-987x-average': (TracesAlazarTask, 'Alazar987x',
+                            {'timeaftertrig': '2'}),
+    }
+
+
+def make_task(case, records, buffer_records, board):
+    """Build a root task holding the task of a case.
+
+    """
+    task_class, driver, settings = CASES[case]
+    root = RootTask(should_stop=Event(), should_pause=Event())
+    task = task_class(task_name='Acq', selected_driver=driver,
+                      selected_profile='Board',
+                      tracesnumber=str(records),
+                      tracesbuffer=str(buffer_records))
+    for name, value in settings.items():
+        setattr(task, name, value)
+    root.children_task.append(task)
+    root.run_time['drivers'] = DRIVERS
+    root.run_time['profiles'] = {'Board': board}
+    root.task_database.prepare_for_running()
+    return task
+
+
+def run_case(case, records=10000, buffer_records=100, repeats=3, board=None):
+    """Measure the time needed to perform the task of a case.
+
+    The first perform (creating the driver and allocating the buffers) is
+    not timed.
+
+    """
+    task = make_task(case, records, buffer_records, board or {})
+    times = []
+    late = aborted = 0
+    for i in range(repeats + 1):
+        start = default_timer()
+        try:
+            task.perform()
+        except ValueError:
+            # The board failed to fill a buffer.
+            aborted += bool(i)
+            continue
+        if i:
+            times.append(default_timer() - start)
+            late += getattr(task.driver, 'late_buffers', 0)
+
+    best = min(times) if times else float('nan')
+    return {'time': best, 'records_per_sec': records/best,
+            'late': late, 'aborted': aborted}
+
+
+def run_benchmark(cases, records=10000, buffer_records=100, repeats=3,
+                  board=None, report=None):
+    """Run a list of cases.
+
+    """
+    results = {'python': platform.python_version(),
+               'machine': platform.machine(),
+               'records': records, 'buffer_records': buffer_records,
+               'board': board or {}, 'cases': {}}
+    for case in cases:
+        result = run_case(case, records, buffer_records, repeats, board)
+        results['cases'][case] = result
+        if report:
+            report(case, result)
+    return results
+
+
+def _report(name, result):
+    print '{:<24} {:>10.2f} ms {:>12.0f} records/s {:>4} late {:>4} aborted'\
+        .format(name, result['time']*1e3, result['records_per_sec'],
+                result['late'], result['aborted'])
+
+
+class BenchmarkAlazar(object):
+
+    def benchmark_acquisitions(self):
+        # Run all the cases with the default settings.
+        run_benchmark(sorted(CASES), records=2000, report=_report)
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='Benchmark the Alazar acquisition.')
+    parser.add_argument('--cases', default=','.join(sorted(CASES)),
+                        help='Comma separated cases.')
+    parser.add_argument('--records', type=int, default=10000,
+                        help='Number of records per acquisition.')
+    parser.add_argument('--buffer', type=int, default=100,
+                        help='Number of records per buffer.')
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='Number of timed acquisitions per case.')
+    parser.add_argument('--trigger-rate', type=float, default=0.,
+                        help='Trigger rate of the boards (Hz), 0 meaning as '
+                        'fast as possible.')
+    parser.add_argument('--noise', type=float, default=0.01,
+                        help='Noise on the channels (V).')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the simulated boards.')
+    parser.add_argument('--save', help='Path of the json file to write.')
+    args = parser.parse_args(argv)
+
+    board = {'trigger_rate': args.trigger_rate, 'noise': args.noise,
+             'seed': args.seed}
+    results = run_benchmark(args.cases.split(','), args.records, args.buffer,
+                            args.repeats, board, report=_report)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
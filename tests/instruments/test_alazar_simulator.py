@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# =============================================================================
+# module : test_alazar_simulator.py
+# author : Matthieu Dartiailh
+# license : MIT license
+# =============================================================================
+"""
+"""
+import time
+
+import numpy as np
+from nose.tools import assert_equal
+from numpy.testing import assert_allclose
+
+from hqc_meas.instruments.dll.alazar_simulator import (SimulatedATSApi,
+                                                       SimulatedBuffer,
+                                                       SimulatedAlazar935x,
+                                                       SimulatedAlazar987x)
+
+
+TONES = [('A', 40e6, 0.1, 0.), ('B', 25e6, 0.05, 1.0)]
+
+
+def test_demodulate_tones():
+    # Test that the drivers recover the amplitude and phase of the tones.
+    for driver_class in (SimulatedAlazar935x, SimulatedAlazar987x):
+        driver = driver_class({'tones': TONES, 'noise': 0.002, 'seed': 0})
+        demod, trace = driver.get_demod([0, 200e-9], [1000e-9, 400e-9],
+                                        1000, 100, [0, 0], [40e6, 25e6],
+                                        True, 1, 1, 0, 0)
+        names = demod.dtype.names
+        assert_allclose([demod[n][0] for n in names],
+                        [0.1, 0., 0.05*np.cos(1.0), -0.05*np.sin(1.0)],
+                        atol=2e-3)
+
+
+def test_records_and_traces():
+    # Test getting the demodulated records and the averaged traces.
+    driver = SimulatedAlazar987x({'tones': TONES, 'noise': 0., 'seed': 0})
+    demod, trace = driver.get_demod([0, 0], [1000e-9, 100e-9], 1000, 100,
+                                    [100e-9], [40e6], False, 1, 0, 0, 1,
+                                    'float32')
+    assert_equal(demod.shape, (1000, 10))
+    assert_equal(demod['AI0'].dtype, np.float32)
+    assert_allclose(demod['AI0'], 0.1, atol=2e-3)
+    t = np.arange(100)/1e9
+    assert_allclose(trace['B0'][0], 0.05*np.cos(2*np.pi*25e6*t + 1.0),
+                    atol=4e-3)
+
+
+def test_overflow():
+    # Test that the board reports an overflow when a buffer is posted late.
+    api = SimulatedATSApi(1e9, 8, trigger_rate=10000.)
+    buffers = [SimulatedBuffer(1, 2*10*64) for i in range(2)]
+    api.BeforeAsyncRead(1, 3, 0, 64, 10, 40, 0)
+    for buffer in buffers:
+        api.PostAsyncBuffer(1, buffer.addr, buffer.size_bytes)
+    api.StartCapture(1)
+
+    for buffer in buffers:
+        assert_equal(api.WaitAsyncBufferComplete(1, buffer.addr, 100)(),
+                     api.ApiSuccess)
+    time.sleep(2e-3)
+    api.PostAsyncBuffer(1, buffers[0].addr, buffers[0].size_bytes)
+    assert_equal(api.WaitAsyncBufferComplete(1, buffers[0].addr, 100)(),
+                 api.ApiBufferOverflow)
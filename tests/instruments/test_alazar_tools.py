@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+#==============================================================================
+# module : test_alazar_tools.py
+# author : Matthieu Dartiailh
+# license : MIT license
+#==============================================================================
+"""
+"""
+from threading import Event, Timer, active_count
+
+import numpy as np
+from nose.tools import assert_equal, assert_is, assert_true, assert_raises
+from numpy.testing import assert_allclose
+
+from hqc_meas.instruments.dll.alazar_tools import (DMA_POOL_BYTES,
+                                                   DMABufferPool,
+                                                   DemodTableCache,
+                                                   DemodAccumulator,
+                                                   TraceAccumulator,
+                                                   BufferPipeline)
+
+
+class FakeBuffer(object):
+    """Buffer recording its allocation and release.
+
+    """
+    allocated = []
+
+    def __init__(self, bytes_per_sample, size_bytes):
+        self.size_bytes = size_bytes
+        self.released = False
+        self.allocated.append(self)
+
+    def release(self):
+        self.released = True
+
+
+def setup():
+    del FakeBuffer.allocated[:]
+
+
+def test_pool_reuse():
+    # Test that the buffers are reused and grown on demand.
+    pool = DMABufferPool(buffer_class=FakeBuffer)
+    buffers = pool.get(2, 1024, 4)
+    assert_equal(len(buffers), 4)
+    assert_equal(pool.get(2, 1024, 4), buffers)
+
+    more = pool.get(2, 1024, 6)
+    assert_equal(more[:4], buffers)
+    assert_equal(len(FakeBuffer.allocated), 6)
+    assert_equal(pool.get(2, 1024, 2), buffers[:2])
+    assert_equal(pool.nbytes, 6*1024)
+
+    pool.trim()
+    assert_equal(pool.nbytes, 0)
+    assert_true(all(b.released for b in FakeBuffer.allocated))
+
+
+def test_pool_budget():
+    # Test that the least recently used buffers are released when the pool
+    # exceeds its budget but never the ones of the current acquisition.
+    pool = DMABufferPool(max_bytes=4096, buffer_class=FakeBuffer)
+    first = pool.get(2, 1024, 2)
+    second = pool.get(2, 512, 2)
+    pool.get(2, 1024, 2)
+    assert_equal(pool.nbytes, 3072)
+
+    third = pool.get(2, 2048, 2)
+    assert_true(all(b.released for b in second + first))
+    assert_equal(pool.nbytes, 4096)
+
+    big = pool.get(2, 4096, 2)
+    assert_true(all(b.released for b in third))
+    assert_is(pool.get(2, 4096, 2)[0], big[0])
+    assert_equal(pool.nbytes, 8192)
+
+
+def test_pool_alternating_shapes():
+    # Test that alternating between a demodulation and a traces acquisition
+    # keeps the buffers of both.
+    pool = DMABufferPool(buffer_class=FakeBuffer)
+    for i in range(3):
+        demod = pool.get(2, 2**23, 16)
+        traces = pool.get(2, 2**26, 4)
+    assert_equal(len(FakeBuffer.allocated), 20)
+    assert_true(not any(b.released for b in FakeBuffer.allocated))
+    assert_is(pool.get(2, 2**23, 16)[0], demod[0])
+    assert_is(pool.get(2, 2**26, 4)[0], traces[0])
+
+
+def test_pool_default_budget():
+    # Test that sweeping the size of the buffers does not keep all the
+    # previous groups allocated.
+    pool = DMABufferPool(buffer_class=FakeBuffer)
+    for i in range(8):
+        pool.get(2, DMA_POOL_BYTES//8 + 2*i, 2)
+    assert_true(pool.nbytes <= DMA_POOL_BYTES)
+    assert_true(FakeBuffer.allocated[0].released)
+
+
+def batch_demod(data, start, length, block, steps, freq, rate, code, rng):
+    """Demodulation of a whole capture as done before streaming.
+
+    """
+    window = data[:, start:start+length]
+    missing = (-length) % block
+    extended = np.zeros((len(data), length + missing))
+    extended[:, :length] = window
+    folded = np.sum(extended.reshape(len(data), -1, block), axis=1)
+    folded[:, :block-missing] /= length // block + (1 if missing else 0)
+    folded[:, block-missing:] /= length // block
+    volts = (folded/code - 1)*rng
+    dem = np.arange(block)
+    cos = np.cos(2*np.pi*dem*freq/rate)
+    sin = np.sin(2*np.pi*dem*freq/rate)
+    i = 2*np.mean((volts*cos).reshape(len(data), steps, -1), axis=2)
+    q = 2*np.mean((volts*sin).reshape(len(data), steps, -1), axis=2)
+    angle = 2*np.pi*freq*start/rate
+    return (i*np.cos(angle) - q*np.sin(angle),
+            i*np.sin(angle) + q*np.cos(angle))
+
+
+def test_table_cache():
+    # Test that the tables are reused and the least recently used discarded.
+    cache = DemodTableCache(max_tables=2)
+    tables = cache.tables(25e6, 60, 500e6, 32)
+    assert_is(cache.tables(25e6, 60, 500e6, 32), tables)
+    assert_equal(cache.tables(25e6, 60, 500e6, 32, np.float32)[0].dtype,
+                 np.float32)
+    cache.tables(25e6, 60, 500e6, 0)
+    assert_true(cache.tables(25e6, 60, 500e6, 32) is not tables)
+
+    assert_equal(cache.block_size(500, 25e6, 500e6), 20)
+    assert_equal(cache.block_size(500, 30e6, 500e6), 50)
+    assert_equal(cache.block_size(40, 7e6, 500e6), 40)
+
+
+def test_streamed_demodulation():
+    # Test that demodulating buffer by buffer gives the same results as
+    # demodulating the whole capture.
+    data = np.random.randint(0, 4096, (12, 640)).astype(np.uint16)
+    params = [(32, 500, 60, 1), (0, 600, 600, 4)]
+    cache = DemodTableCache()
+    for start, length, block, steps in params:
+        i, q = batch_demod(data, start, length, block, steps, 25e6, 500e6,
+                           2047.5, 0.4)
+        for dtype, rtol in ((np.float64, 1e-7), (np.float32, 1e-3)):
+            tables = cache.tables(25e6, block, 500e6, start, dtype)
+            for average in (False, True):
+                acc = DemodAccumulator(start, length, block, steps, tables,
+                                       2047.5, 0.4, len(data), average, dtype)
+                for k in range(0, len(data), 4):
+                    acc.add(data[k:k+4])
+                res_i, res_q = acc.result()
+                assert_equal(res_i.dtype, dtype)
+                if average:
+                    assert_equal(res_i.shape, (steps,))
+                    assert_allclose(res_i, np.mean(i, axis=0), rtol, 1e-6)
+                    assert_allclose(res_q, np.mean(q, axis=0), rtol, 1e-6)
+                else:
+                    assert_equal(res_i.shape, (len(data), steps))
+                    assert_allclose(res_i, i, rtol, 1e-6)
+                    assert_allclose(res_q, q, rtol, 1e-6)
+
+
+def test_streamed_traces():
+    # Test collecting the traces buffer by buffer.
+    data = np.random.randint(0, 256, (6, 64)).astype(np.uint8)
+    volts = (data[:, 8:40]/127.5 - 1)*0.4
+    for average in (False, True):
+        acc = TraceAccumulator(8, 32, 127.5, 0.4, len(data), average)
+        for k in range(0, len(data), 3):
+            acc.add(data[k:k+3])
+        expected = np.mean(volts, axis=0) if average else volts
+        assert_allclose(acc.result(), expected)
+
+
+class FakeBoard(object):
+    """Board filling the posted buffers in order.
+
+    """
+
+    def __init__(self, buffers, fail=()):
+        self.posted = list(buffers)
+        self.filled = 0
+        self.fail = fail
+
+    def wait(self, buffer):
+        self.filled += 1
+        if self.filled in self.fail:
+            raise ValueError('Buffer overflow')
+        assert_is(self.posted.pop(0), buffer)
+
+    def post(self, buffer):
+        self.posted.append(buffer)
+
+
+def test_pipeline():
+    # Test that the buffers are reposted in order once processed and that
+    # the buffers still in process when needed are counted as late.
+    buffers = [object() for i in range(3)]
+    board = FakeBoard(buffers)
+    processed = []
+    release = Event()
+
+    def process(buffer, index):
+        if index == 0:
+            release.wait()
+        processed.append((buffer, index))
+
+    def wait(buffer):
+        if board.filled == 2:
+            # Let the first buffer be processed only once it is needed again.
+            Timer(0.2, release.set).start()
+        board.wait(buffer)
+
+    pipeline = BufferPipeline(process, workers=2)
+    assert_equal(pipeline.run(buffers, 7, wait, board.post), 7)
+    assert_equal(sorted(i for _, i in processed), list(range(7)))
+    assert_true(all(b is buffers[i % 3] for b, i in processed))
+    assert_equal(pipeline.late, 1)
+
+
+def test_pipeline_failed_wait():
+    # Test that the acquisition is aborted when the board fails to fill a
+    # buffer and that the workers are stopped.
+    buffers = [object() for i in range(2)]
+    board = FakeBoard(buffers, fail=(2,))
+    indexes = []
+    pipeline = BufferPipeline(lambda b, i: indexes.append(i), workers=2)
+    threads = active_count()
+    assert_raises(ValueError, pipeline.run, buffers, 4, board.wait,
+                  board.post)
+    assert_equal(indexes, [0])
+    assert_equal(board.filled, 2)
+    assert_equal(active_count(), threads)
+
+
+def test_pipeline_error():
+    # Test that an error occuring in a worker is raised.
+    buffers = [object() for i in range(2)]
+    board = FakeBoard(buffers)
+
+    def process(buffer, index):
+        raise ValueError()
+
+    pipeline = BufferPipeline(process)
+    assert_raises(ValueError, pipeline.run, buffers, 4, board.wait,
+                  board.post)
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+# =============================================================================
+# module : test_tools.py
+# author : Matthieu Dartiailh
+# license : MIT license
+# =============================================================================
+import os
+import cPickle as pickle
+from multiprocessing.queues import Queue
+from time import sleep
+import numpy as np
+from numpy.testing import assert_array_equal
+from nose.tools import assert_equal, assert_true, assert_false, assert_is
+
+from hqc_meas.tasks.tools.task_database import TaskDatabase
+from hqc_meas.measurement.engines.tools import (MeasureSpy, BATCH_NEWS,
+                                                ThreadMeasureMonitor)
+from hqc_meas.measurement.engines.shared_buffer import (SharedArrayBuffer,
+                                                        SharedArray)
+
+from ...util import complete_line
+
+
+def setup_module():
+    print complete_line(__name__ + ': setup_module()', '~', 78)
+
+
+def teardown_module():
+    print complete_line(__name__ + ': teardown_module()', '~', 78)
+
+
+def drain(queue):
+    news = []
+    while True:
+        new = queue.get(timeout=1)
+        if new == ('', ''):
+            return news
+        news.append(new)
+
+
+def build_database():
+    database = TaskDatabase()
+    database.set_value('root', 'val1', 0)
+    database.set_value('root', 'val2', 0)
+    database.set_value('root', 'val3', 0)
+    database.prepare_for_running()
+    return database
+
+
+def test_spy():
+    # Test that in default mode every update is sent.
+    database = build_database()
+    queue = Queue()
+    spy = MeasureSpy(queue, ['root/val1', 'root/val2'], database)
+    for i in range(3):
+        database.set_value('root', 'val1', i)
+    database.set_value('root', 'val3', 1)
+    spy.close()
+    assert_equal(drain(queue),
+                 [('root/val1', 0), ('root/val1', 1), ('root/val1', 2)])
+
+
+def test_coalescing_spy():
+    # Test that updates are coalesced and sent as batches.
+    database = build_database()
+    queue = Queue()
+    spy = MeasureSpy(queue, ['root/val1', 'root/val2'], database, 0.05)
+    for i in range(100):
+        database.set_value('root', 'val1', i)
+    database.set_value('root', 'val2', 1)
+    database.set_value('root', 'val3', 1)
+    sleep(0.2)
+    database.set_value('root', 'val2', 2)
+    spy.close()
+
+    news = drain(queue)
+    assert_true(all(n[0] == BATCH_NEWS for n in news))
+    assert_equal(news[0][1], {'root/val1': 99, 'root/val2': 1})
+    assert_equal(news[-1][1], {'root/val2': 2})
+
+
+def test_shared_buffer():
+    # Test writing and reading arrays through the ring buffer.
+    buf = SharedArrayBuffer(1024)
+    try:
+        array = np.arange(64, dtype=np.float64)
+        desc = buf.write(array)
+        assert_equal(desc.position, 0)
+        view = buf.read(pickle.loads(pickle.dumps(desc)))
+        assert_array_equal(view, array)
+
+        # Reopen the buffer as done in the subprocess.
+        other = pickle.loads(pickle.dumps(buf))
+        desc2 = other.write(np.ones((2, 4), dtype=np.complex128))
+        assert_equal(desc2.position, 512)
+        assert_array_equal(buf.read(desc2), np.ones((2, 4)))
+
+        # Too big or object arrays are not stored.
+        assert_is(buf.write(np.zeros(200)), None)
+        assert_is(buf.write(np.array([None])), None)
+
+        # Wrapping around invalidates the oldest data.
+        desc3 = other.write(array)
+        assert_equal(desc3.position, 1024)
+        assert_is(buf.read(desc), None)
+        assert_array_equal(buf.read(desc3), array)
+    finally:
+        buf.close()
+    assert_false(os.path.isfile(buf.path))
+
+
+def test_shared_buffer_copy():
+    # Test that the arrays read are not altered when the ring wraps around.
+    buf = SharedArrayBuffer(1024)
+    try:
+        array = np.arange(64, dtype=np.float64)
+        read = buf.read(buf.write(array))
+        buf.write(np.zeros(64))
+        buf.write(np.zeros(64))
+        assert_array_equal(read, array)
+    finally:
+        buf.close()
+    assert_false(os.path.isfile(buf.path))
+    # Closing twice is harmless.
+    buf.close()
+
+
+def test_spy_shared_buffer():
+    # Test that big arrays go through the shared buffer.
+    database = build_database()
+    queue = Queue()
+    buf = SharedArrayBuffer(2**20)
+    spy = MeasureSpy(queue, ['root/val1', 'root/val2'], database,
+                     shared_buffer=buf)
+    spy.shared_threshold = 100
+    database.set_value('root', 'val1', np.arange(10))
+    database.set_value('root', 'val2', np.arange(100))
+    spy.close()
+    news = drain(queue)
+    assert_array_equal(news[0][1], np.arange(10))
+    assert_true(isinstance(news[1][1], SharedArray))
+
+    monitor = ThreadMeasureMonitor(None, queue, buf)
+    name, value = monitor._unpack(news[1])
+    assert_array_equal(value, np.arange(100))
+    buf.close()
@@ -18,6 +18,7 @@ with enaml.imports():
 from hqc_meas.measurement.monitors.text_monitor.monitor import TextMonitor
 from hqc_meas.measurement.monitors.text_monitor.rules import (RejectRule,
                                                               FormatRule)
+from hqc_meas.measurement.engines.tools import BATCH_NEWS
 
 from ...util import (complete_line, process_app_events, remove_tree,
                      create_test_dir)
@@ -377,6 +378,25 @@ class TestMonitor(object):
         assert_equal(self.monitor.displayed_entries[1].value, '2')
         assert_equal(self.monitor.displayed_entries[2].value, '2/10')
 
+    def test_process_batched_news(self):
+        """ Test processing batched news coming from a database.
+
+        """
+        rule = FormatRule(name='Test', suffixes=['loop', 'index'],
+                          new_entry_suffix='progress',
+                          new_entry_formatting='{index}/{loop}',
+                          hide_entries=False)
+        self.monitor.rules.append(rule)
+        self.monitor.database_modified({'value': ('root/test_loop', 10)})
+        self.monitor.database_modified({'value': ('root/test_index', 1)})
+
+        self.monitor.process_news((BATCH_NEWS, {'root/test_index': 2,
+                                                'root/test_loop': 20}))
+        process_app_events()
+        assert_equal(self.monitor.displayed_entries[0].value, '20')
+        assert_equal(self.monitor.displayed_entries[1].value, '2')
+        assert_equal(self.monitor.displayed_entries[2].value, '2/20')
+
     def test_clear_state(self):
         """ Test clearing the monitor state.
 
@@ -155,3 +155,17 @@ class BenchmarkCompilation(object):
 
         print 'Conditional seq 2', time(partial(self.root.compile_sequence,
                                                 False))
+
+    def benchmark_sequence_compilation_chain(self):
+        # Test compiling a long chain of pulses defined in reverse order.
+        n = 300
+        pulses = [Pulse(def_1='{{{}_start}} - 1.0'.format(i + 2),
+                        def_2='0.5', def_mode='Start/Duration')
+                  for i in range(n - 1)]
+        pulses.append(Pulse(def_1='{}'.format(n), def_2='0.5',
+                            def_mode='Start/Duration'))
+        self.root.items.extend(pulses)
+
+        duration = min(repeat(partial(self.root.compile_sequence, False),
+                              number=1, repeat=10))
+        print 'Chain of {} pulses'.format(n), duration
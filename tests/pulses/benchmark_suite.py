@@ -0,0 +1,481 @@
+# -*- coding: utf-8 -*-
+# =============================================================================
+# module : benchmark_suite.py
+# author : Matthieu Dartiailh
+# license : MIT license
+# =============================================================================
+""" Compile-time benchmark suite of the pulses package.
+
+Synthetic sequences of 10 to 10^4 pulses (flat, nested, conditional or made of
+templates) are compiled through the AWG and Tabor contexts. For each case the
+compilation time, the peak memory used by the compilation and the number of
+bytes produced per channel are measured. The results can be saved to a json
+baseline and later compared to it to detect regressions.
+
+No instrument is needed, the suite can be run from the root of the repository
+using::
+
+    python -m tests.pulses.benchmark_suite --save baseline.json
+    python -m tests.pulses.benchmark_suite --compare baseline.json
+
+"""
+import sys
+import json
+import platform
+from math import ceil
+from argparse import ArgumentParser
+from multiprocessing import Process, Pipe
+from timeit import repeat
+from configobj import ConfigObj
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from hqc_meas.pulses.base_sequences import RootSequence, Sequence
+from hqc_meas.pulses.pulse import Pulse
+from hqc_meas.pulses.sequences.conditional_sequence import ConditionalSequence
+from hqc_meas.pulses.sequences.template_sequence import TemplateSequence
+from hqc_meas.pulses.shapes.base_shapes import SquareShape, GaussianShape
+from hqc_meas.pulses.shapes.modulation import Modulation
+from hqc_meas.pulses.contexts.awg_context import AWGContext
+from hqc_meas.pulses.contexts.tabor_context import TABORContext
+from hqc_meas.pulses.contexts.template_context import TemplateContext
+from hqc_meas.pulses.waveform_cache import WAVEFORM_CACHE
+
+
+#: Number of pulses of the synthetic sequences.
+SIZES = (10, 100, 1000, 10000)
+
+#: Way the pulses are organised in the synthetic sequences.
+STRUCTURES = ('flat', 'nested', 'conditional', 'template')
+
+#: Contexts used for the compilation and the compilation methods they support.
+CONTEXTS = {'AWG': (AWGContext, ('sequence', 'loop')),
+            'TABOR': (TABORContext, ('sequence',))}
+
+#: Channels used by the synthetic sequences for each context.
+CHANNELS = {'AWG': ('Ch1_A', 'Ch2_A', 'Ch1_M1', 'Ch2_M2'),
+            'TABOR': ('Ch1_A', 'Ch2_A', 'Ch1_M1', 'Ch3_M1')}
+
+#: Number of pulses of the groups forming sequences and templates.
+GROUP_SIZE = 10
+
+#: Time between the starts of two consecutive groups (mus). The groups are
+#: separated by more than 256 points so that compile_loop splits them.
+GROUP_SPAN = 1.0
+
+#: Time before the first group (mus).
+LEAD = 1.0
+
+#: Time between the starts of two consecutive pulses of a channel (mus).
+SLOT = 0.2
+
+#: Duration of the pulses (mus).
+DURATION = 0.1
+
+
+def _group_start(k):
+    """ Start of the group to which the k-th pulse belongs.
+
+    """
+    return LEAD + GROUP_SPAN*(k//GROUP_SIZE)
+
+
+def _pulse(k, channels, relative=False):
+    """ Create the k-th pulse of a synthetic sequence.
+
+    All groups have the same layout. The first two channels are analogical
+    and the last two logical. If relative is True the start of the pulse is
+    given with respect to the start of its group.
+
+    """
+    i = k % GROUP_SIZE
+    channel = channels[i % 4]
+    start = SLOT*(i//4)
+    if not relative:
+        start += _group_start(k)
+    start = '{}'.format(start)
+    if i % 4 < 2:
+        if i % 8 < 4:
+            shape = SquareShape(amplitude='0.5')
+        else:
+            shape = GaussianShape(amplitude='0.5', width='0.02')
+        mod = Modulation(frequency='{freq}', kind='sin', activated=True)
+        return Pulse(kind='Analogical', channel=channel, def_1=start,
+                     def_2='{}'.format(DURATION), def_mode='Start/Duration',
+                     shape=shape, modulation=mod)
+
+    return Pulse(channel=channel, def_1=start, def_2='{}'.format(DURATION),
+                 def_mode='Start/Duration')
+
+
+def _template_dependencies(channels):
+    """ Build the dependencies needed to create the template sequences.
+
+    The template is a group of pulses whose times are relative to its start.
+    It uses two analogical channels (A1, A2) and two logical ones (L1, L2).
+
+    """
+    names = ('A1', 'A2', 'L1', 'L2')
+    root = RootSequence()
+    root.context = TemplateContext(logical_channels=['L1', 'L2'],
+                                   analogical_channels=['A1', 'A2'],
+                                   channel_mapping=dict.fromkeys(names, ''))
+    for k in range(GROUP_SIZE):
+        root.items.append(_pulse(k, names, True))
+
+    pref = root.preferences_from_members()
+    pref['template_vars'] = repr(dict(freq=''))
+    del pref['item_class']
+    del pref['external_vars']
+    del pref['time_constrained']
+    conf = ConfigObj()
+    conf.update(pref)
+
+    dep = {'Sequence': Sequence, 'Pulse': Pulse,
+           'TemplateSequence': TemplateSequence,
+           'shapes': {'SquareShape': SquareShape,
+                      'GaussianShape': GaussianShape},
+           'contexts': {'TemplateContext': TemplateContext},
+           'templates': {'group': ('', conf, '')}}
+    return {'pulses': dep}, dict(zip(names, channels))
+
+
+def make_sequence(size, structure, context):
+    """ Build a synthetic sequence.
+
+    Parameters
+    ----------
+    size : int
+        Number of pulses of the sequence.
+
+    structure : {'flat', 'nested', 'conditional', 'template'}
+        Organisation of the pulses. Nested sequences are made of groups of
+        GROUP_SIZE pulses themselves grouped in sequences. In conditional
+        sequences every other group is excluded. Template sequences are made
+        of templates of GROUP_SIZE pulses.
+
+    context : {'AWG', 'TABOR'}
+        Name of the context to use.
+
+    Returns
+    -------
+    root : RootSequence
+        Sequence ready to be compiled.
+
+    """
+    channels = CHANNELS[context]
+    root = RootSequence()
+    root.context = CONTEXTS[context][0]()
+    root.external_vars = {'freq': 50.0, 'include': True}
+    root.time_constrained = True
+    # The Tabor context requires a duration multiple of 16.
+    duration = _group_start(size - 1) + GROUP_SPAN
+    root.sequence_duration = '{}'.format(16*int(ceil(duration/16)))
+
+    groups = range(0, size, GROUP_SIZE)
+    if structure == 'flat':
+        root.items = [_pulse(k, channels) for k in range(size)]
+
+    elif structure == 'nested':
+        subs = [Sequence(items=[_pulse(k, channels)
+                                for k in range(g, min(g + GROUP_SIZE, size))])
+                for g in groups]
+        root.items = [Sequence(items=subs[i:i + GROUP_SIZE])
+                      for i in range(0, len(subs), GROUP_SIZE)]
+
+    elif structure == 'conditional':
+        conditions = ('{include}', 'not {include}')
+        root.items = [ConditionalSequence(
+            condition=conditions[(g//GROUP_SIZE) % 2],
+            items=[_pulse(k, channels)
+                   for k in range(g, min(g + GROUP_SIZE, size))])
+            for g in groups]
+
+    elif structure == 'template':
+        dependencies, mapping = _template_dependencies(channels)
+        templates = []
+        for g in groups:
+            conf = {'template_id': 'group', 'name': 'Group',
+                    'template_vars': "{'freq': '{freq}'}",
+                    'def_1': '{}'.format(_group_start(g)),
+                    'def_2': '{}'.format(GROUP_SPAN),
+                    'def_mode': 'Start/Duration'}
+            template = TemplateSequence.build_from_config(conf, dependencies)
+            template.context.channel_mapping = mapping
+            templates.append(template)
+        root.items = templates
+
+    else:
+        raise ValueError('Unknown structure {}'.format(structure))
+
+    return root
+
+
+def case_name(case):
+    """ Name under which the results of a case are stored.
+
+    """
+    return '{size}-{structure}-{context}-{method}'.format(**case)
+
+
+def list_cases(sizes=SIZES, structures=STRUCTURES, contexts=sorted(CONTEXTS)):
+    """ List all the cases of the suite.
+
+    """
+    return [dict(size=size, structure=structure, context=context,
+                 method=method)
+            for size in sizes
+            for structure in structures
+            for context in contexts
+            for method in CONTEXTS[context][1]]
+
+
+def _peak_memory():
+    """ Peak resident memory of the process in bytes.
+
+    """
+    if resource is None:
+        return 0
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on Mac and in kilobytes on Linux.
+    return usage if sys.platform == 'darwin' else usage*1024
+
+
+def _produced_bytes(method, result):
+    """ Number of bytes produced per channel by a compilation.
+
+    """
+    if method == 'sequence':
+        return dict((str(ch), len(buf)) for ch, buf in result[1].items())
+
+    produced = {}
+    for ch, segments in result[1].items():
+        unique = dict((id(s), len(s)) for s in segments)
+        produced[str(ch)] = sum(unique.values())
+    return produced
+
+
+def run_case(case, number=None, repeats=3):
+    """ Measure the compilation of a synthetic sequence.
+
+    The waveform cache is cleared before each compilation. The peak memory is
+    only meaningful if the case is run in a fresh process (see
+    run_isolated).
+
+    Parameters
+    ----------
+    case : dict
+        Description of the case as returned by list_cases.
+
+    number : int, optional
+        Number of compilations per timing. By default it is chosen so that a
+        timing involves about 10^4 pulses.
+
+    repeats : int, optional
+        Number of timings, the best one is kept.
+
+    Returns
+    -------
+    result : dict
+        Time per compilation (s), increase of the peak memory during the first
+        compilation (bytes) and bytes produced per channel.
+
+    """
+    root = make_sequence(case['size'], case['structure'], case['context'])
+    compile_ = (root.compile_sequence if case['method'] == 'sequence'
+                else root.compile_loop)
+
+    def compilation():
+        WAVEFORM_CACHE.clear()
+        return compile_()
+
+    before = _peak_memory()
+    result = compilation()
+    peak = _peak_memory() - before
+    if not result[0]:
+        raise RuntimeError('Failed to compile {} : {}'.format(case_name(case),
+                                                              result[1]))
+
+    number = number or max(1, 10000//case['size'])
+    best = min(repeat(compilation, number=number, repeat=repeats))
+    return {'time': best/number, 'peak_memory': peak,
+            'bytes': _produced_bytes(case['method'], result)}
+
+
+def _run_in_child(conn, case, number, repeats):
+    """ Run a case and send back its results through a pipe.
+
+    """
+    try:
+        conn.send((True, run_case(case, number, repeats)))
+    except Exception as e:
+        conn.send((False, repr(e)))
+    finally:
+        conn.close()
+
+
+def run_isolated(case, number=None, repeats=3):
+    """ Run a case in a fresh process to get a meaningful peak memory.
+
+    """
+    parent, child = Pipe(False)
+    process = Process(target=_run_in_child,
+                      args=(child, case, number, repeats))
+    process.start()
+    child.close()
+    try:
+        success, result = parent.recv()
+    finally:
+        process.join()
+    if not success:
+        raise RuntimeError(result)
+    return result
+
+
+def run_suite(cases, number=None, repeats=3, isolate=True, report=None):
+    """ Run the cases of the suite.
+
+    Parameters
+    ----------
+    cases : list
+        Cases to run as returned by list_cases.
+
+    isolate : bool, optional
+        Run each case in its own process.
+
+    report : callable, optional
+        Function called with the name and the result of each case.
+
+    Returns
+    -------
+    results : dict
+        Results of the suite ready to be saved as a baseline.
+
+    """
+    runner = run_isolated if isolate else run_case
+    results = {}
+    for case in cases:
+        name = case_name(case)
+        results[name] = runner(case, number, repeats)
+        if report:
+            report(name, results[name])
+
+    return {'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cases': results}
+
+
+def save_results(results, path):
+    """ Save the results of the suite as a json baseline.
+
+    """
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load_results(path):
+    """ Load a json baseline.
+
+    """
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare_results(results, baseline, time_tolerance=0.25,
+                    memory_tolerance=0.25):
+    """ Compare the results of the suite to a baseline.
+
+    Only the cases present in both are compared. The number of bytes produced
+    per channel must be identical as any difference means the compilation
+    result changed.
+
+    Parameters
+    ----------
+    results, baseline : dict
+        Results of the suite as returned by run_suite.
+
+    time_tolerance, memory_tolerance : float, optional
+        Relative increase above which the time or the peak memory is
+        considered as a regression.
+
+    Returns
+    -------
+    regressions : list
+        Tuple (case name, measure, baseline value, new value) for each
+        regression.
+
+    """
+    regressions = []
+    base_cases = baseline['cases']
+    for name, result in sorted(results['cases'].items()):
+        if name not in base_cases:
+            continue
+        base = base_cases[name]
+        for measure, tolerance in (('time', time_tolerance),
+                                   ('peak_memory', memory_tolerance)):
+            if result[measure] > base[measure]*(1 + tolerance):
+                regressions.append((name, measure, base[measure],
+                                    result[measure]))
+        if result['bytes'] != base['bytes']:
+            regressions.append((name, 'bytes', base['bytes'],
+                                result['bytes']))
+
+    return regressions
+
+
+def _report(name, result):
+    print '{:<36} {:>10.3f} ms {:>10.1f} MB {}'.format(
+        name, result['time']*1e3, result['peak_memory']/2.0**20,
+        sorted(result['bytes'].items()))
+
+
+class BenchmarkSuite(object):
+
+    def benchmark_small_sequences(self):
+        # Run the suite for the small sequences.
+        run_suite(list_cases(sizes=(10, 100)), isolate=False, report=_report)
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='Benchmark the pulses compilation.')
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES)),
+                        help='Comma separated numbers of pulses.')
+    parser.add_argument('--structures', default=','.join(STRUCTURES),
+                        help='Comma separated structures of the sequences.')
+    parser.add_argument('--contexts', default=','.join(sorted(CONTEXTS)),
+                        help='Comma separated contexts.')
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='Number of timings per case.')
+    parser.add_argument('--save', help='Path of the json baseline to write.')
+    parser.add_argument('--compare', help='Path of the json baseline to '
+                        'compare to.')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Relative increase considered a regression.')
+    parser.add_argument('--no-isolation', action='store_true',
+                        help='Run all the cases in the current process.')
+    args = parser.parse_args(argv)
+
+    cases = list_cases([int(s) for s in args.sizes.split(',')],
+                       args.structures.split(','), args.contexts.split(','))
+    results = run_suite(cases, repeats=args.repeats,
+                        isolate=not args.no_isolation, report=_report)
+
+    if args.save:
+        save_results(results, args.save)
+
+    if args.compare:
+        regressions = compare_results(results, load_results(args.compare),
+                                      args.tolerance, args.tolerance)
+        for regression in regressions:
+            print 'Regression in {} ({}): {} -> {}'.format(*regression)
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
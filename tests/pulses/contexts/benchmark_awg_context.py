@@ -10,16 +10,17 @@ from nose.tools import assert_true
 
 
 def time(*args, **kwargs):
-    kwargs['number'] = 100
-    kwargs['repeat'] = 100
+    kwargs.setdefault('number', 100)
+    kwargs.setdefault('repeat', 100)
     return min(repeat(*args, **kwargs))/kwargs['number']
 
 from hqc_meas.pulses.base_sequences import RootSequence, Sequence
 from hqc_meas.pulses.pulse import Pulse
 from hqc_meas.pulses.sequences.conditional_sequence import ConditionalSequence
-from hqc_meas.pulses.shapes.base_shapes import SquareShape
+from hqc_meas.pulses.shapes.base_shapes import SquareShape, GaussianShape
 from hqc_meas.pulses.shapes.modulation import Modulation
 from hqc_meas.pulses.contexts.awg_context import AWGContext
+from hqc_meas.pulses.waveform_cache import WAVEFORM_CACHE
 
 
 class BenchmarkCompilation(object):
@@ -182,3 +183,74 @@ class BenchmarkCompilation(object):
         assert_true(self.root.compile_sequence()[0])
 
         print 'Conditional seq 2', time(partial(self.root.compile_sequence))
+
+    def benchmark_repeated_pulses_waveforms(self):
+        # Test generating the waveforms of a train of identical modulated
+        # pulses with and without the waveform cache.
+        pulses = []
+        for i in range(50):
+            mod = Modulation(frequency='10.0', kind='sin', activated=True)
+            pulses.append(Pulse(kind='Analogical', channel='Ch1_A',
+                                def_1='{}'.format(5*i), def_2='4.0',
+                                def_mode='Start/Duration', modulation=mod,
+                                shape=SquareShape(amplitude='0.5')))
+        self.root.items = pulses
+
+        assert_true(self.root.compile_sequence()[0])
+
+        def cached():
+            return [p.waveform for p in pulses]
+
+        def uncached():
+            for p in pulses:
+                WAVEFORM_CACHE.clear()
+                p.waveform
+
+        print 'Repeated pulses (cached)', time(cached, number=10, repeat=10)
+        print 'Repeated pulses (uncached)', time(uncached, number=10,
+                                                 repeat=10)
+
+    def benchmark_long_sequence_compilation(self):
+        # Test compiling a 1 ms long sequence using analogical and logical
+        # channels.
+        self.root.time_constrained = True
+        self.root.sequence_duration = '1000'
+        self.context.inverted_log_channels = ['Ch1_M2']
+        pulse1 = Pulse(kind='Analogical', channel='Ch1_A', def_1='10',
+                       def_2='990', shape=SquareShape(amplitude='0.5'))
+        pulse2 = Pulse(channel='Ch1_M1', def_1='10', def_2='20')
+        pulse3 = Pulse(channel='Ch2_M2', def_1='500', def_2='990')
+        self.root.items = [pulse1, pulse2, pulse3]
+
+        assert_true(self.root.compile_sequence()[0])
+
+        print 'Long sequence', time(self.root.compile_sequence, number=5,
+                                    repeat=5)
+
+    def benchmark_pulse_train_compilation(self):
+        # Test compiling through the context a dynamical decoupling like train
+        # of short modulated pulses with a cold waveform cache.
+        self.root.external_vars = {'phi': 0.3}
+        pulses = []
+        for i in range(2000):
+            mod = Modulation(frequency='{}'.format(10 + i % 7), kind='cos',
+                             phase='{phi}', activated=True)
+            # Distinct amplitudes so that no waveform is shared.
+            amplitude = '{}'.format(0.3 + 1e-4*i)
+            shape = (SquareShape(amplitude=amplitude) if i % 2 else
+                     GaussianShape(amplitude=amplitude, width='0.005'))
+            pulses.append(Pulse(kind='Analogical', channel='Ch1_A',
+                                def_1='{}'.format(0.1*i + 0.013*(i % 5)),
+                                def_2='0.02', def_mode='Start/Duration',
+                                modulation=mod, shape=shape))
+        self.root.items = pulses
+
+        res, compiled = self.root.compile_sequence(False)
+        assert_true(res)
+
+        def context_compilation():
+            WAVEFORM_CACHE.clear()
+            self.context.compile_sequence(compiled)
+
+        print 'Pulse train (context)', time(context_compilation, number=1,
+                                            repeat=5)
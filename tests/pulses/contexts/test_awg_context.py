@@ -6,9 +6,11 @@
 # =============================================================================
 import numpy as np
 from nose.tools import (assert_equal, assert_true, assert_sequence_equal,
-                        assert_in, assert_false)
+                        assert_in, assert_false, assert_is, assert_is_not)
 
-from hqc_meas.pulses.contexts.awg_context import AWGContext
+from hqc_meas.pulses.contexts.awg_context import (AWGContext, waveform_digest,
+                                                  pack_samples, packed_buffer,
+                                                  PACKING_CHUNK)
 from hqc_meas.pulses.base_sequences import RootSequence, Sequence
 from hqc_meas.pulses.pulse import Pulse
 from hqc_meas.pulses.shapes.base_shapes import SquareShape
@@ -225,3 +227,80 @@ class TestAWGContext(object):
         assert_true(res)
         assert_equal(len(arrays), 3)
         assert_equal(sorted(arrays.keys()), sorted([1, 2, 3]))
+
+    def test_incremental_compilation(self):
+        # Test that updating a sequence gives the same result as compiling it
+        # from scratch.
+        self.root.time_constrained = True
+        self.root.sequence_duration = '1'
+        self.root.external_vars = {'t': 0.1, 'amp': 0.5}
+        self.context.inverted_log_channels = ['Ch1_M2']
+        pulse1 = Pulse(kind='Analogical',
+                       shape=SquareShape(amplitude='{amp}'),
+                       def_1='{t}', def_2='0.2', channel='Ch1_A',
+                       def_mode='Start/Duration')
+        pulse2 = Pulse(kind='Logical', def_1='{1_start}', def_2='0.6',
+                       channel='Ch1_M2')
+        pulse3 = Pulse(kind='Analogical', shape=SquareShape(amplitude='0.3'),
+                       def_1='0.7', def_2='0.9', channel='Ch2_A')
+        self.root.items = [pulse1, pulse2, pulse3]
+
+        res, arrays = self.root.compile_sequence(incremental=True)
+        assert_true(res)
+        first = {ch: bytearray(arrays[ch]) for ch in arrays}
+        first_arrays = arrays
+
+        for t, amp in ((0.2, 0.5), (0.3, -0.2), (0.3, 0.1)):
+            self.root.external_vars = {'t': t, 'amp': amp}
+            res, arrays = self.root.compile_sequence(incremental=True)
+            assert_true(res)
+            res, expected = self.root.compile_sequence()
+            assert_true(res)
+            assert_equal(sorted(arrays), sorted(expected))
+            for ch in expected:
+                assert_sequence_equal(arrays[ch], expected[ch])
+            # Restore the incremental state.
+            self.root.compile_sequence(incremental=True)
+
+        # The results of the previous compilations were not altered.
+        for ch in first:
+            assert_equal(first_arrays[ch], first[ch])
+
+    def test_loop_segments_deduplication(self):
+        # Test that identical segments of a loop compilation are encoded once
+        # even when they appear on different channels.
+        self.root.time_constrained = True
+        self.root.sequence_duration = '10'
+        pulse1 = Pulse(kind='Analogical', shape=SquareShape(amplitude='0.5'),
+                       def_1='1.0', def_2='2.0', channel='Ch1_A')
+        pulse2 = Pulse(kind='Analogical', shape=SquareShape(amplitude='0.5'),
+                       def_1='5.0', def_2='6.0', channel='Ch1_A')
+        pulse3 = Pulse(kind='Logical', def_1='1.0', def_2='2.0',
+                       channel='Ch2_M1')
+        self.root.items = [pulse1, pulse2, pulse3]
+
+        res, arrays, repeats = self.root.compile_loop()
+        assert_true(res)
+        assert_equal(len(arrays[1]), len(repeats))
+        # Both pulses on Ch1 share their segment.
+        assert_is(arrays[1][2], arrays[1][5])
+        # Zero segments are shared between channels.
+        assert_is(arrays[1][1], arrays[2][1])
+        assert_is_not(arrays[2][2], arrays[2][5])
+        assert_equal(waveform_digest(arrays[1][2]),
+                     waveform_digest(bytearray(arrays[1][5])))
+
+
+def test_pack_samples():
+    # Test packing samples over several chunks against a direct computation.
+    length = 2*PACKING_CHUNK + 10
+    analog = np.arange(length, dtype=np.uint16) % 2**14
+    m1 = (np.arange(length) % 3 == 0).astype(np.int8)
+    m2 = (np.arange(length) % 5 == 0).astype(np.int8)
+
+    buf, view = packed_buffer(length)
+    pack_samples(analog, m1, m2, view, invert_m2=True)
+
+    expected = analog + m1.astype(np.uint16)*2**14 + (1 - m2)*2**15
+    assert_equal(len(buf), 2*length)
+    assert_true(np.array_equal(np.frombuffer(buf, dtype='<u2'), expected))
@@ -1156,6 +1156,56 @@ class TestCompilation(object):
         assert_false(missings)
         assert_in('test-stop', errors)
 
+    def test_sequence_compilation18(self):
+        # Test compiling a long chain of pulses defined in reverse order.
+        n = 300
+        pulses = [Pulse(def_1='{{{}_start}} - 1.0'.format(i + 2),
+                        def_2='0.5', def_mode='Start/Duration')
+                  for i in range(n - 1)]
+        pulses.append(Pulse(def_1='{}'.format(n), def_2='0.5',
+                            def_mode='Start/Duration'))
+        self.root.items.extend(pulses)
+
+        res, compiled = self.root.compile_sequence(False)
+        assert_true(res)
+        assert_equal(len(compiled), n)
+        for i, pulse in enumerate(compiled):
+            assert_equal(pulse.start, i + 1)
+            assert_equal(pulse.stop, i + 1.5)
+
+    def test_sequence_compilation19(self):
+        # Test that only the names forming a cycle are reported and not the
+        # ones depending on it.
+        self.root.external_vars = {'a': 1.5}
+
+        pulse1 = Pulse(def_1='{a}', def_2='{2_start} + 1.0')
+        pulse2 = Pulse(def_1='{1_stop}', def_2='{1_stop} + 1.0')
+        pulse3 = Pulse(def_1='{2_start}', def_2='{2_start} + 1.0')
+        pulse4 = Pulse(def_1='{3_start}', def_2='{3_start} + 1.0')
+        self.root.items.extend([pulse1, pulse2, pulse3, pulse4])
+
+        res, (missings, errors) = self.root.compile_sequence(False)
+        assert_false(res)
+        assert_equal(missings, set(['1_stop', '2_start']))
+        assert_false(errors)
+
+    def test_sequence_compilation20(self):
+        # Test compiling a nested sequence whose local vars depend on a pulse
+        # defined after the sequence.
+        self.root.external_vars = {'a': 1.5}
+
+        pulse1 = Pulse(def_1='1.0', def_2='{b}')
+        pulse2 = Pulse(def_1='{a} + 1.0', def_2='3.0')
+
+        sequence1 = Sequence(items=[pulse1], local_vars={'b': '{3_start}'})
+
+        self.root.items = [sequence1, pulse2]
+
+        res, pulses = self.root.compile_sequence(False)
+        assert_true(res)
+        assert_equal(len(pulses), 2)
+        assert_equal(pulses[0].stop, 2.5)
+
     def test_conditional_sequence_compilation1(self):
         # Test compiling a conditional sequence whose condition evaluates to
         # False.
@@ -1245,3 +1295,110 @@ class TestCompilation(object):
         res, (missings, errors) = self.root.compile_sequence(False)
         assert_false(res)
         assert_in('2_condition', errors)
+
+    def test_incremental_compilation1(self):
+        # Test that only the pulses depending on a modified external var are
+        # evaluated again.
+        self.root.external_vars = {'a': 1.5}
+
+        pulse1 = Pulse(def_1='1.0', def_2='{a}')
+        pulse2 = Pulse(def_1='{1_stop} + 1.0', def_2='3.5')
+        pulse3 = Pulse(def_1='4.0', def_2='5.0')
+        self.root.items.extend([pulse1, pulse2, pulse3])
+
+        res, pulses = self.root.compile_sequence(False, incremental=True)
+        assert_true(res)
+
+        # Editing the sequence is not detected so this entry is not used.
+        pulse3.def_1 = '4.5'
+        self.root.external_vars = {'a': 2.0}
+        res, pulses = self.root.compile_sequence(False, incremental=True)
+        assert_true(res)
+        assert_equal(len(pulses), 3)
+        assert_equal(pulses[0].stop, 2.0)
+        assert_equal(pulses[1].start, 3.0)
+        assert_equal(pulses[2].start, 4.0)
+
+        # A non incremental compilation starts from scratch.
+        res, pulses = self.root.compile_sequence(False)
+        assert_true(res)
+        assert_equal(pulses[2].start, 4.5)
+
+    def test_incremental_compilation2(self):
+        # Test incremental compilation of a conditional sequence whose
+        # condition changes.
+        self.root.external_vars = {'a': 1.5, 'include': True}
+
+        pulse1 = Pulse(def_1='0.5', def_2='{a}')
+        pulse2 = Pulse(def_1='{a} + 1.0', def_2='3.0')
+        pulse3 = Pulse(def_1='3.0', def_2='0.5', def_mode='Start/Duration')
+
+        sequence1 = ConditionalSequence(items=[pulse2],
+                                        condition='{include}')
+        self.root.items = [pulse1, sequence1, pulse3]
+
+        res, pulses = self.root.compile_sequence(False, incremental=True)
+        assert_true(res)
+        assert_equal(len(pulses), 3)
+
+        self.root.external_vars = {'a': 1.5, 'include': False}
+        res, pulses = self.root.compile_sequence(False, incremental=True)
+        assert_true(res)
+        assert_equal(len(pulses), 2)
+
+        self.root.external_vars = {'a': 1.0, 'include': True}
+        res, pulses = self.root.compile_sequence(False, incremental=True)
+        assert_true(res)
+        assert_equal(len(pulses), 3)
+        assert_equal(pulses[1].start, 2.0)
+
+    def test_incremental_compilation2bis(self):
+        # Test that the values published by a conditional sequence are
+        # forgotten when its condition is no longer met.
+        self.root.external_vars = {'include': True}
+
+        pulse1 = Pulse(def_1='0.5', def_2='1.0')
+        pulse2 = Pulse(def_1='1.5', def_2='2.0')
+        sequence1 = ConditionalSequence(items=[pulse2],
+                                        condition='{include}')
+        pulse3 = Pulse(def_1='{3_stop} + 0.5', def_2='3.0')
+        self.root.items = [pulse1, sequence1, pulse3]
+
+        res, pulses = self.root.compile_sequence(False, incremental=True)
+        assert_true(res)
+        assert_equal(pulses[2].start, 2.5)
+
+        self.root.external_vars = {'include': False}
+        res, (missings, errors) = self.root.compile_sequence(False)
+        assert_false(res)
+        assert_in('3_stop', missings)
+
+        self.root.compile_sequence(False, incremental=True)
+        self.root.external_vars = {'include': True}
+        self.root.compile_sequence(False, incremental=True)
+        self.root.external_vars = {'include': False}
+        res, (missings, errors) = \
+            self.root.compile_sequence(False, incremental=True)
+        assert_false(res)
+        assert_in('3_stop', missings)
+
+    def test_incremental_compilation3(self):
+        # Test an incremental compilation failing.
+        self.root.external_vars = {'a': 1.5}
+
+        pulse1 = Pulse(def_1='1.0', def_2='{a}')
+        self.root.items.extend([pulse1])
+
+        res, pulses = self.root.compile_sequence(False, incremental=True)
+        assert_true(res)
+
+        self.root.external_vars = {'a': 0.5}
+        res, (missings, errors) = self.root.compile_sequence(False,
+                                                             incremental=True)
+        assert_false(res)
+        assert_in('1_stop', errors)
+
+        self.root.external_vars = {'a': 2.5}
+        res, pulses = self.root.compile_sequence(False, incremental=True)
+        assert_true(res)
+        assert_equal(pulses[0].stop, 2.5)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# =============================================================================
+# module : test_benchmark_suite.py
+# author : Matthieu Dartiailh
+# license : MIT license
+# =============================================================================
+from nose.tools import assert_equal, assert_true
+
+from .benchmark_suite import (make_sequence, list_cases, case_name, run_case,
+                              compare_results, STRUCTURES)
+
+
+def test_synthetic_sequences():
+    # Test that all the synthetic sequences compile to the same length.
+    lengths = set()
+    for structure in STRUCTURES:
+        root = make_sequence(20, structure, 'AWG')
+        res, to_send = root.compile_sequence()
+        assert_true(res)
+        lengths.add(len(to_send[1]))
+
+    assert_equal(len(lengths), 1)
+
+
+def test_run_case():
+    # Test measuring a case in the current process.
+    case = list_cases(sizes=(10,), structures=('nested',),
+                      contexts=('AWG',))[1]
+    assert_equal(case_name(case), '10-nested-AWG-loop')
+
+    result = run_case(case, number=1, repeats=1)
+    assert_true(result['time'] > 0)
+    assert_equal(sorted(result['bytes']), ['1', '2'])
+
+
+def test_compare_results():
+    # Test detecting the regressions with respect to a baseline.
+    base = {'cases': {'a': {'time': 1.0, 'peak_memory': 100,
+                            'bytes': {'1': 10}},
+                      'b': {'time': 1.0, 'peak_memory': 100,
+                            'bytes': {'1': 10}}}}
+    new = {'cases': {'a': {'time': 1.2, 'peak_memory': 200,
+                           'bytes': {'1': 10}},
+                     'b': {'time': 2.0, 'peak_memory': 100,
+                           'bytes': {'1': 12}},
+                     'c': {'time': 1.0, 'peak_memory': 100,
+                           'bytes': {'1': 10}}}}
+
+    regressions = compare_results(new, base, time_tolerance=0.25,
+                                  memory_tolerance=0.5)
+    assert_equal(regressions, [('a', 'peak_memory', 100, 200),
+                               ('b', 'time', 1.0, 2.0),
+                               ('b', 'bytes', {'1': 10}, {'1': 12})])
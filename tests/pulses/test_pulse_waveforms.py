@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# =============================================================================
+# module : test_pulse_waveforms.py
+# author : Matthieu Dartiailh
+# license : MIT license
+# =============================================================================
+import numpy as np
+from nose.tools import assert_equal, assert_is
+from numpy.testing import assert_allclose
+
+from hqc_meas.pulses.contexts.awg_context import AWGContext
+from hqc_meas.pulses.base_sequences import RootSequence
+from hqc_meas.pulses.pulse import Pulse, compute_waveforms
+from hqc_meas.pulses.shapes.base_shapes import (AbstractShape, SquareShape,
+                                                GaussianShape)
+from hqc_meas.pulses.shapes.modulation import Modulation
+from hqc_meas.pulses.waveform_cache import WAVEFORM_CACHE
+
+
+class UncachedShape(SquareShape):
+    """ Shape opting out of the waveform cache.
+
+    """
+
+    def cache_key(self):
+        return None
+
+
+class RampShape(AbstractShape):
+    """ Shape relying on the default batch computation.
+
+    """
+
+    def compute(self, time, unit):
+        return (time - time[0])/(time[-1] - time[0] + 1)
+
+
+class TestComputeWaveforms(object):
+
+    def setup(self):
+        WAVEFORM_CACHE.clear()
+        self.root = RootSequence()
+        self.context = AWGContext()
+        self.root.context = self.context
+
+    def teardown(self):
+        WAVEFORM_CACHE.clear()
+
+    def test_batch_matches_single(self):
+        # Test that the batched computation gives the waveforms computed
+        # pulse by pulse.
+        shapes = [lambda: SquareShape(amplitude='0.5'),
+                  lambda: GaussianShape(amplitude='0.8', width='0.02'),
+                  lambda: RampShape(),
+                  lambda: UncachedShape(amplitude='0.3')]
+        mods = [lambda: Modulation(frequency='25', kind='sin',
+                                   activated=True),
+                lambda: Modulation(frequency='10', kind='cos', phase='90',
+                                   phase_unit='deg', activated=True),
+                lambda: Modulation()]
+        pulses = []
+        for i in range(24):
+            pulse = Pulse(kind='Analogical', channel='Ch1_A',
+                          def_1='{}'.format(0.2*i + 0.0137*i),
+                          def_2='{}'.format(0.05 + 0.01*(i % 5)),
+                          def_mode='Start/Duration',
+                          shape=shapes[i % 4](), modulation=mods[i % 3]())
+            pulses.append(pulse)
+        pulses.append(Pulse(channel='Ch1_M1', def_1='10', def_2='0.1',
+                            def_mode='Start/Duration'))
+        self.root.items = pulses
+
+        res, compiled = self.root.compile_sequence(False)
+        assert_equal(res, True)
+
+        waveforms = compute_waveforms(compiled, self.context)
+        for pulse, waveform in zip(compiled, waveforms):
+            n_points = self.context.len_sample(pulse.duration)
+            if pulse.kind == 'Logical':
+                assert_equal(waveform.dtype, np.int8)
+                assert_equal(len(waveform), n_points)
+                continue
+            time = np.linspace(pulse.start, pulse.stop, n_points, False)
+            expected = (pulse.modulation.compute(time, 'mus') *
+                        pulse.shape.compute(time, 'mus'))
+            assert_allclose(waveform, expected, atol=1e-12)
+
+    def test_batch_shares_identical_waveforms(self):
+        # Test that identical pulses of a batch share their waveform.
+        pulses = [Pulse(kind='Analogical', channel='Ch1_A',
+                        def_1='{}'.format(i), def_2='0.5',
+                        def_mode='Start/Duration',
+                        shape=SquareShape(amplitude='0.5'))
+                  for i in range(3)]
+        self.root.items = pulses
+
+        res, compiled = self.root.compile_sequence(False)
+        waveforms = compute_waveforms(compiled, self.context)
+        assert_is(waveforms[0], waveforms[2])
+        assert_equal(WAVEFORM_CACHE.stats()['entries'], 1)
+        assert_is(compiled[1].waveform, waveforms[0])
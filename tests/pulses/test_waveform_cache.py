@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# =============================================================================
+# module : test_waveform_cache.py
+# author : Matthieu Dartiailh
+# license : MIT license
+# =============================================================================
+import numpy as np
+from nose.tools import (assert_equal, assert_true, assert_false, assert_is,
+                        assert_is_not)
+from numpy.testing import assert_allclose
+
+from hqc_meas.pulses.contexts.awg_context import AWGContext
+from hqc_meas.pulses.base_sequences import RootSequence
+from hqc_meas.pulses.pulse import Pulse
+from hqc_meas.pulses.shapes.base_shapes import SquareShape
+from hqc_meas.pulses.shapes.modulation import Modulation
+from hqc_meas.pulses.waveform_cache import WAVEFORM_CACHE, _WaveformCache
+
+
+class UncachedShape(SquareShape):
+    """ Shape opting out of the waveform cache.
+
+    """
+
+    def cache_key(self):
+        return None
+
+
+def test_cache_budget():
+    # Test the eviction of the least recently used waveforms.
+    cache = _WaveformCache(max_bytes=3*80)
+    for i in range(3):
+        cache.get(i, lambda: np.zeros(10))
+    cache.get(0, lambda: np.ones(10))
+    cache.get(3, lambda: np.zeros(10))
+
+    stats = cache.stats()
+    assert_equal(stats['entries'], 3)
+    assert_equal(stats['nbytes'], 240)
+    assert_equal(stats['hits'], 1)
+    assert_equal(stats['misses'], 4)
+
+    # 1 was the least recently used entry.
+    cache.get(1, lambda: np.ones(10))
+    assert_equal(cache.stats()['misses'], 5)
+
+    # Too large arrays are never cached.
+    big = cache.get('big', lambda: np.zeros(100))
+    assert_equal(len(big), 100)
+    assert_equal(cache.stats()['nbytes'], 240)
+
+    cache.clear()
+    assert_equal(cache.stats(), {'hits': 0, 'misses': 0, 'entries': 0,
+                                 'nbytes': 0, 'max_bytes': 240})
+
+
+class TestPulseWaveformCache(object):
+
+    def setup(self):
+        WAVEFORM_CACHE.clear()
+        self.root = RootSequence()
+        self.root.context = AWGContext()
+
+    def teardown(self):
+        WAVEFORM_CACHE.clear()
+
+    def test_identical_pulses(self):
+        # Pulses differing only by their start share their waveform if the
+        # modulation has the same phase at their start.
+        def pulse(start):
+            mod = Modulation(frequency='2.5', kind='sin', activated=True)
+            return Pulse(kind='Analogical', def_1=start, def_2='0.5',
+                         def_mode='Start/Duration', channel='Ch1_A',
+                         shape=SquareShape(amplitude='0.5'), modulation=mod)
+
+        pulses = [pulse('0.0'), pulse('0.8'), pulse('0.9')]
+        self.root.items = pulses
+        res, compiled = self.root.compile_sequence(False)
+        assert_true(res)
+
+        waveforms = [p.waveform for p in compiled]
+        assert_is(waveforms[0], waveforms[1])
+        assert_is_not(waveforms[0], waveforms[2])
+        assert_false(waveforms[0].flags.writeable)
+
+        time = np.linspace(0.8, 1.3, 500, False)
+        assert_allclose(waveforms[1], 0.5*np.sin(2*np.pi*2.5*time),
+                        atol=1e-9)
+
+        stats = WAVEFORM_CACHE.stats()
+        assert_equal(stats['hits'], 1)
+        assert_equal(stats['misses'], 2)
+        assert_equal(stats['nbytes'], 2*500*8)
+
+    def test_uncached_shape(self):
+        # Shapes without cache key are always recomputed.
+        pulse = Pulse(kind='Analogical', def_1='0.0', def_2='0.5',
+                      channel='Ch1_A', shape=UncachedShape())
+        self.root.items = [pulse]
+        res, compiled = self.root.compile_sequence(False)
+        assert_true(res)
+
+        assert_is_not(pulse.waveform, pulse.waveform)
+        assert_equal(WAVEFORM_CACHE.stats()['misses'], 0)
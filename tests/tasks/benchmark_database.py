@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# =============================================================================
+# module : benchmark_database.py
+# author : Matthieu Dartiailh
+# license : MIT license
+# =============================================================================
+from threading import Thread
+from timeit import default_timer
+
+from hqc_meas.tasks.tools.task_database import TaskDatabase
+
+#: Number of writes performed by each thread.
+WRITES = 20000
+
+
+def writer(slot):
+    for i in xrange(WRITES):
+        slot.set(i)
+
+
+def throughput(lock_stripes, threads_number):
+    """ Measure the number of writes per second in running mode.
+
+    Each thread writes into its own entry, an observer is connected to the
+    notifier to mimic the presence of a spy.
+
+    """
+    database = TaskDatabase(lock_stripes=lock_stripes)
+    for i in range(threads_number):
+        database.set_value('root', 'val{}'.format(i), 0)
+    database.prepare_for_running()
+    database.observe('notifier', lambda change: change['value'][1] + 1)
+
+    threads = [Thread(target=writer,
+                      args=(database.get_slot('root', 'val{}'.format(i)),))
+               for i in range(threads_number)]
+    tic = default_timer()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return threads_number*WRITES/(default_timer() - tic)
+
+
+class BenchmarkDatabase(object):
+
+    def benchmark_global_lock(self):
+        for n in (1, 4, 16):
+            print 'Global lock, {} threads'.format(n), throughput(1, n)
+
+    def benchmark_striped_locks(self):
+        for n in (1, 4, 16):
+            print 'Striped locks, {} threads'.format(n), throughput(16, n)
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+# =============================================================================
+# module : test_transfer_pulse_loop_task.py
+# author : Matthieu Dartiailh
+# license : MIT license
+# =============================================================================
+"""
+"""
+from nose.tools import assert_equal, assert_true, raises
+from multiprocessing import Event, Process, Queue
+
+from hqc_meas.tasks.api import RootTask
+from hqc_meas.pulses.api import RootSequence, Pulse
+from hqc_meas.pulses.contexts.awg_context import AWGContext
+from hqc_meas.pulses.shapes.base_shapes import SquareShape
+from hqc_meas.tasks.tasks_instr import transfer_pulse_loop_task
+from hqc_meas.tasks.tasks_instr.transfer_pulse_loop_task\
+    import (TransferPulseLoopTask, AWGTransferLoopInterface, _prefetch)
+
+from .instr_helper import InstrHelper
+
+
+class TestAWGTransferLoopInterface(object):
+
+    def setup(self):
+        self.root = RootTask(should_stop=Event(), should_pause=Event())
+        self.task = TransferPulseLoopTask(task_name='Test')
+        self.root.children_task.append(self.task)
+        self.root.run_time['drivers'] = {'AWG5014B': InstrHelper}
+
+        self.sequence = RootSequence()
+        self.context = AWGContext()
+        self.sequence.context = self.context
+        self.sequence.time_constrained = True
+        self.sequence.sequence_duration = '10'
+        self.sequence.external_vars = {'a': None}
+        pulse1 = Pulse(kind='Analogical', shape=SquareShape(amplitude='0.5'),
+                       def_1='1.0', def_2='2.0', channel='Ch1_A')
+        pulse2 = Pulse(kind='Analogical', shape=SquareShape(amplitude='{a}'),
+                       def_1='5.0', def_2='6.0', channel='Ch1_A')
+        self.sequence.items.extend([pulse1, pulse2])
+
+        self.task.sequence = self.sequence
+        self.task.sequence_vars = {'a': 'var'}
+        self.task.loop_names = 'var'
+        self.task.loop_start = '0.1'
+        self.task.loop_stop = '0.5'
+        self.task.loop_points = '3'
+
+        interface = AWGTransferLoopInterface(task=self.task)
+        self.task.interface = interface
+
+        self.task.selected_driver = 'AWG5014B'
+        self.task.selected_profile = 'Test1'
+
+        self.sent = []
+        self.positions = {}
+        self.waits = []
+
+        def to_send(s, name, waveform, initialized, wait=True):
+            assert not wait
+            self.sent.append(name)
+
+        def wait_for_transfers(s):
+            self.waits.append(len(self.sent))
+
+        def set_sequence_pos(s, name, channel, position):
+            self.positions[position] = name
+
+        def get_ch(s, ch):
+            return InstrHelper(({'output_state': 'OFF'}, {}))
+
+        prof = ({'owner': [None], 'defined_channels': (1,),
+                 'run_mode': 'CONT'},
+                {'get_channel': get_ch, 'to_send': to_send,
+                 'wait_for_transfers': wait_for_transfers,
+                 'clear_sequence': lambda s: None,
+                 'set_sequence_pos': set_sequence_pos,
+                 'set_repeat': lambda s, p, r: None,
+                 'set_goto_pos': lambda s, p, g: None})
+        self.root.run_time['profiles'] = {'Test1': prof}
+
+    def test_perform(self):
+        # Test that identical segments are transferred only once.
+        self.task.perform()
+
+        segments = len(self.positions)//3
+        assert_equal(len(self.positions), 3*segments)
+        # Only the segment of the second pulse changes between loop points.
+        assert_true(len(self.sent) < segments + 3)
+        assert_equal(len(set(self.positions.values())), len(self.sent))
+        changed = [i for i in range(1, segments + 1)
+                   if self.positions[i] != self.positions[i + segments]]
+        assert_equal(len(changed), 1)
+
+        # The instrument is synchronised once after all the transfers.
+        assert_equal(self.waits, [len(self.sent)])
+        assert_equal(self.root.get_from_database('Test_transfer_progress'),
+                     1.0)
+
+    def test_perform_parallel(self):
+        # Test that compiling the points in a pool of processes gives the
+        # same transfers.
+        self.task.perform()
+        sent, positions = self.sent, self.positions.copy()
+
+        self.sent = []
+        self.positions.clear()
+        self.task.parallel_compilation = True
+        # Make sure the pool is used even on a single core machine.
+        old_count = transfer_pulse_loop_task.cpu_count
+        transfer_pulse_loop_task.cpu_count = lambda: 2
+        try:
+            self.task.perform()
+        finally:
+            transfer_pulse_loop_task.cpu_count = old_count
+
+        assert_equal(self.sent, sent)
+        assert_equal(self.positions, positions)
+
+    def test_perform_parallel_daemon(self):
+        # Test that the points are compiled sequentially in a daemonic process
+        # (as the measure process) which cannot start a pool of processes.
+        self.task.perform()
+        sent, positions = self.sent, self.positions.copy()
+
+        self.sent = []
+        self.positions.clear()
+        self.task.parallel_compilation = True
+        results = Queue()
+
+        def perform():
+            transfer_pulse_loop_task.cpu_count = lambda: 2
+            try:
+                self.task.perform()
+            except Exception as e:
+                results.put((repr(e), None, None))
+            else:
+                results.put((None, self.sent, self.positions))
+
+        process = Process(target=perform)
+        process.daemon = True
+        process.start()
+        try:
+            error, child_sent, child_positions = results.get(timeout=60)
+        finally:
+            process.join(10)
+
+        assert_equal(error, None)
+        assert_equal(child_sent, sent)
+        assert_equal(child_positions, positions)
+
+
+def test_prefetch():
+    # Test that the items are produced in order by the worker.
+    assert_equal(list(_prefetch(iter(range(10)), 2)), range(10))
+
+
+@raises(ValueError)
+def test_prefetch_error():
+    # Test that an error in the worker is raised in the consumer.
+    def failing():
+        yield 1
+        raise ValueError()
+
+    for _ in _prefetch(failing()):
+        pass
+
+
+def test_prefetch_close():
+    # Test that closing the consumer stops and closes the producer.
+    closed = []
+
+    def infinite():
+        try:
+            while True:
+                yield 1
+        finally:
+            closed.append(True)
+
+    results = _prefetch(infinite(), 2)
+    next(results)
+    results.close()
+    assert_equal(closed, [True])
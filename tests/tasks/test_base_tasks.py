@@ -243,3 +243,46 @@ def test_ex_access_handling7():
     assert_equal(task2.get_from_database('task4_val2'), 'r')
     task3.remove_access_exception('task4_val2')
     assert_not_in('task4_val2', task2.access_exs)
+
+
+def test_database_slots_binding():
+    # Test that the database slots are bound at check time in running mode.
+    root = RootTask()
+    task1 = ComplexTask(task_name='task1',
+                        task_database_entries={'val1': 1})
+    root.children_task.append(task1)
+    task2 = SimpleTask(task_name='task2',
+                       task_database_entries={'val2': 'r'})
+    task1.children_task.append(task2)
+
+    root.check()
+    assert_equal(task2._write_slots, {})
+
+    root.task_database.prepare_for_running()
+    root.check()
+    assert_equal(sorted(task1._write_slots), ['val1'])
+    assert_equal(sorted(task2._write_slots), ['val2'])
+
+    task2.write_in_database('val2', 's')
+    assert_equal(root.task_database.get_value('root/task1', 'task2_val2'), 's')
+    task1.write_in_database('val1', 2)
+    assert_equal(task2.get_from_database('task1_val1'), 2)
+    assert_equal(sorted(task2._read_slots), ['task1_val1'])
+    task1.write_in_database('val1', 3)
+    assert_equal(task2.get_from_database('task1_val1'), 3)
+    assert_equal(root.get_from_database('default_path'), '')
+
+
+def test_root_lock_stripes():
+    # Test that the number of database locks is saved and passed to the
+    # database.
+    root = RootTask(lock_stripes=4)
+    assert_equal(root.task_database.lock_stripes, 4)
+    root.register_preferences()
+    assert_equal(root.task_preferences['lock_stripes'], '4')
+
+    rebuilt = RootTask.build_from_config(dict(root.task_preferences),
+                                         {'tasks': {}})
+    assert_equal(rebuilt.task_database.lock_stripes, 4)
+    rebuilt.task_database.prepare_for_running()
+    assert_equal(len(rebuilt.task_database._locks), 4)
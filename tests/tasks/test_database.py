@@ -257,3 +257,61 @@ def test_get_set_on_flat_database3():
 
     assert_false(database.set_value('root/node1', 'val2', 2))
     assert_equal(database.get_value('root/node1', 'val2'), 2)
+
+
+def test_slots_on_flat_database():
+    # Test get/set operations through pre-resolved slots.
+    database = TaskDatabase()
+    database.set_value('root', 'val1', 1)
+    database.create_node('root', 'node1')
+    database.set_value('root/node1', 'val2', 'a')
+    database.add_access_exception('root', 'val2', 'root/node1')
+    assert_raises(RuntimeError, database.get_slot, 'root', 'val1')
+
+    database.prepare_for_running()
+    notifications = []
+    database.observe('notifier',
+                     lambda change: notifications.append(change['value']))
+
+    slot1 = database.get_slot('root/node1', 'val1')
+    assert_equal(slot1.path, 'root/val1')
+    assert_equal(slot1.get(), 1)
+    slot1.set(2)
+    assert_equal(database.get_value('root', 'val1'), 2)
+
+    slot2 = database.get_slot('root', 'val2')
+    assert_equal(slot2.path, 'root/node1/val2')
+    database.set_value('root/node1', 'val2', 'b')
+    assert_equal(slot2.get(), 'b')
+    slot2.set('c')
+    assert_equal(notifications[0], ('root/val1', 2))
+    assert_equal(notifications[-1], ('root/node1/val2', 'c'))
+
+    assert_raises(KeyError, database.get_slot, 'root', 'val3')
+
+
+def test_striped_locks_on_flat_database():
+    # Test get/set operations when using striped locks.
+    database = TaskDatabase(lock_stripes=4)
+    for i in range(10):
+        database.set_value('root', 'val{}'.format(i), i)
+    database.prepare_for_running()
+    assert_equal(len(database._locks), 4)
+
+    notifications = []
+
+    def observer(change):
+        # The lock protecting the entry must be released when notifying.
+        index = database._entry_index_map[change['value'][0]]
+        lock = database._get_lock(index)
+        assert_true(lock.acquire(False))
+        lock.release()
+        notifications.append(change['value'])
+
+    database.observe('notifier', observer)
+    assert_false(database.set_value('root', 'val1', 10))
+    assert_equal(database.get_value('root', 'val1'), 10)
+    slot = database.get_slot('root', 'val2')
+    slot.set(20)
+    assert_equal(slot.get(), 20)
+    assert_equal(notifications, [('root/val1', 10), ('root/val2', 20)])
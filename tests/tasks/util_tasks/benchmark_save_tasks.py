@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# =============================================================================
+# module : benchmark_save_tasks.py
+# author : Matthieu Dartiailh
+# license : MIT license
+# =============================================================================
+from multiprocessing import Event
+from timeit import default_timer
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from hqc_meas.tasks.api import RootTask
+from hqc_meas.tasks.tasks_util.save_tasks import SaveFileTask
+
+#: Number of points of the traces saved at each call.
+TRACE_SIZE = 10000
+
+#: Number of calls to perform.
+CALLS = 20
+
+
+def save(file_format, folder):
+    """ Measure the time needed to save traces and the size of the file.
+
+    """
+    root = RootTask(should_stop=Event(), should_pause=Event())
+    task = SaveFileTask(task_name='Test', folder=folder,
+                        filename='trace_' + file_format,
+                        file_format=file_format)
+    root.children_task.append(task)
+    root.write_in_database('float', 2.0)
+    root.write_in_database('array',
+                           np.rec.fromarrays([np.random.rand(TRACE_SIZE),
+                                              np.random.rand(TRACE_SIZE)],
+                                             names=['I', 'Q']))
+    task.saved_values = [('freq', '{Root_float}'), ('trace', '{Root_array}')]
+
+    tic = default_timer()
+    for i in range(CALLS):
+        task.perform()
+    task.file_object.close()
+    duration = default_timer() - tic
+
+    return duration, os.path.getsize(os.path.join(folder, task.filename))
+
+
+class BenchmarkSaveFileTask(object):
+
+    def setup(self):
+        self.folder = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.folder)
+
+    def benchmark_text_vs_binary(self):
+        for file_format in ('Text', 'Binary'):
+            duration, size = save(file_format, self.folder)
+            print '{} : {:.3f} s, {} bytes'.format(file_format, duration, size)
@@ -15,7 +15,8 @@ import numpy as np
 
 from hqc_meas.tasks.api import RootTask
 from hqc_meas.tasks.tasks_util.array_tasks import (ArrayExtremaTask,
-                                                   ArrayFindValueTask)
+                                                   ArrayFindValueTask,
+                                                   ArrayFitTask)
 
 import enaml
 with enaml.imports():
@@ -333,6 +334,91 @@ class TestArrayFindValueTask(object):
         assert_equal(self.task.get_from_database('Test_index'), 3)
 
 
+class TestArrayFitTask(object):
+
+    def setup(self):
+        self.root = RootTask(should_stop=Event(), should_pause=Event())
+        self.task = ArrayFitTask(task_name='Test')
+        self.root.children_task.append(self.task)
+        x = np.linspace(0, 1, 11)
+        self.root.write_in_database('x', x)
+        self.root.write_in_database('y', 2*x + 1)
+        self.root.write_in_database('offset', 1.0)
+        self.task.data_array = '{Root_y}'
+        self.task.variable_array = '{Root_x}'
+
+    def test_check1(self):
+        # Test that everything is ok with a valid expression and guess.
+        self.task.expression = 'param[0]*x + param[1]'
+        self.task.guess = '1, 0'
+
+        test, traceback = self.task.check()
+        assert_true(test)
+        assert_false(traceback)
+
+    def test_check2(self):
+        # Test handling a wrong number of guess.
+        self.task.expression = 'param[0]*x + param[1]'
+        self.task.guess = '1, 0, 2'
+
+        test, traceback = self.task.check()
+        assert_false(test)
+        assert_equal(len(traceback), 1)
+        assert_in('root/Test-value', traceback)
+
+    def test_check3(self):
+        # Test handling an expression which cannot be compiled.
+        self.task.expression = 'param[0]*x +'
+        self.task.jacobian = '[x, 1'
+
+        test, traceback = self.task.check()
+        assert_false(test)
+        assert_equal(len(traceback), 2)
+        assert_in('root/Test-expression', traceback)
+        assert_in('root/Test-jacobian', traceback)
+
+    def test_perform1(self):
+        # Test fitting using database entries and math functions.
+        self.task.expression = 'param[0]*log(exp(x)) + {Root_offset}'
+        self.root.task_database.prepare_for_running()
+        self.task.check()
+
+        self.task.perform()
+
+        fit = self.task.get_from_database('Test_fit')
+        assert_equal(len(fit), 1)
+        assert_true(np.allclose(fit, [2]))
+
+    def test_perform2(self):
+        # Test fitting with an analytical jacobian.
+        self.task.expression = 'param[0]*x + param[1]'
+        self.task.jacobian = '[x, 1]'
+        self.root.task_database.prepare_for_running()
+        self.task.check()
+
+        self.task.perform()
+
+        assert_true(np.allclose(self.task.get_from_database('Test_fit'),
+                                [2, 1]))
+
+    def test_perform3(self):
+        # Test reusing the previous result as guess.
+        self.task.expression = 'param[0]*x + param[1]'
+        self.task.reuse_result = True
+        self.root.task_database.prepare_for_running()
+        self.task.check()
+
+        self.task.perform()
+        assert_true(np.allclose(self.task._last_result, [2, 1]))
+        self.task.perform()
+        assert_true(np.allclose(self.task.get_from_database('Test_fit'),
+                                [2, 1]))
+
+        # A new check forget about the previous result.
+        self.task.check()
+        assert_equal(self.task._last_result, None)
+
+
 @attr('ui')
 class TestArrayFindValueView(object):
 
@@ -7,16 +7,23 @@
 """
 """
 from nose.tools import (assert_equal, assert_true, assert_false, assert_in,
-                        assert_is, assert_is_instance)
+                        assert_is, assert_is_not, assert_is_instance)
 from nose.plugins.attrib import attr
 from multiprocessing import Event
 from enaml.workbench.api import Workbench
 import numpy as np
+import h5py
 import os
 
 from hqc_meas.tasks.api import RootTask
 from hqc_meas.tasks.tasks_util.load_tasks import (LoadArrayTask,
-                                                  CSVLoadInterface)
+                                                  CSVLoadInterface,
+                                                  FastCSVLoadInterface,
+                                                  BinaryLoadInterface,
+                                                  NPYLoadInterface,
+                                                  HDF5LoadInterface)
+from hqc_meas.tasks.tools.binary_files import (DESCRIPTION_EXT,
+                                               write_description)
 
 import enaml
 with enaml.imports():
@@ -91,6 +98,240 @@ class TestLoadArrayTaskCSVInterface(object):
         np.testing.assert_array_equal(array, self.data)
 
 
+class TestLoadArrayTaskBinaryInterface(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.data = np.zeros((5,), dtype=[('Freq', 'f8'), ('Log', 'c16')])
+        cls.data['Freq'] = np.arange(5)
+        full_path = os.path.join(FOLDER_PATH, 'fake_bin.dat')
+        write_description(full_path, cls.data.dtype)
+        cls.data.tofile(full_path)
+
+    @classmethod
+    def teardown_class(cls):
+        full_path = os.path.join(FOLDER_PATH, 'fake_bin.dat')
+        for path in (full_path, full_path + DESCRIPTION_EXT):
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def setup(self):
+        self.root = RootTask(should_stop=Event(), should_pause=Event())
+        self.task = LoadArrayTask(task_name='Test')
+        self.task.interface = BinaryLoadInterface()
+        self.task.folder = FOLDER_PATH
+        self.task.filename = 'fake_bin.dat'
+        self.root.children_task.append(self.task)
+
+    def test_check1(self):
+        # Test the description is used to fill the database.
+        test, traceback = self.task.check()
+        assert_true(test)
+        assert_false(traceback)
+        array = self.task.get_from_database('Test_array')
+        assert_equal(array.dtype.names, ('Freq', 'Log'))
+        assert_equal(array.dtype['Log'], np.complex128)
+
+    def test_perform1(self):
+        # Test loading a binary file.
+        self.task.perform()
+        array = self.task.get_from_database('Test_array')
+        np.testing.assert_array_equal(array, self.data)
+
+
+class TestLoadArrayTaskFastCSVInterface(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.data = np.zeros((5,), dtype=[('Freq', 'f8'), ('Log', 'f8')])
+        cls.data['Freq'] = np.linspace(0, 1, 5)
+        full_path = os.path.join(FOLDER_PATH, 'fake_fast.dat')
+        with open(full_path, 'wb') as f:
+
+            f.write('# this is a comment \n')
+            f.write('\t'.join(cls.data.dtype.names) + '\n')
+
+            np.savetxt(f, cls.data, delimiter='\t')
+
+    @classmethod
+    def teardown_class(cls):
+        full_path = os.path.join(FOLDER_PATH, 'fake_fast.dat')
+        if os.path.isfile(full_path):
+            os.remove(full_path)
+
+    def setup(self):
+        self.root = RootTask(should_stop=Event(), should_pause=Event())
+        self.task = LoadArrayTask(task_name='Test')
+        self.task.interface = FastCSVLoadInterface()
+        self.task.folder = FOLDER_PATH
+        self.task.filename = 'fake_fast.dat'
+        self.root.children_task.append(self.task)
+
+    def test_perform1(self):
+        # Test loading a csv file.
+        self.task.perform()
+        array = self.task.get_from_database('Test_array')
+        np.testing.assert_array_equal(array, self.data)
+
+    def test_perform2(self):
+        # Test loading a csv file without names.
+        self.task.interface.names = False
+        self.task.interface.comments = 'F'
+        self.task.filename = 'fake_fast2.dat'
+        full_path = os.path.join(FOLDER_PATH, 'fake_fast2.dat')
+        with open(full_path, 'wb') as f:
+            np.savetxt(f, np.ones((3, 2)), delimiter=',')
+        self.task.interface.delimiter = ','
+        try:
+            self.task.perform()
+        finally:
+            os.remove(full_path)
+        array = self.task.get_from_database('Test_array')
+        np.testing.assert_array_equal(array, np.ones((3, 2)))
+
+    def test_perform3(self):
+        # Test falling back to genfromtxt when values are missing.
+        self.task.filename = 'fake_fast3.dat'
+        full_path = os.path.join(FOLDER_PATH, 'fake_fast3.dat')
+        with open(full_path, 'wb') as f:
+            f.write('a\tb\n1\t2\n3\t\n')
+        try:
+            self.task.perform()
+        finally:
+            os.remove(full_path)
+        array = self.task.get_from_database('Test_array')
+        assert_equal(array['a'][1], 3)
+        assert_true(np.isnan(array['b'][1]))
+
+    def test_cache(self):
+        # Test that the array is reused until the file is modified.
+        assert_false(self.task.use_cache)
+        self.task.use_cache = True
+        self.task.perform()
+        array = self.task.get_from_database('Test_array')
+        self.task.perform()
+        assert_is(self.task.get_from_database('Test_array'), array)
+        assert_false(array.flags.writeable)
+
+        full_path = os.path.join(FOLDER_PATH, 'fake_fast.dat')
+        with open(full_path, 'ab') as f:
+            np.savetxt(f, self.data[:1], delimiter='\t')
+        try:
+            self.task.perform()
+            new_array = self.task.get_from_database('Test_array')
+            assert_equal(len(new_array), 6)
+        finally:
+            self.setup_class()
+
+        self.task.use_cache = False
+        self.task.perform()
+        assert_true(self.task.get_from_database('Test_array').flags.writeable)
+
+    def test_cache_interface(self):
+        # Test that the interfaces do not share the cached arrays.
+        self.task.use_cache = True
+        self.task.perform()
+        array = self.task.get_from_database('Test_array')
+        self.task.interface = CSVLoadInterface()
+        self.task.perform()
+        other = self.task.get_from_database('Test_array')
+        assert_is_not(other, array)
+        np.testing.assert_array_equal(other, self.data)
+
+
+class TestLoadArrayTaskNPYInterface(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.data = np.arange(10.)
+        np.save(os.path.join(FOLDER_PATH, 'fake.npy'), cls.data)
+
+    @classmethod
+    def teardown_class(cls):
+        full_path = os.path.join(FOLDER_PATH, 'fake.npy')
+        if os.path.isfile(full_path):
+            os.remove(full_path)
+
+    def setup(self):
+        self.root = RootTask(should_stop=Event(), should_pause=Event())
+        self.task = LoadArrayTask(task_name='Test')
+        self.task.interface = NPYLoadInterface()
+        self.task.folder = FOLDER_PATH
+        self.task.filename = 'fake.npy'
+        self.root.children_task.append(self.task)
+
+    def test_check1(self):
+        # Test the dtype of the array is used to fill the database.
+        test, traceback = self.task.check()
+        assert_true(test)
+        assert_false(traceback)
+        array = self.task.get_from_database('Test_array')
+        assert_equal(array.dtype, np.float64)
+
+    def test_perform1(self):
+        # Test memory mapping a npy file.
+        self.task.use_cache = False
+        self.task.perform()
+        array = self.task.get_from_database('Test_array')
+        assert_is_instance(array, np.memmap)
+        np.testing.assert_array_equal(array, self.data)
+
+
+class TestLoadArrayTaskHDF5Interface(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.data = np.arange(20.).reshape((4, 5))
+        with h5py.File(os.path.join(FOLDER_PATH, 'fake.h5'), 'w') as f:
+            f.create_dataset('data', data=cls.data)
+
+    @classmethod
+    def teardown_class(cls):
+        full_path = os.path.join(FOLDER_PATH, 'fake.h5')
+        if os.path.isfile(full_path):
+            os.remove(full_path)
+
+    def setup(self):
+        self.root = RootTask(should_stop=Event(), should_pause=Event())
+        self.task = LoadArrayTask(task_name='Test')
+        self.task.interface = HDF5LoadInterface(dataset='data')
+        self.task.folder = FOLDER_PATH
+        self.task.filename = 'fake.h5'
+        self.root.children_task.append(self.task)
+        self.root.write_in_database('index', 2)
+
+    def test_check1(self):
+        # Test everything is ok if the dataset exists.
+        self.task.interface.selection = '{Root_index}, 1:'
+        test, traceback = self.task.check()
+        assert_true(test)
+        assert_false(traceback)
+
+    def test_check2(self):
+        # Test handling a missing dataset and a wrong selection.
+        self.task.interface.dataset = 'dummy'
+        test, traceback = self.task.check()
+        assert_false(test)
+        assert_in('root/Test-dataset', traceback)
+
+        self.task.interface.selection = '{Root_index}, :+'
+        test, traceback = self.task.check()
+        assert_false(test)
+        assert_in('root/Test-selection', traceback)
+
+    def test_perform1(self):
+        # Test loading a slice of the dataset.
+        self.task.interface.selection = '{Root_index}, 1:'
+        self.task.perform()
+        array = self.task.get_from_database('Test_array')
+        np.testing.assert_array_equal(array, self.data[2, 1:])
+
+        self.task.interface.selection = ''
+        self.task.perform()
+        array = self.task.get_from_database('Test_array')
+        np.testing.assert_array_equal(array, self.data)
+
+
 @attr('ui')
 class TestLoadArrayView(object):
 
@@ -10,14 +10,19 @@ from nose.tools import (assert_equal, assert_true, assert_false, assert_in,
                         assert_not_in, assert_raises)
 from nose.plugins.attrib import attr
 from multiprocessing import Event
+import threading
 from enaml.workbench.api import Workbench
 import os
 import shutil
 import numpy as np
+import h5py
 
 from hqc_meas.tasks.api import RootTask
 from hqc_meas.tasks.tasks_util.save_tasks import (SaveTask, SaveArrayTask,
-                                                  SaveFileTask)
+                                                  SaveFileTask,
+                                                  SaveFileHDF5Task,
+                                                  _BackgroundFileWriter)
+from hqc_meas.tasks.tools.binary_files import read_description, load_binary
 
 import enaml
 with enaml.imports():
@@ -346,6 +351,27 @@ class TestSaveTask(object):
         np.testing.assert_array_equal(task.array, array)
 
 
+    def test_perform3(self):
+        # Test performing in mode file with background writing, the file
+        # being closed by the root task.
+        task = self.task
+        task.saving_target = 'File'
+        task.folder = self.test_dir
+        task.filename = 'test_perform_bg.txt'
+        task.header = 'test {Root_str}'
+        task.background_writing = True
+        task.saved_values = [('toto', '{Root_str}'), ('tata', '{Root_float}')]
+        file_path = os.path.join(self.test_dir, 'test_perform_bg.txt')
+
+        task.perform()
+        self.root.perform()
+
+        assert_true(task.file_object.closed)
+        with open(file_path) as f:
+            a = f.readlines()
+            assert_equal(a, ['# test a\n', 'toto\ttata\n',
+                             'a\t2.0\n', 'a\t2.0\n'])
+
 class TestSaveFileTask(object):
 
     test_dir = TEST_PATH + '2'
@@ -551,6 +577,236 @@ class TestSaveFileTask(object):
             task.file_object.close()
 
 
+    def test_perform3(self):
+        # Test performing with background writing. (Call twice perform)
+        task = self.task
+        task.folder = self.test_dir
+        task.filename = 'test_perform_bg.txt'
+        task.background_writing = True
+        task.saved_values = [('toto', '{Root_float}'),
+                             ('tata', '{Root_array}')]
+        file_path = os.path.join(self.test_dir, 'test_perform_bg.txt')
+
+        try:
+            task.perform()
+            task.perform()
+        finally:
+            task.file_object.close()
+
+        with open(file_path) as f:
+            a = f.readlines()
+        assert_equal(a[0], 'toto\ttata\n')
+        assert_equal(len(a), 21)
+        for i in range(10):
+            assert_equal(float(a[11+i].split('\t')[0]), 2.0)
+            assert_equal(float(a[11+i].split('\t')[1]), float(i))
+
+    def test_perform4(self):
+        # Test performing in binary mode with a rec array. (Call twice perform)
+        self.root.write_in_database('array',
+                                    np.rec.fromarrays([range(10), range(10)],
+                                                      names=['a', 'b']))
+        task = self.task
+        task.folder = self.test_dir
+        task.filename = 'test_perform_rec.dat'
+        task.header = 'test'
+        task.file_format = 'Binary'
+        task.saved_values = [('toto', '{Root_float}'),
+                             ('tata', '{Root_array}')]
+        file_path = os.path.join(self.test_dir, 'test_perform_rec.dat')
+
+        try:
+            task.perform()
+            task.perform()
+        finally:
+            task.file_object.close()
+
+        dtype, header = read_description(file_path)
+        assert_equal(header, 'test')
+        assert_equal(dtype.names, ('toto', 'tata_a', 'tata_b'))
+        data = load_binary(file_path)
+        assert_equal(data.shape, (20,))
+        np.testing.assert_array_equal(data['toto'], 2.0*np.ones(20))
+        np.testing.assert_array_equal(data['tata_b'][10:], np.arange(10))
+
+    def test_background_writer_error(self):
+        # Test that an error in the writer thread is reported.
+        task = self.task
+        task.folder = self.test_dir
+        task.filename = 'test_bg_error.txt'
+        task.background_writing = True
+        task.saved_values = [('toto', '{Root_float}')]
+
+        task.perform()
+        writer = task.file_object
+        writer.write_array(None)
+        assert_raises(IOError, writer.close)
+
+    def test_background_writer_unicode_path(self):
+        # Test writing in the background to a file with a non-ascii name.
+        task = self.task
+        task.folder = self.test_dir
+        task.filename = u'test_bg_\xe9t\xe9.txt'
+        task.background_writing = True
+        task.saved_values = [('toto', '{Root_float}')]
+
+        task.perform()
+        writer = task.file_object
+        writer.write_array(None)
+        assert_raises(IOError, writer.close)
+        file_path = os.path.join(self.test_dir, u'test_bg_\xe9t\xe9.txt')
+        with open(file_path) as f:
+            assert_equal(f.readline(), 'toto\n')
+
+    def test_background_writer_snapshot(self):
+        # Test that values modified after being queued are written unaltered.
+        file_path = os.path.join(self.test_dir, 'test_bg_snapshot.txt')
+        writer = _BackgroundFileWriter(open(file_path, 'w'))
+        # Block the writer thread until all the values are queued.
+        release = threading.Event()
+        writer._put((lambda _: release.wait(), None))
+        values = np.zeros(3)
+        writer.write_row([values[0], values])
+        writer.write_array(values)
+        values[:] = 1
+        release.set()
+        writer.close()
+
+        with open(file_path) as f:
+            a = f.readlines()
+        assert_equal(a[0], '0.0\t{}\n'.format(np.zeros(3)))
+        assert_equal([float(v) for v in a[1:]], [0., 0., 0.])
+
+class TestSaveFileHDF5Task(object):
+
+    test_dir = TEST_PATH + '3'
+
+    @classmethod
+    def setup_class(cls):
+        print complete_line(__name__ +
+                            ':{}.setup_class()'.format(cls.__name__), '-', 77)
+        os.mkdir(cls.test_dir)
+
+    @classmethod
+    def teardown_class(cls):
+        print complete_line(__name__ +
+                            ':{}.teardown_class()'.format(cls.__name__), '-',
+                            77)
+        # Removing pref files creating during tests.
+        try:
+            shutil.rmtree(cls.test_dir)
+
+        # Hack for win32.
+        except OSError:
+            print 'OSError'
+            dirs = os.listdir(cls.test_dir)
+            for directory in dirs:
+                shutil.rmtree(os.path.join(cls.test_dir), directory)
+            shutil.rmtree(cls.test_dir)
+
+    def setup(self):
+        self.root = RootTask(should_stop=Event(), should_pause=Event())
+        self.task = SaveFileHDF5Task(task_name='Test')
+        self.root.children_task.append(self.task)
+
+        self.root.write_in_database('int', 1)
+        self.root.write_in_database('float', 2.0)
+        self.root.write_in_database('complex', 1.0 + 2.0j)
+        self.root.write_in_database('array',
+                                    np.rec.fromarrays([range(10), range(10)],
+                                                      names=['a', 'b']))
+
+    def teardown(self):
+        folder = self.test_dir
+        for the_file in os.listdir(folder):
+            file_path = os.path.join(folder, the_file)
+            if os.path.isfile(file_path):
+                os.remove(file_path)
+
+    def test_perform1(self):
+        # Test buffering the data and writing them when closing.
+        task = self.task
+        task.folder = self.test_dir
+        task.filename = 'test_perform{Root_int}.h5'
+        task.header = 'test {Root_int}'
+        task.callsEstimation = '5'
+        task.flush_period = 1000.0
+        task.saved_values = [('toto', '{Root_float}'),
+                             ('tata', '{Root_array}')]
+        file_path = os.path.join(self.test_dir, 'test_perform1.h5')
+
+        for i in range(7):
+            self.root.write_in_database('float', float(i))
+            task.perform()
+
+        assert_true(task.initialized)
+        # The rows are still in memory.
+        assert_equal(task.file_object.file.attrs['countCalls'], 0)
+        assert_equal(task.file_object.file['toto'].chunks, (32768,))
+        task.file_object.close()
+
+        with h5py.File(file_path, 'r') as f:
+            assert_equal(f.attrs['header'], 'test 1')
+            assert_equal(f.attrs['countCalls'], 7)
+            assert_equal(f['toto'].shape, (7,))
+            np.testing.assert_array_equal(f['toto'][:], np.arange(7))
+            assert_equal(f['tata_a'].shape, (7, 10))
+            np.testing.assert_array_equal(f['tata_b'][6], np.arange(10))
+
+    def test_perform2(self):
+        # Test writing every call immediately and saving complex values.
+        task = self.task
+        task.folder = self.test_dir
+        task.filename = 'test_perform2.h5'
+        task.datatype = 'auto'
+        task.flush_period = 0.0
+        task.saved_values = [('toto', '{Root_complex}'),
+                             ('tata', '{Root_int}')]
+        file_path = os.path.join(self.test_dir, 'test_perform2.h5')
+
+        try:
+            task.perform()
+            task.perform()
+            f = task.file_object.file
+            assert_equal(f.attrs['countCalls'], 2)
+            # The chunks do not depend on the (default) estimation.
+            assert_equal(f['toto'].chunks, (4096,))
+            assert_equal(f['toto'][1], 1.0 + 2.0j)
+            assert_equal(f['tata'].dtype, np.float64)
+        finally:
+            task.file_object.close()
+
+        with h5py.File(file_path, 'r') as f:
+            assert_equal(f['toto'].dtype, np.complex128)
+            assert_equal(f['toto'].shape, (2,))
+
+    def test_perform2bis(self):
+        # Test that float values following an integer one are not truncated
+        # when the type is inferred.
+        task = self.task
+        task.folder = self.test_dir
+        task.filename = 'test_perform2bis.h5'
+        task.datatype = 'auto'
+        task.saved_values = [('toto', '{Root_int}'),
+                             ('tata', '{Root_array}')]
+        self.root.write_in_database('int', 0)
+        self.root.write_in_database('array', np.arange(10))
+        file_path = os.path.join(self.test_dir, 'test_perform2bis.h5')
+
+        try:
+            task.perform()
+            self.root.write_in_database('int', 0.5)
+            self.root.write_in_database('array', np.linspace(0, 1, 10))
+            task.perform()
+        finally:
+            task.file_object.close()
+
+        with h5py.File(file_path, 'r') as f:
+            np.testing.assert_array_equal(f['toto'][:], [0., 0.5])
+            np.testing.assert_array_equal(f['tata'][1],
+                                          np.linspace(0, 1, 10))
+
+
 class TestSaveArrayTask(object):
 
     test_dir = TEST_PATH
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+#==============================================================================
+# module : test_eval_cache.py
+# author : Matthieu Dartiailh
+# license : MIT license
+#==============================================================================
+"""
+"""
+from nose.tools import assert_equal, assert_is, assert_raises
+from hqc_meas.utils.eval_cache import CompiledExpressionCache, EXPRESSION_CACHE
+from hqc_meas.tasks.tools.string_evaluation import safe_eval
+from hqc_meas.pulses.entry_eval import eval_entry
+
+from ..util import complete_line
+
+
+def setup_module():
+    print complete_line(__name__ + ': setup_module()', '~', 78)
+
+
+def teardown_module():
+    print complete_line(__name__ + ': teardown_module()', '~', 78)
+
+
+def test_cache_hit_miss():
+    cache = CompiledExpressionCache()
+    code = cache.compile('1 + 2')
+    assert_is(cache.compile('1 + 2'), code)
+    assert_equal(eval(code), 3)
+    stats = cache.stats()
+    assert_equal(stats['hits'], 1)
+    assert_equal(stats['misses'], 1)
+    assert_equal(stats['hit_rate'], 0.5)
+    assert_equal(stats['size'], 1)
+
+
+def test_cache_lru_eviction():
+    cache = CompiledExpressionCache(maxsize=2)
+    cache.compile('1')
+    cache.compile('2')
+    # Mark '1' as recently used so that '2' is the one evicted.
+    cache.compile('1')
+    cache.compile('3')
+    assert_equal(cache.stats()['size'], 2)
+    cache.compile('1')
+    assert_equal(cache.stats()['hits'], 2)
+    cache.compile('2')
+    assert_equal(cache.stats()['misses'], 4)
+
+
+def test_cache_syntax_error():
+    cache = CompiledExpressionCache()
+    assert_raises(SyntaxError, cache.compile, '1 +')
+    assert_equal(cache.stats()['size'], 0)
+
+
+def test_cache_clear():
+    cache = CompiledExpressionCache()
+    cache.compile('1')
+    cache.clear()
+    assert_equal(cache.stats(), {'hits': 0, 'misses': 0, 'hit_rate': 0.0,
+                                 'size': 0, 'maxsize': cache.maxsize})
+
+
+def test_safe_eval_use_cache():
+    EXPRESSION_CACHE.clear()
+    for i in range(3):
+        assert_equal(safe_eval('_a1 + 2*_a2', {'_a1': i, '_a2': 1}), i + 2)
+    assert_equal(EXPRESSION_CACHE.stats()['hits'], 2)
+
+
+def test_eval_entry_use_cache():
+    EXPRESSION_CACHE.clear()
+    for i in range(3):
+        assert_equal(eval_entry('{a} + 1', {'a': i}, set()), i + 1)
+    assert_equal(EXPRESSION_CACHE.stats()['hits'], 2)